@@ -0,0 +1,118 @@
+"""Memory and accuracy of 8-bit weights (``--value-codec u8``) against float32.
+
+Quantizes a copy of the current store's float32 index.bin and reports the
+index size, the bytes taken by the weights, the per-record memory of weights
+held as Python floats vs ``array("f")``, and how far TF-IDF scores and top-k
+results move over queries sampled from the corpus.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from src.index_format import IndexFile
+from src.quantize import quantize_index
+from src.vector_store import VectorStore, load_default_store
+from src.vocab import vectorizer_file
+
+
+def _build_copy(src_dir: str, dst_dir: str, quantize: bool) -> VectorStore:
+    os.makedirs(dst_dir)
+    for name in (os.path.basename(vectorizer_file(src_dir)), "texts.bin", "index.bin"):
+        src = os.path.join(src_dir, name)
+        if quantize and name == "index.bin":
+            shutil.copyfile(src, os.path.join(dst_dir, name))
+        else:
+            os.symlink(os.path.abspath(src), os.path.join(dst_dir, name))
+    if quantize:
+        quantize_index(os.path.join(dst_dir, "index.bin"))
+    store = VectorStore(dst_dir)
+    store.load(dst_dir)
+    return store
+
+
+def _weight_bytes(path: str) -> int:
+    index = IndexFile(path)
+    return sum(index.section(name).nbytes for name in ("values", "post_vals", "scales") if name in index)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--queries", type=int, default=200, help="Queries sampled from chunk texts")
+    p.add_argument("--k", type=int, default=10, help="Top-k compared per query")
+    p.add_argument("--words", type=int, default=8, help="Words per sampled query")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+
+    store = load_default_store()
+    if store._index is None or not store.is_ready():
+        sys.exit("Vector store not ready (a binary index is required). Run `make ingest` first.")
+    if store.value_codec != "f32":
+        sys.exit("The current index is already quantized; rebuild it with `--full --value-codec f32`.")
+
+    scratch = tempfile.mkdtemp(prefix="bench-values-")
+    try:
+        f32 = _build_copy(store.dir, os.path.join(scratch, "f32"), quantize=False)
+        u8 = _build_copy(store.dir, os.path.join(scratch, "u8"), quantize=True)
+        n_rows = len(f32)
+
+        print(f"Rows: {n_rows}; postings: {len(f32._postings.docs)}")
+        print("Bytes            f32          u8")
+        for label, size in (("index.bin", os.path.getsize), ("weights", _weight_bytes)):
+            before, after = size(f32.binary_index_path), size(u8.binary_index_path)
+            print(f"{label:<10} {before:>10,d}  {after:>10,d}  ({after / (before or 1):.0%})")
+
+        sample = range(min(n_rows, 1000))
+        as_floats = sum(
+            sys.getsizeof(vals) + len(vals) * sys.getsizeof(0.0)
+            for vals in (f32.record(i).values.tolist() for i in sample)
+        )
+        as_array = sum(sys.getsizeof(f32.record(i).values) for i in sample)
+        print(
+            f"Record weights (first {len(sample)} rows): list[float] {as_floats:,d} B, "
+            f"array('f') {as_array:,d} B ({as_array / (as_floats or 1):.0%})"
+        )
+
+        rng = random.Random(args.seed)
+        queries = []
+        for _ in range(args.queries):
+            words = f32.text(rng.randrange(n_rows)).split()
+            start = rng.randrange(max(1, len(words) - args.words))
+            terms = f32._query_terms(" ".join(words[start:start + args.words]))
+            queries.append(f32.vectorizer.vectorize_term_ids(terms))
+
+        max_err = total_err = 0.0
+        n_scores = overlap = 0
+        for query in queries:
+            ref = {doc: s for s, doc in f32._top_k("tfidf", query, n_rows)}
+            got = {doc: s for s, doc in u8._top_k("tfidf", query, n_rows)}
+            for doc, s in ref.items():
+                err = abs(got.get(doc, 0.0) - s)
+                max_err = max(max_err, err)
+                total_err += err
+                n_scores += 1
+            top_ref = {doc for _, doc in f32._top_k("tfidf", query, args.k)}
+            top_got = {doc for _, doc in u8._top_k("tfidf", query, args.k)}
+            overlap += len(top_ref & top_got) / len(top_ref) if top_ref else 1
+        print(
+            f"TF-IDF score error over {n_scores:,d} (query, chunk) pairs: "
+            f"max {max_err:.5f}, mean {total_err / (n_scores or 1):.6f}"
+        )
+        print(f"Top-{args.k} overlap: {overlap / (len(queries) or 1):.1%} over {len(queries)} queries")
+
+        for label, s in (("f32", f32), ("u8", u8)):
+            t0 = time.perf_counter()
+            for query in queries:
+                s._top_k("tfidf", query, args.k)
+            elapsed = time.perf_counter() - t0
+            print(f"Latency {label:<3}: {elapsed / (len(queries) or 1) * 1000:.2f} ms/query")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
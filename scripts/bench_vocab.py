@@ -0,0 +1,79 @@
+"""Load time, memory and lookup speed of vocab.bin against the legacy vectorizer.json.
+
+Writes a synthetic vocabulary of ``--terms`` terms in both formats to a
+scratch directory, then loads each one and looks up a sample of terms (half of
+them unknown), once on the fresh load and again with the same terms, as
+repeated query terms would be.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from src.tfidf import TfidfVectorizer
+
+
+def _load(path: str):
+    """(vectorizer, load seconds, peak bytes allocated by a second load)."""
+    t0 = time.perf_counter()
+    vec = TfidfVectorizer.load(path)
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    TfidfVectorizer.load(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return vec, elapsed, peak
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--terms", type=int, default=500_000, help="Vocabulary size")
+    p.add_argument("--lookups", type=int, default=100_000, help="Term lookups timed per format")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+
+    rng = random.Random(args.seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789"
+    terms = set()
+    while len(terms) < args.terms:
+        terms.add("".join(rng.choice(alphabet) for _ in range(rng.randint(3, 12))))
+    df = {t: rng.randint(1, 1000) for t in terms}
+    vec = TfidfVectorizer.from_document_frequencies(df, 100_000)
+    vocab = list(vec.vocabulary_)
+    probes = [rng.choice(vocab) if i % 2 else rng.choice(vocab) + "#" for i in range(args.lookups)]
+
+    scratch = tempfile.mkdtemp(prefix="bench-vocab-")
+    try:
+        legacy = os.path.join(scratch, "vectorizer.json")
+        with open(legacy, "w", encoding="utf-8") as f:
+            json.dump({"vocabulary": vocab, "idf": list(vec.idf_), "df": list(vec.df_),
+                       "n_docs": vec.n_docs_}, f)
+        binary = os.path.join(scratch, "vocab.bin")
+        vec.save(binary)
+
+        print(f"Terms: {len(vocab):,d}")
+        print("Format            size      load     peak mem   lookup   repeat")
+        for label, path in (("vectorizer.json", legacy), ("vocab.bin", binary)):
+            loaded, elapsed, peak = _load(path)
+            get = loaded.vocab_index.get
+            timings = []
+            for _ in range(2):
+                t0 = time.perf_counter()
+                found = sum(get(term) is not None for term in probes)
+                timings.append((time.perf_counter() - t0) / len(probes))
+            print(
+                f"{label:<16} {os.path.getsize(path) / 1e6:>6.1f} MB {elapsed * 1000:>7.1f} ms "
+                f"{peak / 1e6:>7.1f} MB {timings[0] * 1e6:>6.2f} us {timings[1] * 1e6:>6.2f} us"
+                f"  ({found:,d} found)"
+            )
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
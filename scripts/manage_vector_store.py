@@ -1,75 +1,145 @@
 import argparse
 import os
 import shlex
+import shutil
+import subprocess
 import sys
-from typing import List, Optional
+from typing import Iterable, Optional, Tuple
 
-from src.vector_store import load_default_store, VectorRecord
+from src.doc_table import DocCatalog
+from src.generations import current_dir, current_name, generations_root, list_generations
+from src.generations import rollback as rollback_generation
+from src.store_manager import StoreManager
+from src.vector_store import VectorStore, read_meta
+from src.vocab import vectorizer_file
 
 
 PROMPT = "vector-store> "
 
 
-def print_status():
-    root = os.path.join("data", "vector_store")
-    vectorizer = os.path.join(root, "vectorizer.json")
-    index = os.path.join(root, "index.jsonl")
-    meta = os.path.join(root, "meta.json")
+class Session:
+    """What the commands of one manager run (REPL, script or --cmd) share.
+
+    The store is loaded on first use and kept in memory. Before every command
+    a StoreManager compares ``CURRENT`` and the artifact stamps, so the store
+    is only reloaded once a new build is published (by a command here or by
+    another process). Until something needs the store, document commands read
+    the doc table (docs.json) alone, and keep it until the build or its
+    deletes change.
+    """
+
+    def __init__(self, root: str = os.path.join("data", "vector_store"), interactive: bool = True):
+        self.root = root
+        self.interactive = interactive
+        self._manager = StoreManager(root, check_interval=0.0)
+        self._loaded = False
+        self._catalog: Optional[DocCatalog] = None
+        self._catalog_key: Optional[Tuple] = None
+
+    def store(self) -> VectorStore:
+        self._loaded = True
+        return self._manager.get()
+
+    def _docs_key(self) -> Tuple:
+        try:
+            st = os.stat(os.path.join(current_dir(self.root), "deletes.log"))
+            deletes = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            deletes = None
+        return (current_name(self.root), deletes)
+
+    def docs(self) -> Optional[DocCatalog]:
+        """The document table of the current build, or None if nothing is ingested."""
+        if not self._loaded:
+            key = self._docs_key()
+            if self._catalog is None or key != self._catalog_key:
+                self._catalog = DocCatalog.open(current_dir(self.root))
+                self._catalog_key = key
+            if self._catalog is not None:
+                return self._catalog
+        # Loaded already, or built before docs.json existed
+        store = self.store()
+        return store.docs() if store.is_ready() else None
+
+    def deleted(self) -> None:
+        """Note deletes made through :meth:`docs`, which the loaded table and store already hold."""
+        if self._loaded:
+            self._manager.mark_current()
+        self._catalog_key = self._docs_key()
+
+
+def print_status(session: Session):
+    root = session.root
+    build_dir = current_dir(root)
+    vectorizer = vectorizer_file(build_dir)
+    index = os.path.join(build_dir, "index.bin")
+    legacy_index = os.path.join(build_dir, "index.jsonl")
+    meta = os.path.join(build_dir, "meta.json")
     print(f"Root: {root}")
-    print(f" - vectorizer.json: {'ok' if os.path.exists(vectorizer) else 'missing'}")
-    print(f" - index.jsonl:     {'ok' if os.path.exists(index) else 'missing'}")
+    print(f"Generation: {current_name(root) or '(flat layout)'}")
+    print(f" - {os.path.basename(vectorizer) + ':':<16} {'ok' if os.path.exists(vectorizer) else 'missing'}")
+    print(f" - index.bin:       {'ok' if os.path.exists(index) else 'missing'}")
+    if os.path.exists(legacy_index):
+        print(" - index.jsonl:     ok (legacy; re-save or ingest to convert)")
     print(f" - meta.json:       {'ok' if os.path.exists(meta) else 'missing'}")
 
-    store = load_default_store()
+    store = session.store()
     if not store.is_ready():
         print("Status: not ready (ingest required)")
         return
     print("Status: ready")
-    print(f"Records: {len(store.records)}")
-    by_doc = {}
-    for r in store.records:
-        by_doc[r.path] = by_doc.get(r.path, 0) + 1
+    by_doc = store.docs().docs()
+    print(f"Records: {sum(doc['chunks'] for doc in by_doc.values())}")
     print(f"Documents: {len(by_doc)}")
-
-
-def list_docs(limit: Optional[int] = None):
-    store = load_default_store()
-    if not store.is_ready():
+    print(f"Values: {store.value_codec}")
+    vocab = read_meta(build_dir).get("vocabulary") or {}
+    line = f"Vocabulary: {len(store.vectorizer.vocabulary_)} terms"
+    if vocab.get("terms_before", 0) > vocab.get("terms_after", 0):
+        dropped = ", ".join(f"{n} {why}" for why, n in vocab.get("dropped", {}).items() if n)
+        line += f" (pruned from {vocab['terms_before']}: {dropped})"
+    print(line)
+    if store.n_segments:
+        print(f"Segments: {store.n_segments}")
+    if store.n_deleted:
+        print(f"Deleted (pending compact): {store.n_deleted}")
+
+
+def list_docs(session: Session, limit: Optional[int] = None):
+    catalog = session.docs()
+    if catalog is None:
         print("Vector store not ready. Run 'ingest' first.")
         return
-    counts = {}
-    for r in store.records:
-        counts[r.path] = counts.get(r.path, 0) + 1
+    counts = {path: doc["chunks"] for path, doc in catalog.docs().items()}
     items = sorted(counts.items(), key=lambda x: (-x[1], x[0]))
     if limit is not None:
         items = items[:limit]
     for path, cnt in items:
         print(f"{cnt:5d}  {path}")
-    print(f"Total documents: {len(counts)}; total chunks: {len(store.records)}")
+    print(f"Total documents: {len(counts)}; total chunks: {sum(counts.values())}")
 
 
-def list_chunks(path: str, limit: Optional[int] = None):
-    store = load_default_store()
-    if not store.is_ready():
+def list_chunks(session: Session, path: str, limit: Optional[int] = None):
+    catalog = session.docs()
+    if catalog is None:
         print("Vector store not ready. Run 'ingest' first.")
         return
-    chunks: List[VectorRecord] = [r for r in store.records if r.path == path]
+    chunks = catalog.chunks(path)
     if not chunks:
         print(f"No chunks for path: {path}")
         return
-    chunks.sort(key=lambda r: r.chunk_id)
+    total = len(chunks)
     if limit is not None:
         chunks = chunks[:limit]
-    for r in chunks:
-        snippet = r.text.strip().replace("\n", " ")
+    for chunk_id, row in chunks:
+        snippet = catalog.text(row).strip().replace("\n", " ")
         if len(snippet) > 120:
             snippet = snippet[:120] + "…"
-        print(f"chunk={r.chunk_id:4d}  {snippet}")
-    print(f"Total chunks for {path}: {len([x for x in store.records if x.path == path])}")
+        print(f"chunk={chunk_id:4d}  {snippet}")
+    print(f"Total chunks for {path}: {total}")
 
 
-def search(query: str, k: int = 5):
-    store = load_default_store()
+def search(session: Session, query: str, k: int = 5):
+    store = session.store()
     if not store.is_ready():
         print("Vector store not ready. Run 'ingest' first.")
         return
@@ -82,51 +152,82 @@ def search(query: str, k: int = 5):
         print(f"     {snippet}")
 
 
-def show(path: str, chunk_id: int):
-    store = load_default_store()
-    if not store.is_ready():
+def show(session: Session, path: str, chunk_id: int):
+    catalog = session.docs()
+    if catalog is None:
         print("Vector store not ready. Run 'ingest' first.")
         return
-    for r in store.records:
-        if r.path == path and r.chunk_id == chunk_id:
-            print(f"Path: {r.path}\nChunk: {r.chunk_id}\n---\n{r.text}")
-            return
-    print("Record not found.")
+    row = catalog.find(path, chunk_id)
+    if row is None:
+        print("Record not found.")
+        return
+    print(f"Path: {path}\nChunk: {chunk_id}\n---\n{catalog.text(row)}")
 
 
-def delete(path: str, chunk_id: Optional[int], all_for_path: bool = False):
-    store = load_default_store()
-    if not store.is_ready():
+def delete(session: Session, path: str, chunk_id: Optional[int], all_for_path: bool = False):
+    catalog = session.docs()
+    if catalog is None:
         print("Vector store not ready. Nothing to delete.")
         return
-    before = len(store.records)
-    if all_for_path:
-        store.records = [r for r in store.records if r.path != path]
-        removed = before - len(store.records)
-    elif chunk_id is not None:
-        store.records = [r for r in store.records if not (r.path == path and r.chunk_id == chunk_id)]
-        removed = before - len(store.records)
-    else:
+    if not all_for_path and chunk_id is None:
         print("Specify a chunk id or --all for path.")
         return
+    removed = catalog.delete(path, None if all_for_path else chunk_id)
+    session.deleted()
     if removed == 0:
         print("No matching records removed.")
         return
-    store.save()
-    print(f"Removed {removed} record(s). Updated index.jsonl and meta.json.")
+    print(f"Removed {removed} record(s). Run 'compact' to reclaim their space.")
 
 
-def purge():
-    root = os.path.join("data", "vector_store")
+def compact(background: bool = False):
+    if background:
+        proc = subprocess.Popen([sys.executable, "-m", "src.ingest", "--compact"])
+        print(f"Compacting in the background (pid {proc.pid}).")
+        return
+    from src.ingest import IngestBusyError, compact as do_compact
+
+    try:
+        dropped = do_compact()
+    except IngestBusyError as e:
+        print(str(e))
+        return
+    if dropped is None:
+        print("Nothing to compact.")
+        return
+    print(f"Dropped {dropped} deleted chunk(s) and folded in all segments. Published a new generation.")
+
+
+def merge(background: bool = False):
+    if background:
+        proc = subprocess.Popen([sys.executable, "-m", "src.ingest", "--merge"])
+        print(f"Merging segments in the background (pid {proc.pid}).")
+        return
+    from src.ingest import IngestBusyError, merge_segments
+
+    try:
+        merged = merge_segments()
+    except IngestBusyError as e:
+        print(str(e))
+        return
+    print(f"Merged {merged} segment(s)." if merged else "Nothing to merge.")
+
+
+def purge(session: Session, confirmed: bool = False):
+    root = session.root
     if not os.path.exists(root):
         print("Vector store directory does not exist.")
         return
     print(f"About to delete all contents under {root}.")
-    ans = input("Type 'yes' to confirm: ").strip().lower()
-    if ans != "yes":
-        print("Aborted.")
-        return
-    # Remove files in root (not the directory itself)
+    if not confirmed:
+        if not session.interactive:
+            print("Aborted: use 'purge --yes' in scripts.")
+            return
+        ans = input("Type 'yes' to confirm: ").strip().lower()
+        if ans != "yes":
+            print("Aborted.")
+            return
+    # Remove files in root and all generations (not the directory itself)
     removed = 0
     for name in os.listdir(root):
         p = os.path.join(root, name)
@@ -136,28 +237,66 @@ def purge():
                 removed += 1
         except Exception as e:
             print(f"[warn] Failed to remove {p}: {e}")
-    print(f"Purged {removed} file(s). Run 'ingest' to rebuild.")
+    gens = list_generations(root)
+    shutil.rmtree(generations_root(root), ignore_errors=True)
+    print(f"Purged {removed} file(s) and {len(gens)} generation(s). Run 'ingest' to rebuild.")
 
 
-def ingest():
-    from src.ingest import ingest as do_ingest
-
-    do_ingest()
+def list_generation_dirs():
+    root = os.path.join("data", "vector_store")
+    names = list_generations(root)
+    if not names:
+        print("No generations (flat layout or empty store).")
+        return
+    current = current_name(root)
+    for name in names:
+        meta = read_meta(os.path.join(generations_root(root), name))
+        mark = "*" if name == current else " "
+        print(f"{mark} {name}  files={meta.get('total_files', '?')}  chunks={meta.get('total_chunks', '?')}")
 
 
-def export_index(dest_path: str):
+def rollback(name: Optional[str] = None):
     root = os.path.join("data", "vector_store")
-    src_index = os.path.join(root, "index.jsonl")
-    if not os.path.exists(src_index):
-        print("No index.jsonl to export. Run 'ingest' first.")
+    try:
+        name = rollback_generation(root, name)
+    except ValueError as e:
+        print(str(e))
+        return
+    print(f"CURRENT -> {name}")
+
+
+def ingest(full: bool = False, append: bool = False):
+    from src.ingest import IngestBusyError, ingest as do_ingest
+
+    try:
+        do_ingest(full=full, append=append)
+    except IngestBusyError as e:
+        print(str(e))
+
+
+def export_index(session: Session, dest_path: str):
+    store = session.store()
+    if not store.is_ready():
+        print("No index to export. Run 'ingest' first.")
         return
     os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
-    with open(src_index, "r", encoding="utf-8") as s, open(dest_path, "w", encoding="utf-8") as d:
-        for line in s:
-            d.write(line)
+    store.export_jsonl(dest_path)
     print(f"Exported index to {dest_path}")
 
 
+def import_index(session: Session, src_path: str):
+    if not os.path.exists(src_path):
+        print(f"File not found: {src_path}")
+        return
+    store = session.store()
+    if store.vectorizer is None:
+        print("Vectorizer missing. Run 'ingest' first.")
+        return
+    store.import_jsonl(src_path)
+    store.save()
+    print(f"Imported {len(store)} record(s) from {src_path} into index.bin")
+
+
 def help_text():
     print(
         """
@@ -169,184 +308,189 @@ Commands:
   show <path> <chunk_id>         Print full text of a chunk
   delete <path> <chunk_id>       Delete a specific chunk
   delete <path> --all            Delete all chunks for a document path
-  purge                          Remove all vector store files
-  ingest                         Rebuild the vector store from input/
-  export <dest.jsonl>            Copy index.jsonl to a target path
+  compact [--background]         Fold deleted chunks and segments into a new generation
+  merge [--background]           Merge the newest run of small segments
+  purge [--yes]                  Remove all vector store files (--yes: do not ask)
+  generations                    List retained generations (* = current)
+  rollback [name]                Serve the previous (or the named) generation
+  ingest [--full|--append]       Update the vector store from input/ (--full: rebuild all;
+                                 --append: add new/changed files as a segment)
+  export <dest.jsonl>            Export the index as JSONL
+  import <src.jsonl>             Replace the index with records from a JSONL export
   help                           Show this help
   exit | quit                    Exit the manager
         """.strip()
     )
 
 
+def _limit(rest, at: int) -> Tuple[bool, Optional[int]]:
+    """Parse ``--limit N`` at ``rest[at]``: (ok, limit)."""
+    if len(rest) > at + 1 and rest[at] == "--limit":
+        try:
+            return True, int(rest[at + 1])
+        except ValueError:
+            print("--limit expects an integer")
+            return False, None
+    return True, None
+
+
+def run_command(session: Session, line: str) -> bool:
+    """Run one manager command line; returns False once the session should end."""
+    if not line.strip():
+        return True
+    try:
+        args = shlex.split(line)
+    except ValueError as e:
+        print(f"Parse error: {e}")
+        return True
+    cmd = args[0].lower()
+    rest = args[1:]
+    if cmd in ("exit", "quit"):
+        return False
+    if cmd == "help":
+        help_text()
+    elif cmd == "status":
+        print_status(session)
+    elif cmd == "docs":
+        ok, limit = _limit(rest, 0)
+        if ok:
+            list_docs(session, limit)
+    elif cmd == "chunks":
+        if not rest:
+            print("Usage: chunks <path> [--limit N]")
+            return True
+        ok, limit = _limit(rest, 1)
+        if ok:
+            list_chunks(session, rest[0], limit)
+    elif cmd == "search":
+        if not rest:
+            print("Usage: search <query> [--k K]")
+            return True
+        # Collect until flag or end as query string
+        k = 5
+        if "--k" in rest:
+            i = rest.index("--k")
+            query = " ".join(rest[:i])
+            try:
+                k = int(rest[i + 1])
+            except (IndexError, ValueError):
+                print("--k expects an integer")
+                return True
+        else:
+            query = " ".join(rest)
+        search(session, query, k)
+    elif cmd == "show":
+        if len(rest) < 2:
+            print("Usage: show <path> <chunk_id>")
+            return True
+        try:
+            cid = int(rest[1])
+        except ValueError:
+            print("chunk_id must be an integer")
+            return True
+        show(session, rest[0], cid)
+    elif cmd == "delete":
+        if len(rest) < 2:
+            print("Usage: delete <path> <chunk_id> | delete <path> --all")
+            return True
+        if rest[1] == "--all":
+            delete(session, rest[0], None, all_for_path=True)
+        else:
+            try:
+                cid = int(rest[1])
+            except ValueError:
+                print("chunk_id must be an integer")
+                return True
+            delete(session, rest[0], cid)
+    elif cmd == "compact":
+        compact(background="--background" in rest)
+    elif cmd == "merge":
+        merge(background="--background" in rest)
+    elif cmd == "purge":
+        purge(session, confirmed="--yes" in rest)
+    elif cmd == "generations":
+        list_generation_dirs()
+    elif cmd == "rollback":
+        rollback(rest[0] if rest else None)
+    elif cmd == "ingest":
+        ingest(full="--full" in rest, append="--append" in rest)
+    elif cmd == "export":
+        if len(rest) != 1:
+            print("Usage: export <dest.jsonl>")
+            return True
+        export_index(session, rest[0])
+    elif cmd == "import":
+        if len(rest) != 1:
+            print("Usage: import <src.jsonl>")
+            return True
+        import_index(session, rest[0])
+    else:
+        print(f"Unknown command: {cmd}. Type 'help'.")
+    return True
+
+
 def repl():
     print("Interactive Vector Store Manager. Type 'help' for commands.")
+    session = Session()
     while True:
         try:
             line = input(PROMPT)
         except (EOFError, KeyboardInterrupt):
             print()
             break
-        if not line.strip():
+        if not run_command(session, line):
+            break
+
+
+def run_script(lines: Iterable[str], stop_on_error: bool = False) -> int:
+    """Run commands one per line against one session; returns how many failed.
+
+    Blank lines and lines starting with ``#`` are skipped. A command that
+    raises is reported and, unless ``stop_on_error``, the script goes on.
+    """
+    session = Session(interactive=False)
+    failed = 0
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
             continue
+        print(f"+ {line}")
         try:
-            args = shlex.split(line)
-        except ValueError as e:
-            print(f"Parse error: {e}")
-            continue
-        cmd = args[0].lower()
-        rest = args[1:]
-        if cmd in ("exit", "quit"):  # exit
-            break
-        if cmd == "help":
-            help_text()
-        elif cmd == "status":
-            print_status()
-        elif cmd == "docs":
-            limit = None
-            if rest and rest[0] == "--limit" and len(rest) >= 2:
-                try:
-                    limit = int(rest[1])
-                except ValueError:
-                    print("--limit expects an integer")
-                    continue
-            list_docs(limit)
-        elif cmd == "chunks":
-            if not rest:
-                print("Usage: chunks <path> [--limit N]")
-                continue
-            path = rest[0]
-            limit = None
-            if len(rest) >= 3 and rest[1] == "--limit":
-                try:
-                    limit = int(rest[2])
-                except ValueError:
-                    print("--limit expects an integer")
-                    continue
-            list_chunks(path, limit)
-        elif cmd == "search":
-            if not rest:
-                print("Usage: search <query> [--k K]")
-                continue
-            # Collect until flag or end as query string
-            k = 5
-            if "--k" in rest:
-                i = rest.index("--k")
-                query = " ".join(rest[:i])
-                try:
-                    k = int(rest[i + 1])
-                except Exception:
-                    print("--k expects an integer")
-                    continue
-            else:
-                query = " ".join(rest)
-            search(query, k)
-        elif cmd == "show":
-            if len(rest) < 2:
-                print("Usage: show <path> <chunk_id>")
-                continue
-            path = rest[0]
-            try:
-                cid = int(rest[1])
-            except ValueError:
-                print("chunk_id must be an integer")
-                continue
-            show(path, cid)
-        elif cmd == "delete":
-            if len(rest) < 2:
-                print("Usage: delete <path> <chunk_id> | delete <path> --all")
-                continue
-            path = rest[0]
-            if rest[1] == "--all":
-                delete(path, None, all_for_path=True)
-            else:
-                try:
-                    cid = int(rest[1])
-                except ValueError:
-                    print("chunk_id must be an integer")
-                    continue
-                delete(path, cid)
-        elif cmd == "purge":
-            purge()
-        elif cmd == "ingest":
-            ingest()
-        elif cmd == "export":
-            if len(rest) != 1:
-                print("Usage: export <dest.jsonl>")
-                continue
-            export_index(rest[0])
-        else:
-            print(f"Unknown command: {cmd}. Type 'help'.")
+            if not run_command(session, line):
+                break
+        except Exception as e:  # report and keep going: later commands may not depend on it
+            print(f"[error] {e}")
+            failed += 1
+            if stop_on_error:
+                break
+    return failed
 
 
 def main():
     parser = argparse.ArgumentParser(description="Interactive vector store manager")
     parser.add_argument("--cmd", nargs=argparse.REMAINDER, help="Optional one-shot command to run")
+    parser.add_argument(
+        "--script",
+        metavar="FILE",
+        help="Run the commands in FILE ('-' for stdin), one per line, loading the store once",
+    )
+    parser.add_argument(
+        "--stop-on-error", action="store_true", help="With --script, stop at the first failing command"
+    )
     args = parser.parse_args()
+    if args.script:
+        if args.script == "-":
+            failed = run_script(sys.stdin, args.stop_on_error)
+        else:
+            with open(args.script, "r", encoding="utf-8") as f:
+                failed = run_script(f, args.stop_on_error)
+        sys.exit(1 if failed else 0)
     if args.cmd:
         # Run a single command then exit
-        line = " ".join(args.cmd)
-        print(f"+ {line}")
-        try:
-            # Minimal reuse of repl dispatch
-            sys.stdin = open(os.devnull)  # avoid accidental blocking reads
-        except Exception:
-            pass
-        # Execute via a tiny one-off repl loop
-        try:
-            # Simulate entering the command into the repl
-            print_status if False else None  # keep linter happy if any
-        finally:
-            pass
-        # Easiest path: just run repl once with the command by reusing dispatcher
-        # but without customizing the internals; instead, interpret here:
-        tokens = shlex.split(line)
-        if not tokens:
-            return
-        cmd, rest = tokens[0], tokens[1:]
-        if cmd == "status":
-            print_status()
-        elif cmd == "docs":
-            limit = None
-            if rest and rest[0] == "--limit" and len(rest) >= 2:
-                limit = int(rest[1])
-            list_docs(limit)
-        elif cmd == "chunks":
-            if not rest:
-                print("Usage: chunks <path> [--limit N]")
-                return
-            limit = None
-            if len(rest) >= 3 and rest[1] == "--limit":
-                limit = int(rest[2])
-            list_chunks(rest[0], limit)
-        elif cmd == "search":
-            k = 5
-            if "--k" in rest:
-                i = rest.index("--k")
-                q = " ".join(rest[:i])
-                k = int(rest[i + 1])
-            else:
-                q = " ".join(rest)
-            search(q, k)
-        elif cmd == "show":
-            show(rest[0], int(rest[1]))
-        elif cmd == "delete":
-            if len(rest) >= 2 and rest[1] == "--all":
-                delete(rest[0], None, all_for_path=True)
-            else:
-                delete(rest[0], int(rest[1]))
-        elif cmd == "purge":
-            purge()
-        elif cmd == "ingest":
-            ingest()
-        elif cmd == "export":
-            export_index(rest[0])
-        else:
-            print(f"Unknown command: {cmd}")
-        return
+        sys.exit(1 if run_script([" ".join(args.cmd)], stop_on_error=True) else 0)
     # Default: interactive repl
     repl()
 
 
 if __name__ == "__main__":
     main()
-
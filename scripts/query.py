@@ -1,11 +1,25 @@
 import argparse
-from src.vector_store import load_default_store
+from src.vector_store import SCORING_MODES, load_default_store
 
 
 def main():
     p = argparse.ArgumentParser(description="Query the local vector store")
     p.add_argument("query", type=str, help="Query text")
     p.add_argument("--k", type=int, default=5, help="Top-k results to return")
+    p.add_argument(
+        "--min-score",
+        type=float,
+        default=None,
+        help="Only return chunks scoring at least this (drops zero-overlap chunks)",
+    )
+    p.add_argument("--mode", choices=SCORING_MODES, default="tfidf", help="Ranking function")
+    p.add_argument("--prefix", default=None, help="Only search documents under this path prefix")
+    p.add_argument(
+        "--source",
+        action="append",
+        choices=("html", "md", "pdf", "other"),
+        help="Only search documents of this source type (repeatable)",
+    )
     args = p.parse_args()
 
     store = load_default_store()
@@ -13,7 +27,10 @@ def main():
         print("Vector store not ready. Run `make ingest` first.")
         return
 
-    results = store.query(args.query, k=args.k)
+    results = store.query(
+        args.query, k=args.k, min_score=args.min_score, mode=args.mode,
+        path_prefix=args.prefix, source=args.source,
+    )
     for rank, (score, rec) in enumerate(results, start=1):
         print(f"#{rank} score={score:.4f} path={rec.path} chunk={rec.chunk_id}")
         snippet = rec.text
@@ -0,0 +1,199 @@
+"""BM25 scoring over the store's postings with MaxScore dynamic pruning.
+
+BM25 impacts are precomputed per posting (aligned with ``post_docs``) together
+with each term's maximum impact, and persisted in ``bm25.bin`` next to
+``vocab.bin``. Term frequencies are not stored separately: each posting
+holds ``tf * idf`` with ``tf = count / length``, so ``value / idf`` gives the
+count ratio and ``ratio * length`` the count. Chunk lengths are stored in
+index.bin; for older files without them the length is the smallest integer
+making every ratio of the row a whole count (the ratios of a row sum to one).
+"""
+
+import heapq
+import math
+import os
+from array import array
+from bisect import bisect_left
+from typing import AbstractSet, Dict, List, Optional, Sequence, Tuple
+
+from .index_format import IndexFile, IndexWriter
+
+K1 = 1.2
+B = 0.75
+
+
+def _row_length(ratios: Sequence[float]) -> int:
+    if not ratios:
+        return 0
+    r_min = min(ratios)
+    for m in range(1, 64):
+        length = round(m / r_min)
+        if length > 0 and all(abs(r * length - round(r * length)) < 1e-3 for r in ratios):
+            return length
+    return max(1, round(1 / r_min))
+
+
+def row_lengths(indptr: Sequence[int], indices: Sequence[int], values: Sequence[float],
+                idf: Sequence[float], stored: Optional[Sequence[int]] = None) -> array:
+    """Chunk lengths: the ``stored`` ones where known (not negative), else inferred from the row."""
+    lengths = array("d")
+    for row in range(len(indptr) - 1):
+        if stored is not None and stored[row] >= 0:
+            lengths.append(stored[row])
+            continue
+        start, end = indptr[row], indptr[row + 1]
+        lengths.append(_row_length([v / idf[t] for t, v in zip(indices[start:end], values[start:end])]))
+    return lengths
+
+
+def term_idf(n_rows: int, df: int) -> float:
+    """BM25 inverse document frequency of a term found in ``df`` of ``n_rows`` chunks."""
+    return math.log(1.0 + (n_rows - df + 0.5) / (df + 0.5))
+
+
+class Bm25Index:
+    def __init__(self, weights: Sequence[float], term_max: Sequence[float], meta: Dict):
+        self.weights = weights
+        self.term_max = term_max
+        self.meta = meta
+
+    @classmethod
+    def build(cls, indptr: Sequence[int], indices: Sequence[int], values: Sequence[float],
+              term_ptr: Sequence[int], post_docs: Sequence[int], post_vals: Sequence[float],
+              idf: Sequence[float], k1: float = K1, b: float = B, build_id: str = "",
+              lengths: Optional[Sequence[int]] = None, avgdl: Optional[float] = None) -> "Bm25Index":
+        """Impacts of the CSR rows and term-major postings; ``lengths`` are the
+        chunk lengths if known (a negative entry means unknown). ``avgdl``
+        defaults to the mean length of these rows; the parts of a segmented
+        store pass the corpus-wide one."""
+        n_rows = len(indptr) - 1
+        lengths = row_lengths(indptr, indices, values, idf, lengths)
+        if avgdl is None:
+            avgdl = (sum(lengths) / n_rows) if n_rows else 0.0
+        n_terms = len(term_ptr) - 1
+        weights = array("f", [0.0]) * term_ptr[n_terms]
+        term_max = array("f", [0.0]) * n_terms
+        for t in range(n_terms):
+            start, end = term_ptr[t], term_ptr[t + 1]
+            df = end - start
+            if not df:
+                continue
+            w_idf = term_idf(n_rows, df)
+            inv = 1.0 / idf[t]
+            best = 0.0
+            for p in range(start, end):
+                dl = lengths[post_docs[p]]
+                f = max(1.0, round(post_vals[p] * inv * dl))
+                w = w_idf * f * (k1 + 1.0) / (f + k1 * (1.0 - b + b * dl / (avgdl or 1.0)))
+                weights[p] = w
+                if w > best:
+                    best = w
+            term_max[t] = best
+        meta = {"k1": k1, "b": b, "avgdl": avgdl, "n_rows": n_rows, "build_id": build_id}
+        return cls(weights, term_max, meta)
+
+    def save(self, path: str) -> None:
+        writer = IndexWriter(path)
+        try:
+            writer.add("weights", "f", self.weights)
+            writer.add("term_max", "f", self.term_max)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close(self.meta)
+
+    @classmethod
+    def open(cls, path: str, build_id: Optional[str] = None) -> Optional["Bm25Index"]:
+        """Map ``bm25.bin``; None if it is missing or belongs to another index build."""
+        if not os.path.exists(path):
+            return None
+        f = IndexFile(path)
+        if build_id is not None and f.meta.get("build_id") != build_id:
+            return None
+        return cls(f.section("weights"), f.section("term_max"), f.meta)
+
+
+def max_score_top_k(term_ptr: Sequence[int], post_docs: Sequence[int], bm25: Bm25Index,
+                    query: Dict[int, int], k: int, lo: Optional[Sequence[int]] = None,
+                    hi: Optional[Sequence[int]] = None,
+                    skip: Optional[AbstractSet[int]] = None,
+                    allow: Optional[Sequence[int]] = None) -> List[Tuple[float, int]]:
+    """Exact top-k BM25 ``(score, doc)`` with MaxScore pruning, best first.
+
+    ``lo``/``hi`` restrict each term to a posting range (a shard or a
+    filter's row range); the global per-term maxima remain valid bounds
+    there. Documents in ``skip`` (deleted chunks) are passed over, and with a
+    row bitmap ``allow`` so are the documents it does not set, unscored.
+
+    Query terms are ordered by their score upper bound. Once the k-th best
+    score exceeds the summed bounds of the weakest terms, those become
+    non-essential: documents are only discovered through the remaining lists,
+    and a candidate stops being scored as soon as its partial score plus the
+    bounds still unchecked cannot beat the threshold.
+    """
+    lists = []
+    for t, qtf in query.items():
+        if lo is None:
+            start, end = term_ptr[t], term_ptr[t + 1]
+        else:
+            start, end = lo[t], hi[t]
+        if end > start:
+            lists.append((bm25.term_max[t] * qtf, qtf, start, end))
+    if not lists or k <= 0:
+        return []
+    lists.sort()
+    ub = [entry[0] for entry in lists]
+    cum: List[float] = []
+    total = 0.0
+    for u in ub:
+        total += u
+        cum.append(total)
+    pos = [entry[2] for entry in lists]
+    ends = [entry[3] for entry in lists]
+    qtfs = [entry[1] for entry in lists]
+    weights = bm25.weights
+    m = len(lists)
+
+    heap: List[Tuple[float, int]] = []  # (score, -doc): root is the current k-th best
+    theta = -1.0
+    first_essential = 0
+    while first_essential < m:
+        cur = -1
+        for i in range(first_essential, m):
+            if pos[i] < ends[i]:
+                d = post_docs[pos[i]]
+                if cur < 0 or d < cur:
+                    cur = d
+        if cur < 0:
+            break
+        if allow is not None and not allow[cur]:
+            for i in range(first_essential, m):
+                if pos[i] < ends[i] and post_docs[pos[i]] == cur:
+                    pos[i] += 1
+            continue
+        score = 0.0
+        for i in range(first_essential, m):
+            p = pos[i]
+            if p < ends[i] and post_docs[p] == cur:
+                score += weights[p] * qtfs[i]
+                pos[i] = p + 1
+        if skip and cur in skip:
+            continue
+        for i in range(first_essential - 1, -1, -1):
+            if score + cum[i] <= theta:
+                break
+            p = bisect_left(post_docs, cur, pos[i], ends[i])
+            pos[i] = p
+            if p < ends[i] and post_docs[p] == cur:
+                score += weights[p] * qtfs[i]
+        else:
+            # Documents are visited in increasing order, so a tie never displaces.
+            if len(heap) < k:
+                heapq.heappush(heap, (score, -cur))
+            elif score > theta:
+                heapq.heapreplace(heap, (score, -cur))
+            if len(heap) == k:
+                theta = heap[0][0]
+                while first_essential < m and cum[first_essential] <= theta:
+                    first_essential += 1
+    return sorted(((s, -neg_doc) for s, neg_doc in heap), key=lambda x: (-x[0], x[1]))
@@ -1,23 +1,12 @@
-from typing import List, Iterable
+from typing import List
 
-
-def _word_iter(text: str) -> Iterable[str]:
-    word = []
-    for ch in text:
-        if ch.isalnum():
-            word.append(ch.lower())
-        else:
-            if word:
-                yield "".join(word)
-                word = []
-    if word:
-        yield "".join(word)
+from .tfidf import split_words
 
 
 def chunk_text(text: str, max_words: int = 300, overlap: int = 50) -> List[str]:
     if max_words <= 0:
         return [text]
-    words = list(_word_iter(text))
+    words = split_words(text)
     chunks: List[str] = []
     i = 0
     n = len(words)
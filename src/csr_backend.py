@@ -0,0 +1,77 @@
+"""Optional NumPy/SciPy scoring backend.
+
+The corpus is held as one CSR matrix whose rows are pre-normalized, so a batch
+of queries is scored with a single sparse matrix product and top-k is taken with
+``argpartition``. Everything here is optional: ``available()`` is False when
+numpy/scipy are missing and callers fall back to the pure-Python postings path.
+"""
+
+from typing import List, Sequence, Tuple
+
+try:  # optional dependency
+    import numpy as np  # type: ignore
+    from scipy import sparse  # type: ignore
+except Exception:  # pragma: no cover - depends on environment
+    np = None
+    sparse = None
+
+
+def available() -> bool:
+    return np is not None and sparse is not None
+
+
+class CsrScorer:
+    def __init__(self, n_terms: int, indptr, indices, values, norms):
+        if not available():
+            raise RuntimeError("numpy and scipy are required for the CSR backend")
+        indptr = np.asarray(indptr, dtype=np.int64)
+        indices = np.asarray(indices, dtype=np.int32)
+        norms = np.asarray(norms, dtype=np.float64)
+        safe = np.where(norms > 0, norms, 1e-12)
+        row_scale = np.repeat(1.0 / safe, np.diff(indptr))
+        data = (np.asarray(values, dtype=np.float64) * row_scale).astype(np.float32)
+        self.n_rows = len(indptr) - 1
+        self.n_terms = n_terms
+        self.matrix = sparse.csr_matrix((data, indices, indptr), shape=(self.n_rows, n_terms))
+
+    def _query_matrix(self, queries: Sequence[Tuple[Sequence[int], Sequence[float]]]):
+        indptr = [0]
+        indices: List[int] = []
+        data: List[float] = []
+        for q_idx, q_val in queries:
+            norm = float(np.sqrt(sum(v * v for v in q_val))) if q_val else 1e-12
+            for t, v in zip(q_idx, q_val):
+                if 0 <= t < self.n_terms:
+                    indices.append(t)
+                    data.append(v / norm)
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), indptr),
+            shape=(len(queries), self.n_terms),
+        )
+
+    def top_k(
+        self, queries: Sequence[Tuple[Sequence[int], Sequence[float]]], k: int
+    ) -> List[List[Tuple[float, int]]]:
+        """Top-k ``(score, row)`` pairs per query, best first, ties by row.
+
+        Only rows with a non-zero score are returned; callers pad if needed.
+        """
+        if not queries:
+            return []
+        # (n_queries x n_terms) @ (n_terms x n_rows): one product for the batch.
+        scores = (self._query_matrix(queries) @ self.matrix.T).tocsr()
+        out: List[List[Tuple[float, int]]] = []
+        for qi in range(len(queries)):
+            start, end = scores.indptr[qi], scores.indptr[qi + 1]
+            rows = scores.indices[start:end]
+            vals = scores.data[start:end]
+            if k <= 0 or len(rows) == 0:
+                out.append([])
+                continue
+            if len(rows) > k:
+                keep = np.argpartition(-vals, k - 1)[:k]
+                rows, vals = rows[keep], vals[keep]
+            order = np.lexsort((rows, -vals))
+            out.append([(float(vals[i]), int(rows[i])) for i in order])
+        return out
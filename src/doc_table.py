@@ -0,0 +1,353 @@
+"""Per-document table of a build, in ``docs.json``.
+
+Every index (the base and each segment) gets a ``docs.json`` next to its
+``index.bin``, tied to it by the build id. It maps each path to the runs of
+rows holding its chunks, ``[first row, count, first chunk id]`` with
+consecutive chunk ids (an ingest writes one run per file), plus the file's
+source type, size and mtime, and each source type to the row ranges of its
+documents. The row of ``(path, chunk_id)`` is therefore a dict lookup and a
+subtraction, listing documents or chunks never touches the embeddings, and a
+query filter (see ``filters``) resolves to row ranges without a scan.
+
+:class:`DocCatalog` combines the tables of a build's parts with the chunks
+tombstoned in ``deletes.log``, numbering rows as the store does (base rows,
+then each segment's).
+"""
+
+import json
+import os
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+from .filters import DocFilter, RowSubset, coalesce
+from .generations import current_dir, publish, publish_lock, read_segments, store_root, superseded
+from .text_store import TextStore
+
+DOCS_FILE = "docs.json"
+
+_SOURCE_TYPES = {".html": "html", ".htm": "html", ".md": "md", ".pdf": "pdf"}
+
+
+def source_type(path: str) -> str:
+    """``html``, ``md`` or ``pdf`` from the file extension, else ``other``."""
+    return _SOURCE_TYPES.get(os.path.splitext(path)[1].lower(), "other")
+
+
+def read_delete_entries(path: str) -> List[Dict]:
+    """The ``{build_id, row, path, chunk_id}`` entries of ``deletes.log``, oldest first."""
+    entries: List[Dict] = []
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return entries
+    with f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:  # torn final line
+                continue
+    return entries
+
+
+def read_deletes(path: str) -> Dict[str, Set[int]]:
+    """Rows tombstoned in ``deletes.log``, by the build id of the index they belong to."""
+    deleted: Dict[str, Set[int]] = {}
+    for entry in read_delete_entries(path):
+        deleted.setdefault(entry.get("build_id", ""), set()).add(int(entry["row"]))
+    return deleted
+
+
+def append_deletes(path: str, entries: Iterable[Dict]) -> None:
+    """Append ``{build_id, row, path, chunk_id}`` entries to ``deletes.log`` and fsync it."""
+    with open(path, "a", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class DocTable:
+    def __init__(self, docs: Dict[str, Dict], n_rows: int, build_id: str = "",
+                 sources: Optional[Dict[str, List[List[int]]]] = None):
+        self.docs = docs
+        self.n_rows = n_rows
+        self.build_id = build_id
+        self._sources = sources
+        self._by_row: Optional[Tuple[List[int], List[Tuple[str, int, int]]]] = None
+        self._sorted: Optional[List[str]] = None
+
+    @classmethod
+    def build(cls, path_ids: Sequence[int], chunk_ids: Sequence[int], paths: Sequence[str],
+              build_id: str = "", stats: Optional[Mapping[str, Mapping]] = None) -> "DocTable":
+        """Table of an index's ``path_ids``/``chunk_ids`` columns; ``stats`` gives file sizes and mtimes."""
+        docs: Dict[str, Dict] = {}
+        prev_pid = prev_cid = -1
+        run: List[int] = []
+        for row, (pid, cid) in enumerate(zip(path_ids, chunk_ids)):
+            if pid == prev_pid and cid == prev_cid + 1:
+                run[1] += 1
+            else:
+                path = paths[pid]
+                entry = docs.get(path)
+                if entry is None:
+                    stat = (stats or {}).get(path, {})
+                    entry = docs[path] = {
+                        "runs": [], "source": source_type(path),
+                        "size": stat.get("size"), "mtime_ns": stat.get("mtime_ns"),
+                    }
+                run = [row, 1, cid]
+                entry["runs"].append(run)
+            prev_pid, prev_cid = pid, cid
+        table = cls({path: docs[path] for path in sorted(docs)}, len(path_ids), build_id)
+        table.sources()
+        return table
+
+    def save(self, path: str) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "build_id": self.build_id, "n_rows": self.n_rows,
+                "sources": self.sources(), "docs": self.docs,
+            }, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, build_id: Optional[str] = None) -> Optional["DocTable"]:
+        """Read ``docs.json``; None if it is missing, unreadable or belongs to another index build."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if build_id is not None and data.get("build_id") != build_id:
+            return None
+        return cls(data["docs"], int(data["n_rows"]), data.get("build_id", ""), data.get("sources"))
+
+    def sources(self) -> Dict[str, List[List[int]]]:
+        """Source type -> ``[start, end)`` row ranges of its documents."""
+        if self._sources is None:
+            by_source: Dict[str, List[Tuple[int, int]]] = {}
+            for entry in self.docs.values():
+                by_source.setdefault(entry["source"], []).extend(
+                    (row, row + n) for row, n, _ in entry["runs"]
+                )
+            self._sources = {
+                source: [list(r) for r in coalesce(ranges)] for source, ranges in sorted(by_source.items())
+            }
+        return self._sources
+
+    def _paths(self, prefix: Optional[str]) -> List[str]:
+        """Paths starting with ``prefix``, found by bisection over the sorted paths."""
+        if self._sorted is None:
+            self._sorted = sorted(self.docs)
+        if not prefix:
+            return self._sorted
+        lo = bisect_left(self._sorted, prefix)
+        hi = bisect_left(self._sorted, prefix + "\U0010ffff", lo)
+        return self._sorted[lo:hi]
+
+    def select(self, flt: DocFilter) -> RowSubset:
+        """Rows of the documents matching ``flt``."""
+        if flt.path_prefix is None and flt.metadata is None:
+            sources = self.sources()
+            ranges = [tuple(r) for source in flt.source for r in sources.get(source, ())]
+        else:
+            ranges = [
+                (row, row + n)
+                for path in self._paths(flt.path_prefix) if flt.matches(path, self.docs[path])
+                for row, n, _ in self.docs[path]["runs"]
+            ]
+        return RowSubset(coalesce(ranges), self.n_rows)
+
+    def count(self, path: str) -> int:
+        entry = self.docs.get(path)
+        return sum(run[1] for run in entry["runs"]) if entry else 0
+
+    def chunks(self, path: str) -> List[Tuple[int, int]]:
+        """``(chunk_id, row)`` of every chunk of ``path``."""
+        entry = self.docs.get(path)
+        if entry is None:
+            return []
+        return [(cid + j, row + j) for row, n, cid in entry["runs"] for j in range(n)]
+
+    def find(self, path: str, chunk_id: int) -> Optional[int]:
+        entry = self.docs.get(path)
+        if entry is not None:
+            for row, n, cid in entry["runs"]:
+                if cid <= chunk_id < cid + n:
+                    return row + chunk_id - cid
+        return None
+
+    def chunk_at(self, row: int) -> Tuple[str, int]:
+        """``(path, chunk_id)`` of ``row``."""
+        if self._by_row is None:
+            runs = sorted((r, n, cid, path) for path, e in self.docs.items() for r, n, cid in e["runs"])
+            self._by_row = ([r for r, _, _, _ in runs], [(path, r, cid) for r, _, cid, path in runs])
+        starts, runs = self._by_row
+        path, start, cid = runs[bisect_right(starts, row) - 1]
+        return path, cid + row - start
+
+
+class DocCatalog:
+    """Documents of a build across its parts, less deleted chunks.
+
+    ``parts`` are ``(directory, table, deleted rows)`` for the base and then
+    each segment; the deleted sets are shared with the caller, so deletes made
+    through :meth:`delete` are seen by it too. ``text`` returns the chunk text
+    of a row, read from the parts' texts.bin when not given.
+    """
+
+    def __init__(self, parts: Sequence[Tuple[str, DocTable, Set[int]]],
+                 text: Optional[Callable[[int], str]] = None):
+        self.parts = list(parts)
+        self.starts: List[int] = []
+        start = 0
+        for _, table, _ in self.parts:
+            self.starts.append(start)
+            start += table.n_rows
+        self._text = text
+        self._texts: Dict[int, TextStore] = {}
+
+    @classmethod
+    def open(cls, build_dir: str) -> Optional["DocCatalog"]:
+        """The catalog of a published build from its files alone; None if a docs.json is missing."""
+        dirs = [build_dir] + [os.path.join(build_dir, name) for name in read_segments(build_dir)]
+        tables = [DocTable.load(os.path.join(d, DOCS_FILE)) for d in dirs]
+        if any(table is None for table in tables):
+            return None
+        deleted = read_deletes(os.path.join(build_dir, "deletes.log"))
+        return cls([(d, t, deleted.get(t.build_id, set())) for d, t in zip(dirs, tables)])
+
+    @property
+    def deletes_path(self) -> str:
+        return os.path.join(self.parts[0][0], "deletes.log")
+
+    def _part(self, row: int) -> Tuple[int, int]:
+        p = bisect_right(self.starts, row) - 1
+        return p, row - self.starts[p]
+
+    def docs(self) -> Dict[str, Dict]:
+        """Path -> ``{"chunks", "source", "size", "mtime_ns"}`` for documents with live chunks."""
+        out: Dict[str, Dict] = {}
+        for _, table, deleted in self.parts:
+            dropped: Dict[str, int] = {}
+            for row in deleted:
+                path = table.chunk_at(row)[0]
+                dropped[path] = dropped.get(path, 0) + 1
+            for path, entry in table.docs.items():
+                live = table.count(path) - dropped.get(path, 0)
+                if live:
+                    doc = out.setdefault(path, {
+                        "chunks": 0, "source": entry["source"],
+                        "size": entry.get("size"), "mtime_ns": entry.get("mtime_ns"),
+                    })
+                    doc["chunks"] += live
+        return out
+
+    def chunks(self, path: str) -> List[Tuple[int, int]]:
+        """``(chunk_id, row)`` of the live chunks of ``path``, in chunk id order."""
+        return sorted(
+            (cid, start + row)
+            for start, (_, table, deleted) in zip(self.starts, self.parts)
+            for cid, row in table.chunks(path) if row not in deleted
+        )
+
+    def find(self, path: str, chunk_id: int) -> Optional[int]:
+        """Row of the live chunk ``chunk_id`` of ``path``, or None."""
+        for start, (_, table, deleted) in zip(self.starts, self.parts):
+            row = table.find(path, chunk_id)
+            if row is not None and row not in deleted:
+                return start + row
+        return None
+
+    def text(self, row: int) -> str:
+        if self._text is not None:
+            return self._text(row)
+        p, local = self._part(row)
+        texts = self._texts.get(p)
+        if texts is None:
+            texts = self._texts[p] = TextStore(os.path.join(self.parts[p][0], "texts.bin"))
+        return texts.get(local)
+
+    def delete(self, path: str, chunk_id: Optional[int] = None) -> int:
+        """Tombstone the live chunks of ``path`` (or only ``chunk_id``); returns how many."""
+        if chunk_id is None:
+            rows = [row for _, row in self.chunks(path)]
+        else:
+            row = self.find(path, chunk_id)
+            rows = [] if row is None else [row]
+        return self.delete_rows(rows)
+
+    def delete_rows(self, rows: Iterable[int]) -> int:
+        """Tombstone chunks by row; returns how many were not deleted yet.
+
+        Runs under the store's :func:`~generations.publish_lock`. If a newer
+        generation was published since this catalog was read, the chunks are
+        tombstoned in that one as well, by path and chunk id.
+        """
+        rows = set(rows)
+        build_dir = self.parts[0][0]
+        root = store_root(build_dir)
+        with publish_lock(root):
+            if not superseded(build_dir):
+                return self._tombstone(rows)
+            current = DocCatalog.open(current_dir(root))
+            if current is not None:
+                chunks = [self.parts[p][1].chunk_at(local) for p, local in map(self._part, rows)]
+                current._tombstone(
+                    row for row in (current.find(path, cid) for path, cid in chunks) if row is not None
+                )
+            # A superseded generation keeps its log until pruned; the flat layout's is gone.
+            return self._tombstone(rows, log=build_dir != root and os.path.isdir(build_dir))
+
+    def _tombstone(self, rows: Iterable[int], log: bool = True) -> int:
+        entries = []
+        for row in set(rows):
+            p, local = self._part(row)
+            _, table, deleted = self.parts[p]
+            if local in deleted:
+                continue
+            path, cid = table.chunk_at(local)
+            entries.append(
+                (deleted, {"build_id": table.build_id, "row": local, "path": path, "chunk_id": cid})
+            )
+        if entries and log:
+            append_deletes(self.deletes_path, (entry for _, entry in entries))
+        for deleted, entry in entries:
+            deleted.add(entry["row"])
+        return len(entries)
+
+
+def carry_deletes(source_dir: str, known: Mapping[str, Set[int]], gen_dir: str,
+                  skip: Iterable[str] = ()) -> int:
+    """Tombstone in ``gen_dir`` the chunks deleted in ``source_dir`` since it was read.
+
+    ``known`` holds the rows, by build id, that were deleted when the build
+    read ``source_dir``; later entries of its log are matched to ``gen_dir``
+    by path and chunk id, except for paths in ``skip`` (files the build
+    re-extracted). Returns how many chunks were tombstoned.
+    """
+    skip = set(skip)
+    entries = [
+        e for e in read_delete_entries(os.path.join(source_dir, "deletes.log"))
+        if int(e["row"]) not in known.get(e.get("build_id", ""), ()) and e["path"] not in skip
+    ]
+    catalog = DocCatalog.open(gen_dir) if entries else None
+    if catalog is None:
+        return 0
+    found = (catalog.find(e["path"], int(e["chunk_id"])) for e in entries)
+    return catalog._tombstone(row for row in found if row is not None)
+
+
+def publish_build(root: str, gen_dir: str, source_dir: Optional[str] = None,
+                  known: Optional[Mapping[str, Set[int]]] = None, skip: Iterable[str] = ()) -> None:
+    """Publish ``gen_dir``, built from ``source_dir``, keeping the deletes made meanwhile.
+
+    A delete either lands in ``source_dir``'s log before this takes the
+    publish lock, and is carried over (see :func:`carry_deletes`), or after
+    it, and then finds ``source_dir`` superseded and applies to ``gen_dir``.
+    """
+    with publish_lock(root):
+        if source_dir is not None:
+            carry_deletes(source_dir, known or {}, gen_dir, skip)
+        publish(root, gen_dir)
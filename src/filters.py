@@ -0,0 +1,133 @@
+"""Restricting a query to part of the corpus.
+
+A :class:`DocFilter` selects documents by path prefix, source type and
+exact-match document metadata (the fields of ``docs.json``: ``size``,
+``mtime_ns``, ...). ``DocTable.select`` turns it into a :class:`RowSubset`,
+the sorted, disjoint row ranges of the matching documents. Both come from the
+doc table written at ingest (per-document runs, per-source row ranges), so
+selecting never touches the index.
+
+Posting lists are ascending by row, so a row range is a contiguous stretch of
+each list and is found by bisection; only the postings inside the ranges are
+scored. When a list is short relative to the number of ranges it is cheaper to
+scan it and test each row against a bitmap of the subset instead.
+"""
+
+import json
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+# Above this many ranges BM25 scores with a bitmap rather than one pass per range.
+MAX_RANGES = 64
+
+
+def coalesce(ranges: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Sorted, disjoint ``[start, end)`` ranges covering ``ranges``."""
+    out: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if end <= start:
+            continue
+        if out and start <= out[-1][1]:
+            if end > out[-1][1]:
+                out[-1] = (out[-1][0], end)
+        else:
+            out.append((start, end))
+    return out
+
+
+class DocFilter:
+    """Documents whose path starts with ``path_prefix``, whose source type is
+    one of ``source`` and whose doc table entry has every ``metadata`` value."""
+
+    def __init__(self, path_prefix: Optional[str] = None,
+                 source: Optional[Union[str, Sequence[str]]] = None,
+                 metadata: Optional[Mapping[str, Any]] = None):
+        self.path_prefix = path_prefix or None
+        if isinstance(source, str):
+            source = [source]
+        self.source = frozenset(source) if source else None
+        self.metadata = dict(metadata) if metadata else None
+
+    @classmethod
+    def of(cls, path_prefix: Optional[str] = None,
+           source: Optional[Union[str, Sequence[str]]] = None,
+           metadata: Optional[Mapping[str, Any]] = None) -> Optional["DocFilter"]:
+        """The filter, or None when no condition is given."""
+        flt = cls(path_prefix, source, metadata)
+        return None if flt.path_prefix is None and flt.source is None and flt.metadata is None else flt
+
+    def key(self) -> Tuple:
+        """Hashable form, for cache keys."""
+        return (
+            self.path_prefix,
+            tuple(sorted(self.source)) if self.source is not None else None,
+            json.dumps(self.metadata, sort_keys=True) if self.metadata is not None else None,
+        )
+
+    def matches(self, path: str, entry: Mapping[str, Any]) -> bool:
+        if self.path_prefix is not None and not path.startswith(self.path_prefix):
+            return False
+        if self.source is not None and entry.get("source") not in self.source:
+            return False
+        if self.metadata is not None:
+            return all(entry.get(name) == value for name, value in self.metadata.items())
+        return True
+
+
+class RowSubset:
+    """Rows of one index selected by a filter, as sorted disjoint ``[start, end)`` ranges."""
+
+    def __init__(self, ranges: List[Tuple[int, int]], n_rows: int):
+        self.ranges = ranges
+        self.n_rows = n_rows
+        self._bitmap: Optional[bytearray] = None
+
+    def __len__(self) -> int:
+        return sum(end - start for start, end in self.ranges)
+
+    @property
+    def dense(self) -> bool:
+        return len(self.ranges) > MAX_RANGES
+
+    def rows(self) -> Iterator[int]:
+        for start, end in self.ranges:
+            yield from range(start, end)
+
+    def bitmap(self) -> bytearray:
+        """One byte per row, set for the rows in the subset."""
+        if self._bitmap is None:
+            bitmap = bytearray(self.n_rows)
+            for start, end in self.ranges:
+                bitmap[start:end] = b"\x01" * (end - start)
+            self._bitmap = bitmap
+        return self._bitmap
+
+    def posting_ranges(self, docs: Sequence[int], start: int, end: int) -> Optional[List[Tuple[int, int]]]:
+        """Stretches of the posting list ``docs[start:end]`` inside the subset.
+
+        None when bisecting for every range would cost more than scanning the
+        list against :meth:`bitmap`.
+        """
+        if len(self.ranges) * 2 * max(1, (end - start).bit_length()) > end - start:
+            return None
+        out = []
+        for lo, hi in self.ranges:
+            s = bisect_left(docs, lo, start, end)
+            if s == end:
+                break
+            e = bisect_left(docs, hi, s, end)
+            if e > s:
+                out.append((s, e))
+        return out
+
+    def term_bounds(self, term_ptr: Sequence[int], docs: Sequence[int],
+                    terms: Iterable[int]) -> Iterator[Tuple[Dict[int, int], Dict[int, int]]]:
+        """Per range, ``(lo, hi)`` posting positions of each of ``terms`` inside it."""
+        terms = [t for t in terms if 0 <= t < len(term_ptr) - 1]
+        for start, end in self.ranges:
+            lo: Dict[int, int] = {}
+            hi: Dict[int, int] = {}
+            for t in terms:
+                lo[t] = s = bisect_left(docs, start, term_ptr[t], term_ptr[t + 1])
+                hi[t] = bisect_left(docs, end, s, term_ptr[t + 1])
+            yield lo, hi
@@ -0,0 +1,243 @@
+"""Generation directories.
+
+Every build is written into a fresh directory under
+``data/vector_store/generations`` and published by atomically replacing the
+``CURRENT`` pointer file with that directory's name. Readers resolve the
+pointer once per load and only ever see a complete build; a published
+generation is never modified in place, except for appends to its
+``deletes.log`` (see ``VectorStore.delete``). The newest ``KEEP_GENERATIONS``
+generations (default 3) are kept so a bad build can be rolled back.
+
+Those appends and publishing take :func:`publish_lock`. A builder re-reads
+the log it started from under the lock and carries newer tombstones into
+its build before publishing; a delete that finds its generation superseded
+applies to the current one instead. Either way no delete is lost.
+
+A store without ``CURRENT`` is read from the flat layout of earlier versions
+(artifacts directly under the root); publishing a generation removes it.
+
+A generation may also hold append-only segments: ``seg-*`` subdirectories
+listed, oldest first, in ``segments.json``. Forking a generation links them
+like the other files, so an append or a merge only writes what is new.
+"""
+
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - platform dependent
+    fcntl = None
+
+POINTER = "CURRENT"
+GENERATIONS_DIR = "generations"
+SEGMENTS_FILE = "segments.json"
+SEGMENT_PREFIX = "seg-"
+
+# Artifacts of the flat layout that a published generation supersedes.
+_FLAT_FILES = (
+    "vectorizer.json", "index.bin", "texts.bin", "bm25.bin", "shards.bin",
+    "meta.json", "manifest.json", "index.jsonl", "deletes.log",
+    "docs.json", "vocab.bin",
+)
+
+
+def generations_root(root: str) -> str:
+    return os.path.join(root, GENERATIONS_DIR)
+
+
+def current_name(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, POINTER), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def current_dir(root: str) -> str:
+    """Directory of the published build (the root itself for the flat layout)."""
+    name = current_name(root)
+    return os.path.join(generations_root(root), name) if name else root
+
+
+def store_root(build_dir: str) -> str:
+    """Store root of a build directory (a generation, or the root of the flat layout)."""
+    parent = os.path.dirname(os.path.normpath(build_dir))
+    return os.path.dirname(parent) if os.path.basename(parent) == GENERATIONS_DIR else build_dir
+
+
+def superseded(build_dir: str) -> bool:
+    """Whether a newer generation (or, for the flat layout, any) has been published over ``build_dir``."""
+    root = store_root(build_dir)
+    name = current_name(root)
+    if name is None:
+        return False
+    return root == build_dir or os.path.basename(os.path.normpath(build_dir)) < name
+
+
+@contextmanager
+def publish_lock(root: str) -> Iterator[None]:
+    """Exclusive lock serializing tombstone appends with publishing (held briefly; blocks)."""
+    with open(os.path.join(root, ".publish.lock"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def list_generations(root: str) -> List[str]:
+    """Generation names, oldest first."""
+    try:
+        names = os.listdir(generations_root(root))
+    except OSError:
+        return []
+    return sorted(n for n in names if os.path.isdir(os.path.join(generations_root(root), n)))
+
+
+def next_generation(root: str, floor: int = 0) -> int:
+    """A generation number above every existing one (and above ``floor``)."""
+    numbers = [floor]
+    for name in list_generations(root):
+        prefix = name.split("-", 1)[0]
+        if prefix.isdigit():
+            numbers.append(int(prefix))
+    return max(numbers) + 1
+
+
+def new_generation_dir(root: str, generation: int) -> str:
+    """Create an empty directory for build ``generation``; names sort by generation."""
+    path = os.path.join(generations_root(root), f"{generation:06d}-{uuid.uuid4().hex[:8]}")
+    os.makedirs(path)
+    return path
+
+
+def _link(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def fork_generation(root: str, generation: int, exclude: Sequence[str] = ()) -> str:
+    """New generation directory starting as a copy (hard links where possible) of the current one.
+
+    Segment directories are linked file by file; ``deletes.log`` is copied
+    because the new generation may append to it. Names in ``exclude`` are
+    left out.
+    """
+    src = current_dir(root)
+    path = new_generation_dir(root, generation)
+    for name in os.listdir(src):
+        s = os.path.join(src, name)
+        d = os.path.join(path, name)
+        if name == POINTER or name in exclude:
+            continue
+        if os.path.isdir(s):
+            if name.startswith(SEGMENT_PREFIX):
+                os.makedirs(d)
+                for part in os.listdir(s):
+                    _link(os.path.join(s, part), os.path.join(d, part))
+        elif name == "deletes.log":
+            shutil.copy2(s, d)
+        elif os.path.isfile(s):
+            _link(s, d)
+    return path
+
+
+def new_segment_dir(gen_dir: str) -> str:
+    path = os.path.join(gen_dir, f"{SEGMENT_PREFIX}{uuid.uuid4().hex[:8]}")
+    os.makedirs(path)
+    return path
+
+
+def read_segments(build_dir: str) -> List[str]:
+    """Segment directory names of a build, oldest first."""
+    try:
+        with open(os.path.join(build_dir, SEGMENTS_FILE), "r", encoding="utf-8") as f:
+            return list(json.load(f))
+    except (OSError, ValueError):
+        return []
+
+
+def write_segments(build_dir: str, names: Sequence[str]) -> None:
+    path = os.path.join(build_dir, SEGMENTS_FILE)
+    if not names:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(list(names), f)
+    os.replace(tmp, path)  # never write through a link shared with older generations
+
+
+def resolve_keep(keep: Optional[int] = None) -> int:
+    if keep is None:
+        try:
+            keep = int(os.environ.get("KEEP_GENERATIONS", "3"))
+        except ValueError:
+            keep = 3
+    return max(1, keep)
+
+
+def _set_pointer(root: str, name: str) -> None:
+    path = os.path.join(root, POINTER)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def publish(root: str, gen_dir: str, keep: Optional[int] = None) -> None:
+    """Make ``gen_dir`` the current generation and prune old ones."""
+    flat = current_name(root) is None
+    _set_pointer(root, os.path.basename(gen_dir))
+    if flat:
+        for name in _FLAT_FILES:
+            try:
+                os.remove(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    prune(root, keep)
+
+
+def prune(root: str, keep: Optional[int] = None) -> List[str]:
+    """Delete all but the newest ``keep`` generations up to the current one.
+
+    Newer directories are builds still in progress and are left alone.
+    Readers that already loaded a pruned generation keep working from their
+    open file mappings.
+    """
+    current = current_name(root)
+    if current is None:
+        return []
+    older = [n for n in list_generations(root) if n < current]
+    removed = older[: max(0, len(older) - (resolve_keep(keep) - 1))]
+    for name in removed:
+        shutil.rmtree(os.path.join(generations_root(root), name), ignore_errors=True)
+    return removed
+
+
+def rollback(root: str, name: Optional[str] = None) -> str:
+    """Point CURRENT at ``name``, or at the generation before the current one."""
+    names = list_generations(root)
+    current = current_name(root)
+    if name is None:
+        older = [n for n in names if current is not None and n < current]
+        if not older:
+            raise ValueError("no earlier generation to roll back to")
+        name = older[-1]
+    elif name not in names:
+        raise ValueError(f"unknown generation: {name}")
+    _set_pointer(root, name)
+    return name
+
+
+def discard(gen_dir: str) -> None:
+    """Remove an unpublished build after a failure."""
+    shutil.rmtree(gen_dir, ignore_errors=True)
@@ -0,0 +1,144 @@
+"""Versioned binary container for the vector store's flat arrays.
+
+Layout::
+
+    MAGIC | section bytes (each padded to 8) ... | footer JSON | footer length (u64 LE) | MAGIC
+
+The footer describes every section (``typecode``, byte ``offset``, item
+``count``) plus free-form ``meta``. Sections are exposed as ``memoryview``
+casts over a read-only ``mmap`` so opening a file costs no parsing and the
+pages are shared between processes mapping the same file.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import Any, Dict, List, Optional
+
+MAGIC = b"VSIDX\x00\x00\x01"
+FORMAT_VERSION = 1
+_ALIGN = 8
+
+
+class IndexFormatError(ValueError):
+    pass
+
+
+class IndexWriter:
+    """Write sections sequentially, then publish the file atomically on close."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp = path + ".tmp"
+        self._f = open(self._tmp, "wb")
+        self._f.write(MAGIC)
+        self._sections: Dict[str, Dict[str, Any]] = {}
+        self._open: Optional[str] = None
+
+    def _pad(self) -> None:
+        rem = self._f.tell() % _ALIGN
+        if rem:
+            self._f.write(b"\x00" * (_ALIGN - rem))
+
+    def begin(self, name: str, typecode: str) -> None:
+        """Start a section that is filled incrementally with :meth:`extend`."""
+        if self._open is not None:
+            raise RuntimeError(f"section {self._open!r} still open")
+        if name in self._sections:
+            raise ValueError(f"duplicate section: {name}")
+        self._pad()
+        self._sections[name] = {"typecode": typecode, "offset": self._f.tell(), "count": 0}
+        self._open = name
+
+    def extend(self, data) -> None:
+        """Append an ``array``/bytes-like buffer whose items match the section typecode."""
+        sec = self._sections[self._open]
+        mv = memoryview(data)
+        if mv.format != sec["typecode"] and not (sec["typecode"] == "B" and mv.itemsize == 1):
+            raise TypeError(f"section {self._open!r} expects {sec['typecode']!r}, got {mv.format!r}")
+        self._f.write(mv)
+        sec["count"] += len(mv)
+
+    def end(self) -> None:
+        self._open = None
+
+    def add(self, name: str, typecode: str, data) -> None:
+        self.begin(name, typecode)
+        self.extend(data)
+        self.end()
+
+    def add_file(self, name: str, typecode: str, src_path: str) -> None:
+        """Copy a raw scratch file of ``typecode`` items in as a section."""
+        itemsize = struct.calcsize(typecode)
+        self.begin(name, typecode)
+        with open(src_path, "rb") as src:
+            for block in iter(lambda: src.read(1 << 20), b""):
+                self._f.write(block)
+                self._sections[name]["count"] += len(block)
+        self.end()
+        count = self._sections[name]["count"]
+        if count % itemsize:
+            raise IndexFormatError(f"{src_path} is not a whole number of {typecode!r} items")
+        self._sections[name]["count"] = count // itemsize
+
+    def close(self, meta: Optional[Dict[str, Any]] = None) -> None:
+        footer = {
+            "version": FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "sections": self._sections,
+            "meta": meta or {},
+        }
+        raw = json.dumps(footer).encode("utf-8")
+        self._f.write(raw)
+        self._f.write(struct.pack("<Q", len(raw)))
+        self._f.write(MAGIC)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        self._f.close()
+        try:
+            os.remove(self._tmp)
+        except OSError:
+            pass
+
+
+class IndexFile:
+    """Read-only, memory-mapped view of a file written by :class:`IndexWriter`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        tail = len(MAGIC) + 8
+        if len(mm) < len(MAGIC) + tail or mm[: len(MAGIC)] != MAGIC or mm[-len(MAGIC):] != MAGIC:
+            raise IndexFormatError(f"not a vector index file: {path}")
+        (footer_len,) = struct.unpack("<Q", mm[-tail:-len(MAGIC)])
+        footer = json.loads(mm[-tail - footer_len:-tail].decode("utf-8"))
+        if footer.get("version") != FORMAT_VERSION:
+            raise IndexFormatError(
+                f"unsupported index version {footer.get('version')} (expected {FORMAT_VERSION})"
+            )
+        if footer.get("byteorder") != sys.byteorder:
+            raise IndexFormatError(f"index written with {footer.get('byteorder')}-endian arrays")
+        self.meta: Dict[str, Any] = footer.get("meta", {})
+        self._sections: Dict[str, Dict[str, Any]] = footer["sections"]
+        self._buf = memoryview(mm)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sections
+
+    def names(self) -> List[str]:
+        """Section names in file order."""
+        return sorted(self._sections, key=lambda name: self._sections[name]["offset"])
+
+    def section(self, name: str) -> memoryview:
+        sec = self._sections[name]
+        start = sec["offset"]
+        end = start + sec["count"] * struct.calcsize(sec["typecode"])
+        return self._buf[start:end].cast(sec["typecode"])
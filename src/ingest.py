@@ -1,7 +1,21 @@
+import argparse
 import os
-import json
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from glob import glob
-from typing import List, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+try:  # POSIX; without it only the in-process job guard applies
+    import fcntl
+except ImportError:  # pragma: no cover - platform dependent
+    fcntl = None
 
 from .text_extraction import (
     extract_text_from_html,
@@ -9,8 +23,34 @@ from .text_extraction import (
     extract_text_from_markdown,
 )
 from .chunking import chunk_text
+from .doc_table import publish_build
+from .generations import (
+    current_dir,
+    discard,
+    fork_generation,
+    new_generation_dir,
+    new_segment_dir,
+    next_generation,
+    read_segments,
+    write_segments,
+)
+from .index_format import IndexFile
+from .manifest import file_sha256, file_stat, load_manifest, save_manifest
+from .quantize import VALUE_CODECS
+from .shards import ShardTable
+from .stopwords import STOP_WORD_LISTS, read_stop_words
+from .text_store import TEXT_CODECS, TextStore
 from .tfidf import TfidfVectorizer
-from .vector_store import _sparse_norm
+from .vocab import VOCAB_FILE, vectorizer_file
+from .vector_store import (
+    BinaryIndexBuilder,
+    VectorRecord,
+    VectorStore,
+    _sparse_norm,
+    read_meta,
+    write_binary_index,
+    write_meta,
+)
 
 
 def find_input_files() -> Tuple[List[str], List[str], List[str]]:
@@ -33,87 +73,869 @@ def ensure_dirs():
         os.makedirs(p, exist_ok=True)
 
 
-def ingest():
+def _extract(path: str, kind: str) -> str:
+    if kind == "pdf":
+        return extract_text_from_pdf(path)
+    try:
+        if kind == "html":
+            return extract_text_from_html(path)
+        return extract_text_from_markdown(path)
+    except Exception:
+        return ""
+
+
+def _chunk_file(path: str, kind: str) -> Optional[List[Tuple[int, str]]]:
+    """(chunk_id, text) pairs for one input file, or None if a PDF could not be read."""
+    text = _extract(path, kind)
+    if kind == "pdf" and not text:
+        return None
+    if not text.strip():
+        return []
+    chunks = chunk_text(text, max_words=300, overlap=50)
+    return [(i, ch) for i, ch in enumerate(chunks) if ch.strip()]
+
+
+FileChunks = List[Tuple[int, str, Dict[str, int]]]  # (chunk_id, text, term counts)
+
+
+def _process_file(path: str, kind: str) -> Tuple[str, Optional[FileChunks], Dict[str, int]]:
+    """Extract, chunk and count terms for one file; also returns its partial df.
+
+    Runs in worker processes when ingesting with several workers.
+    """
+    chunks = _chunk_file(path, kind)
+    if chunks is None:
+        return path, None, {}
+    out: FileChunks = []
+    df: Dict[str, int] = {}
+    for cid, text in chunks:
+        counts = TfidfVectorizer.count_terms(text)
+        for tok in counts:
+            df[tok] = df.get(tok, 0) + 1
+        out.append((cid, text, counts))
+    return path, out, df
+
+
+def _process_files(
+    files: List[Tuple[str, str]], workers: int
+) -> Iterator[Tuple[str, Optional[FileChunks], Dict[str, int]]]:
+    if workers <= 1 or len(files) <= 1:
+        for path, kind in files:
+            yield _process_file(path, kind)
+        return
+    # Keep a bounded window of files in flight so finished results never pile up
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path, kind in files:
+            pending.append(pool.submit(_process_file, path, kind))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def resolve_workers(workers: Optional[int] = None) -> int:
+    """Explicit value, else $INGEST_WORKERS, else 1; 0 means one per CPU."""
+    if workers is None:
+        try:
+            workers = int(os.environ.get("INGEST_WORKERS", "1"))
+        except ValueError:
+            workers = 1
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def _load_previous(root: str, manifest: Dict[str, Dict]) -> Optional[VectorStore]:
+    """The current store if it can be updated incrementally, else None (full rebuild)."""
+    if not manifest:
+        return None
+    store = VectorStore(root)
+    try:
+        store.load()
+    except (OSError, ValueError):
+        return None
+    vec = store.vectorizer
+    if vec is None or len(vec.df_) != len(vec.vocabulary_):
+        return None
+    if any(e["chunk_start"] + e["chunk_count"] > len(store) for e in manifest.values()):
+        return None
+    return store
+
+
+def _current_text_codec(build_dir: str) -> str:
+    try:
+        return TextStore(os.path.join(build_dir, "texts.bin")).codec
+    except (OSError, ValueError):
+        return "none"
+
+
+def _current_value_codec(build_dir: str) -> str:
+    try:
+        return IndexFile(os.path.join(build_dir, "index.bin")).meta.get("value_codec", "f32")
+    except (OSError, ValueError):
+        return "f32"
+
+
+def _current_shards(build_dir: str) -> int:
+    try:
+        table = ShardTable.open(os.path.join(build_dir, "shards.bin"))
+    except (OSError, ValueError):
+        return 1
+    return table.n_shards if table is not None else 1
+
+
+def _current_pruning(build_dir: str) -> Dict[str, Any]:
+    """Vocabulary pruning settings of the current vectorizer (none for older stores)."""
+    try:
+        return TfidfVectorizer.load(vectorizer_file(build_dir)).pruning_params()
+    except (OSError, ValueError):
+        return TfidfVectorizer().pruning_params()
+
+
+def _resolve_pruning(build_dir: str, pruning: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+    """(settings for this ingest, whether they differ from the current ones).
+
+    ``pruning`` overrides some of the current settings; the rest are kept.
+    """
+    current = _current_pruning(build_dir)
+    resolved = TfidfVectorizer(**dict(current, **(pruning or {}))).pruning_params()
+    return resolved, resolved != current
+
+
+# Called as progress(stage, done, total) with stage "extract", "index" or "finalize".
+ProgressCallback = Callable[[str, int, int], None]
+
+
+class IngestBusyError(RuntimeError):
+    pass
+
+
+@contextmanager
+def _ingest_lock(root: str):
+    """Exclusive lock on the store for the duration of one ingest (any process)."""
+    with open(os.path.join(root, ".ingest.lock"), "a") as f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise IngestBusyError("another ingest is already running") from None
+        yield
+
+
+def resolve_max_segments() -> int:
+    """$MAX_SEGMENTS (default 4): an append leaving more segments starts a background merge."""
+    try:
+        return max(1, int(os.environ.get("MAX_SEGMENTS", "4")))
+    except ValueError:
+        return 4
+
+
+def ingest(
+    full: bool = False,
+    workers: Optional[int] = None,
+    text_codec: Optional[str] = None,
+    shards: Optional[int] = None,
+    progress: Optional[ProgressCallback] = None,
+    append: bool = False,
+    value_codec: Optional[str] = None,
+    pruning: Optional[Dict[str, Any]] = None,
+):
+    """Build or update the vector store from ``input/``.
+
+    Files whose size, mtime and content hash match ``manifest.json`` are not
+    re-extracted: their rows are carried over from the current index, with term
+    ids remapped and weights rescaled to the updated IDF. Document frequencies
+    are adjusted by subtracting removed chunks and adding new ones, so nothing
+    unchanged is re-tokenized. ``full=True`` ignores the manifest.
+
+    Extraction, chunking and term counting of changed files are fanned out to
+    ``workers`` processes (see :func:`resolve_workers`); their partial
+    document frequencies are merged here.
+
+    Chunk text goes to texts.bin, zlib-compressed in blocks when
+    ``text_codec="zlib"``; by default the current store's codec is kept.
+    Likewise ``value_codec="u8"`` stores the TF-IDF weights as 8-bit values
+    with per-chunk scales (see ``quantize``) and ``"f32"`` as float32.
+
+    ``shards > 1`` splits the rows into that many shards that queries score in
+    parallel worker processes; by default the current shard count is kept.
+
+    ``pruning`` sets some of the vectorizer's ``min_df``, ``max_df``,
+    ``max_features`` and ``stop_words`` (see ``TfidfVectorizer``); the others
+    keep their current values. Changing them rebuilds in full. What was
+    pruned is recorded under ``vocabulary`` in meta.json.
+
+    The build is written to a new generation directory and published by
+    flipping the ``CURRENT`` pointer (see ``generations``), so readers never
+    see a partial store. Only one ingest runs at a time: a second one raises
+    IngestBusyError.
+    ``progress`` is called as files are extracted and written.
+
+    ``append=True`` leaves the current index files alone: new and modified
+    files go into a new segment, and the old rows of modified and removed
+    files are tombstoned (see :func:`_append`). Once there are more than
+    ``MAX_SEGMENTS`` segments a merge is started in the background.
+    """
+    workers = resolve_workers(workers)
     ensure_dirs()
+    root = os.path.join("data", "vector_store")
+    progress = progress or (lambda stage, done, total: None)
+    with _ingest_lock(root):
+        if append and not full:
+            n_segments = _append(root, workers, text_codec, value_codec, pruning, progress)
+        else:
+            n_segments = 0
+            _ingest(root, full, workers, text_codec, value_codec, shards, pruning, progress)
+    if n_segments > resolve_max_segments():
+        # A separate process, so it outlives this one and takes the lock itself.
+        subprocess.Popen([sys.executable, "-m", "src.ingest", "--merge"])
+        print(f"[info] {n_segments} segments; merging in the background.")
+
+
+def _input_files() -> List[Tuple[str, str]]:
     html_files, md_files, pdf_files = find_input_files()
-    docs: List[Tuple[str, str]] = []  # (path, text)
+    return (
+        [(p, "html") for p in html_files]
+        + [(p, "md") for p in md_files]
+        + [(p, "pdf") for p in pdf_files]
+    )
 
-    # HTML
-    for path in html_files:
-        try:
-            text = extract_text_from_html(path)
-        except Exception:
-            text = ""
-        if text.strip():
-            docs.append((path, text))
-
-    # Markdown
-    for path in md_files:
-        try:
-            text = extract_text_from_markdown(path)
-        except Exception:
-            text = ""
-        if text.strip():
-            docs.append((path, text))
-
-    # PDF
-    for path in pdf_files:
-        text = extract_text_from_pdf(path)
-        if not text:
-            print(f"[warn] Skipping PDF (no parser available or empty): {path}")
+
+def _classify(
+    files: List[Tuple[str, str]], manifest: Dict[str, Dict]
+) -> Tuple[Dict[str, Dict], List[Tuple[str, str]], List[str]]:
+    """Stats of every input file, the new or modified ones, and manifest paths that are gone."""
+    stats: Dict[str, Dict] = {}
+    changed: List[Tuple[str, str]] = []
+    for path, kind in files:
+        st = file_stat(path)
+        entry = manifest.get(path)
+        if entry and entry["size"] == st["size"] and entry["mtime_ns"] == st["mtime_ns"]:
+            stats[path] = dict(entry)
             continue
-        docs.append((path, text))
-
-    # Chunk
-    chunked_texts: List[str] = []
-    chunk_meta: List[Tuple[str, int]] = []  # (path, chunk_id)
-    for path, text in docs:
-        chunks = chunk_text(text, max_words=300, overlap=50)
-        for i, ch in enumerate(chunks):
-            if ch.strip():
-                chunked_texts.append(ch)
-                chunk_meta.append((path, i))
-
-    if not chunked_texts:
-        print("[info] No text chunks found. Place files under input/html, input/md, or input/PDF.")
-        return
+        digest = file_sha256(path)
+        if entry and entry["sha256"] == digest:
+            stats[path] = dict(entry, **st)  # touched but identical
+            continue
+        stats[path] = dict(st, sha256=digest)
+        changed.append((path, kind))
+    present = {path for path, _ in files}
+    return stats, changed, [path for path in manifest if path not in present]
 
-    # Fit TF-IDF and transform
-    vectorizer = TfidfVectorizer()
-    vectorizer.fit(chunked_texts)
-    sparse_vecs = vectorizer.transform_sparse(chunked_texts)
 
-    # Persist vectorizer
+def compact() -> Optional[int]:
+    """Fold ``deletes.log`` and any segments into a new generation.
+
+    Returns the number of deleted chunks dropped, or None if there was
+    nothing to compact. Holds the ingest lock so it cannot race a build;
+    queries keep being served from the current generation until the
+    compacted one is published.
+    """
     root = os.path.join("data", "vector_store")
-    vectorizer.save(os.path.join(root, "vectorizer.json"))
-
-    # Persist index as JSONL
-    index_path = os.path.join(root, "index.jsonl")
-    with open(index_path, "w", encoding="utf-8") as f:
-        for (indices, values), (path, cid), text in zip(sparse_vecs, chunk_meta, chunked_texts):
-            rec = {
-                "path": path,
-                "chunk_id": cid,
-                "text": text,
-                "embedding": {
-                    "indices": indices,
-                    "values": values,
-                    "norm": _sparse_norm(values),
-                },
-            }
-            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
-
-    # Meta
-    meta = {
-        "total_files": len(docs),
-        "total_chunks": len(chunked_texts),
-    }
-    with open(os.path.join(root, "meta.json"), "w", encoding="utf-8") as f:
-        json.dump(meta, f)
-
-    print(f"[ok] Ingested {len(docs)} files into {len(chunked_texts)} chunks.")
+    os.makedirs(root, exist_ok=True)
+    with _ingest_lock(root):
+        store = VectorStore(root)
+        store.load()
+        return store.compact()
+
+
+def _ingest(
+    root: str,
+    full: bool,
+    workers: int,
+    text_codec: Optional[str],
+    value_codec: Optional[str],
+    shards: Optional[int],
+    pruning: Optional[Dict[str, Any]],
+    progress: ProgressCallback,
+) -> None:
+    current = current_dir(root)
+    pruning, changed_pruning = _resolve_pruning(current, pruning)
+    if changed_pruning and not full:
+        print("[info] Vocabulary pruning settings changed; rebuilding in full.")
+        full = True
+    if text_codec is None:
+        text_codec = _current_text_codec(current)
+    if value_codec is None:
+        value_codec = _current_value_codec(current)
+    if shards is None:
+        shards = _current_shards(current)
+    files = _input_files()
+
+    manifest = {} if full else load_manifest(current)
+    previous = _load_previous(root, manifest)
+    if previous is None:
+        manifest = {}
+
+    stats, changed, deleted = _classify(files, manifest)
+    if previous is not None and (changed or deleted) and TfidfVectorizer(**pruning).prunes_by_frequency():
+        # Pruned terms have no stored counts to update, so a pruned vocabulary
+        # can only be judged again on every chunk. Files whose chunks were all
+        # deleted keep their empty entry and stay out.
+        print("[info] Vocabulary pruning depends on chunk frequencies; rebuilding in full.")
+        modified = {path for path, _ in changed}
+        manifest = {
+            path: entry for path, entry in manifest.items()
+            if path in stats and path not in modified and not entry["chunk_count"]
+        }
+        previous, changed, deleted = None, [(p, kind) for p, kind in files if p not in manifest], []
+    stale = [path for path, _ in changed if path in manifest] + deleted
+
+    if previous is not None and not changed and not deleted:
+        _republish(root, previous, manifest, stats, shards)
+        print(f"[ok] Vector store up to date ({len(manifest)} files, {len(previous)} chunks).")
+        return
+
+    # Document frequencies: previous counts minus removed chunks plus new ones
+    df: Dict[str, int] = {}
+    n_docs = 0
+    if previous is not None and (previous.n_deleted or previous.n_segments):
+        df, n_docs = _carried_frequencies(previous, manifest, stale)
+    elif previous is not None:
+        old_vec = previous.vectorizer
+        df = old_vec.document_frequencies()
+        n_docs = old_vec.n_docs_
+        for path in stale:
+            entry = manifest[path]
+            for row in range(entry["chunk_start"], entry["chunk_start"] + entry["chunk_count"]):
+                for t in previous.record(row).indices:
+                    df[old_vec.vocabulary_[t]] -= 1
+                n_docs -= 1
+
+    generation = next_generation(root, int(read_meta(current).get("generation", 0)))
+    gen_dir = new_generation_dir(root, generation)
+    scratch = tempfile.mkdtemp(prefix=".ingest-", dir=root)
+    try:
+        spill_path = os.path.join(scratch, "chunks.pickle")
+        fresh, n_new = _spill_changed(changed, workers, spill_path, df, stats, progress)
+        n_docs += n_new
+        if n_docs <= 0:
+            print("[info] No text chunks found. Place files under input/html, input/md, or input/PDF.")
+            discard(gen_dir)
+            return
+        if previous is not None:
+            vectorizer = previous.vectorizer.refit(df, n_docs)
+        else:
+            vectorizer = TfidfVectorizer.from_document_frequencies(df, n_docs, **pruning)
+        del df
+        new_manifest, total_chunks = _write_index(
+            gen_dir, vectorizer, files, stats, fresh, spill_path, manifest, previous, text_codec, progress
+        )
+        # BM25 impacts and per-term upper bounds for pruned top-k retrieval
+        progress("finalize", 0, 1)
+        store = VectorStore(root)
+        store.load(gen_dir)
+        store.write_bm25()
+        store.write_shards(shards)
+        store.quantize(value_codec)
+        store.write_docs(new_manifest)
+        write_meta(
+            gen_dir, generation, total_files=len(new_manifest), total_chunks=total_chunks,
+            vocabulary=vectorizer.pruning_,
+        )
+        save_manifest(gen_dir, new_manifest)
+    except BaseException:
+        discard(gen_dir)
+        raise
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    if previous is None:
+        publish_build(root, gen_dir)
+    else:
+        publish_build(root, gen_dir, previous.dir, previous.tombstones(), [p for p, _ in changed] + deleted)
+    progress("finalize", 1, 1)
+
+    if previous is None:
+        print(f"[ok] Ingested {len(new_manifest)} files into {total_chunks} chunks.")
+    else:
+        print(
+            f"[ok] Updated {len(new_manifest)} files / {total_chunks} chunks: "
+            f"{len(fresh)} new or modified, {len(deleted)} removed, "
+            f"{len(new_manifest) - len(fresh)} unchanged."
+        )
     print(f"[ok] Vector store ready at {root}")
 
 
+def _republish(root: str, store: VectorStore, manifest: Dict[str, Dict], stats: Dict[str, Dict],
+               shards: Optional[int] = None) -> None:
+    """Publish ``store``'s generation again with the new mtimes of touched files and/or resharded.
+
+    The generation is forked rather than edited, since published generations
+    never change; with nothing to update nothing is written.
+    """
+    refreshed = {p: stats[p] for p in manifest}
+    reshard = shards is not None and shards != store.n_shards
+    if refreshed == manifest and not reshard:
+        return
+    generation = next_generation(root, store.generation)
+    gen_dir = fork_generation(root, generation)
+    try:
+        if reshard:
+            forked = VectorStore(root)
+            forked.load(gen_dir)
+            forked.write_shards(shards)
+        save_manifest(gen_dir, refreshed)
+        meta = read_meta(store.dir)
+        meta.pop("generation", None)
+        write_meta(gen_dir, generation, **meta)
+    except BaseException:
+        discard(gen_dir)
+        raise
+    publish_build(root, gen_dir, store.dir, store.tombstones())
+    if reshard:
+        print(f"[ok] Resharded into {forked.n_shards} shards.")
+
+
+def _carried_frequencies(
+    previous: VectorStore, manifest: Dict[str, Dict], stale: List[str]
+) -> Tuple[Dict[str, int], int]:
+    """Chunk frequencies and count of the rows an ingest carries over from ``previous``.
+
+    Counted from the rows themselves: with deleted rows or segments the
+    stored frequencies may still include chunks that are gone.
+    """
+    vocabulary = previous.vectorizer.vocabulary_
+    counts = array("q", [0]) * len(vocabulary)
+    n_docs = 0
+    stale_paths = set(stale)
+    for path, entry in manifest.items():
+        if path in stale_paths:
+            continue
+        for row in range(entry["chunk_start"], entry["chunk_start"] + entry["chunk_count"]):
+            if previous._is_deleted(row):
+                continue
+            for t in previous.record(row).indices:
+                counts[t] += 1
+            n_docs += 1
+    return dict(zip(vocabulary, counts)), n_docs
+
+
+def _append(
+    root: str, workers: int, text_codec: Optional[str], value_codec: Optional[str],
+    pruning: Optional[Dict[str, Any]], progress: ProgressCallback,
+) -> int:
+    """Write new and modified files as one new segment; returns the segment count.
+
+    The current generation is forked (its files hard-linked), the rows of
+    modified and removed files are tombstoned in the fork's deletes.log, and
+    the fresh chunks are written to a ``seg-*`` directory with a vectorizer
+    that extends the current one: existing term ids are kept and the global
+    document frequencies updated. Nothing already published is rewritten.
+    Stores that cannot take a segment (no manifest or a legacy index) get a
+    regular ingest instead, and so do a change of the pruning settings and
+    pruning by chunk frequency (see :func:`_ingest`).
+    """
+    current = current_dir(root)
+    manifest = load_manifest(current)
+    store = _load_appendable(root, manifest)
+    pruning_now, changed_pruning = _resolve_pruning(current, pruning)
+    if store is None or changed_pruning or TfidfVectorizer(**pruning_now).prunes_by_frequency():
+        _ingest(root, False, workers, text_codec, value_codec, None, pruning, progress)
+        return 0
+    if text_codec is None:
+        text_codec = store.text_codec
+    if value_codec is None:
+        value_codec = store.value_codec
+    files = _input_files()
+    stats, changed, deleted = _classify(files, manifest)
+    if not changed and not deleted:
+        _republish(root, store, manifest, stats)
+        print(f"[ok] Vector store up to date ({len(manifest)} files, {len(store)} chunks).")
+        return store.n_segments
+    stale = [path for path, _ in changed if path in manifest] + deleted
+
+    vec = store.vectorizer
+    generation = next_generation(root, store.generation)
+    gen_dir = fork_generation(root, generation)
+    scratch = tempfile.mkdtemp(prefix=".ingest-", dir=root)
+    try:
+        forked = VectorStore(root)
+        forked.load(gen_dir)
+        # Document frequencies: current counts minus the stale rows plus new ones
+        df = vec.document_frequencies()
+        n_docs = vec.n_docs_
+        rows = [
+            row for path in stale
+            for row in range(manifest[path]["chunk_start"],
+                             manifest[path]["chunk_start"] + manifest[path]["chunk_count"])
+            if not forked._is_deleted(row)
+        ]
+        for row in rows:
+            for t in forked.record(row).indices:
+                df[vec.vocabulary_[t]] -= 1
+        n_docs -= len(rows)
+        forked.delete_rows(rows)
+
+        spill_path = os.path.join(scratch, "chunks.pickle")
+        fresh, n_new = _spill_changed(changed, workers, spill_path, df, stats, progress)
+        vectorizer = vec.extended(df, n_docs + n_new)
+        del df
+        new_manifest = {p: stats[p] for p in manifest if p in stats and p not in fresh}
+        records: List[VectorRecord] = []
+        start = len(forked)
+        with open(spill_path, "rb") as spill:
+            for done in range(1, len(fresh) + 1):
+                progress("index", done, len(fresh))
+                path, chunks = pickle.load(spill)
+                new_manifest[path] = dict(
+                    stats[path], chunk_start=start + len(records), chunk_count=len(chunks)
+                )
+                for cid, text, counts in chunks:
+                    by_idx = vectorizer.term_id_counts(counts)
+                    indices, values = vectorizer.vectorize_term_ids(by_idx)
+                    records.append(VectorRecord(
+                        path, cid, text, indices, values, _sparse_norm(values), sum(by_idx.values())
+                    ))
+
+        progress("finalize", 0, 1)
+        segments = read_segments(gen_dir) + [
+            _write_segment(root, gen_dir, vectorizer, records, text_codec, value_codec, stats)
+        ]
+        write_segments(gen_dir, segments)
+        scored = VectorStore(root)
+        scored.load(gen_dir)
+        scored.write_part_scores()
+        write_meta(
+            gen_dir, generation, total_files=len(new_manifest),
+            total_chunks=sum(e["chunk_count"] for e in new_manifest.values()),
+            vocabulary=vectorizer.pruning_,
+        )
+        save_manifest(gen_dir, new_manifest)
+    except BaseException:
+        discard(gen_dir)
+        raise
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    publish_build(root, gen_dir, store.dir, store.tombstones(), [p for p, _ in changed] + deleted)
+    progress("finalize", 1, 1)
+    print(
+        f"[ok] Appended segment {len(segments)}: {len(records)} chunks from {len(fresh)} new or "
+        f"modified files; {len(rows)} stale chunks deleted."
+    )
+    return len(segments)
+
+
+def _load_appendable(root: str, manifest: Dict[str, Dict]) -> Optional[VectorStore]:
+    """The current store if a segment can be added to it, else None."""
+    if not manifest:
+        return None
+    store = VectorStore(root)
+    try:
+        store.load()
+    except (OSError, ValueError):
+        return None
+    vec = store.vectorizer
+    if store._index is None or vec is None or len(vec.df_) != len(vec.vocabulary_):
+        return None
+    if any(e["chunk_start"] + e["chunk_count"] > len(store) for e in manifest.values()):
+        return None
+    return store
+
+
+def _write_segment(root: str, gen_dir: str, vectorizer: TfidfVectorizer,
+                   records: List[VectorRecord], text_codec: str, value_codec: str,
+                   stats: Dict[str, Dict]) -> str:
+    """Write ``records`` as a new segment of ``gen_dir``; returns its directory name.
+
+    ``stats`` gives the size and mtime of the segment's files for its docs.json.
+    """
+    seg_dir = new_segment_dir(gen_dir)
+    vectorizer.save(os.path.join(seg_dir, VOCAB_FILE))
+    write_binary_index(
+        os.path.join(seg_dir, "index.bin"), os.path.join(seg_dir, "texts.bin"),
+        len(vectorizer.vocabulary_), records, text_codec=text_codec,
+    )
+    seg = VectorStore(root)
+    seg.load(seg_dir)
+    seg.write_bm25()
+    seg.quantize(value_codec)
+    seg.write_docs(stats)
+    return os.path.basename(seg_dir)
+
+
+def _merge_start(sizes: List[int]) -> int:
+    """First segment of the newest run to merge.
+
+    Going from newest to oldest, a segment joins the run while it holds no
+    more rows than the run so far, so segment sizes grow geometrically with
+    age and each row is rewritten O(log n) times.
+    """
+    first = max(0, len(sizes) - 2)
+    while first > 0 and sizes[first - 1] <= sum(sizes[first:]):
+        first -= 1
+    return first
+
+
+def merge_segments() -> int:
+    """Merge the newest run of segments into one; returns how many were merged.
+
+    Deleted rows of the merged segments are dropped and their weights and
+    norms recomputed with the current IDF. The base index is left alone
+    (only its scores are rewritten, see ``VectorStore.write_part_scores``);
+    :func:`compact` folds everything into it.
+    """
+    root = os.path.join("data", "vector_store")
+    os.makedirs(root, exist_ok=True)
+    with _ingest_lock(root):
+        store = VectorStore(root)
+        store.load()
+        names = read_segments(store.dir)
+        first = _merge_start([len(seg) for seg in store._segments])
+        if len(names) - first < 2:
+            return 0
+        tail_start = store._seg_starts[first]
+        generation = next_generation(root, store.generation)
+        gen_dir = fork_generation(root, generation, exclude=names[first:])
+        try:
+            records: List[VectorRecord] = []
+            ranges: Dict[str, Tuple[int, int]] = {}
+            for row in range(tail_start, len(store)):
+                if store._is_deleted(row):
+                    continue
+                rec = store.rewritten_record(row)
+                start, count = ranges.get(rec.path, (tail_start + len(records), 0))
+                ranges[rec.path] = (start, count + 1)
+                records.append(rec)
+            name = _write_segment(
+                root, gen_dir, store.vectorizer, records, store.text_codec,
+                store._segments[-1].value_codec, store.docs().docs(),
+            )
+            write_segments(gen_dir, names[:first] + [name])
+            scored = VectorStore(root)
+            scored.load(gen_dir)
+            scored.write_part_scores()
+            manifest = load_manifest(store.dir)
+            for path, entry in manifest.items():
+                if entry["chunk_start"] >= tail_start:  # its rows moved into the merged segment
+                    start, count = ranges.get(path, (tail_start + len(records), 0))
+                    entry.update(chunk_start=start, chunk_count=count)
+            save_manifest(gen_dir, manifest)
+            meta = read_meta(store.dir)
+            meta.pop("generation", None)
+            write_meta(gen_dir, generation, **meta)
+        except BaseException:
+            discard(gen_dir)
+            raise
+        publish_build(root, gen_dir, store.dir, store.tombstones())
+        return len(names) - first
+
+
+def _spill_changed(
+    changed: List[Tuple[str, str]],
+    workers: int,
+    spill_path: str,
+    df: Dict[str, int],
+    stats: Dict[str, Dict],
+    progress: ProgressCallback,
+) -> Tuple[Set[str], int]:
+    """Pass 1: stream changed files through extraction, chunking and term
+    counting into ``spill_path``; only ``df`` (updated in place) stays in memory.
+    """
+    fresh: Set[str] = set()
+    n_chunks = 0
+    progress("extract", 0, len(changed))
+    with open(spill_path, "wb") as spill:
+        for done, (path, chunks, partial_df) in enumerate(_process_files(changed, workers), 1):
+            progress("extract", done, len(changed))
+            if chunks is None:
+                print(f"[warn] Skipping PDF (no parser available or empty): {path}")
+                stats.pop(path)  # retried on the next run
+                continue
+            pickle.dump((path, chunks), spill, protocol=pickle.HIGHEST_PROTOCOL)
+            fresh.add(path)
+            for tok, c in partial_df.items():
+                df[tok] = df.get(tok, 0) + c
+            n_chunks += len(chunks)
+    return fresh, n_chunks
+
+
+def _write_index(
+    build_dir: str,
+    vectorizer: TfidfVectorizer,
+    files: List[Tuple[str, str]],
+    stats: Dict[str, Dict],
+    fresh: Set[str],
+    spill_path: str,
+    manifest: Dict[str, Dict],
+    previous: Optional[VectorStore],
+    text_codec: str,
+    progress: ProgressCallback,
+) -> Tuple[Dict[str, Dict], int]:
+    """Pass 2: write rows in input order straight into index.bin.
+
+    Changed files are read back from the spill file (they were spilled in the
+    same relative order); the live rows of unchanged files are copied from
+    ``previous`` with term ids remapped and weights recomputed from their term
+    counts with the new IDF (see ``VectorStore.rewritten_record``). Deleted
+    rows are dropped.
+    """
+    remap: List[int] = []  # old term id -> new term id
+    if previous is not None:
+        get = vectorizer.vocab_index.get
+        remap = [get(term, -1) for term in previous.vectorizer.vocabulary_]
+
+    builder = BinaryIndexBuilder(
+        os.path.join(build_dir, "index.bin"),
+        os.path.join(build_dir, "texts.bin"),
+        vectorizer.df_,
+        text_codec=text_codec,
+    )
+    new_manifest: Dict[str, Dict] = {}
+    try:
+        with open(spill_path, "rb") as spill:
+            for done, (path, _) in enumerate(files, 1):
+                progress("index", done, len(files))
+                if path not in stats:
+                    continue
+                start = builder.n_rows
+                if path in fresh:
+                    spilled_path, chunks = pickle.load(spill)
+                    assert spilled_path == path
+                    for cid, text, counts in chunks:
+                        by_idx = vectorizer.term_id_counts(counts)
+                        indices, values = vectorizer.vectorize_term_ids(by_idx)
+                        builder.add(path, cid, text, indices, values, _sparse_norm(values),
+                                    sum(by_idx.values()))
+                else:
+                    entry = manifest[path]
+                    for row in range(entry["chunk_start"], entry["chunk_start"] + entry["chunk_count"]):
+                        if previous._is_deleted(row):
+                            continue
+                        # Terms pruned from the new vocabulary map to -1 and are left out.
+                        rec = previous.rewritten_record(row, vectorizer, remap)
+                        builder.add(path, rec.chunk_id, rec.text, rec.indices, rec.values, rec.norm,
+                                    rec.length)
+                new_manifest[path] = dict(
+                    stats[path], chunk_start=start, chunk_count=builder.n_rows - start
+                )
+        total_chunks = builder.n_rows
+        # Persist vectorizer and index (binary, memory-mappable)
+        vectorizer.save(os.path.join(build_dir, VOCAB_FILE))
+        builder.close()
+    except BaseException:
+        builder.abort()
+        raise
+    return new_manifest, total_chunks
+
+
+def _df_limit(value: str):
+    """``--min-df``/``--max-df``: a chunk count, or a fraction of the chunks when it has a point."""
+    return float(value) if "." in value else int(value)
+
+
+def _pruning_args(args) -> Optional[Dict[str, Any]]:
+    pruning: Dict[str, Any] = {}
+    if args.min_df is not None:
+        pruning["min_df"] = args.min_df
+    if args.max_df is not None:
+        pruning["max_df"] = args.max_df
+    if args.max_features is not None:
+        pruning["max_features"] = args.max_features or None
+    if args.stop_words is not None:
+        if args.stop_words == "none":
+            pruning["stop_words"] = None
+        elif args.stop_words in STOP_WORD_LISTS:
+            pruning["stop_words"] = args.stop_words
+        else:
+            pruning["stop_words"] = read_stop_words(args.stop_words)
+    return pruning or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest input/ into the vector store")
+    parser.add_argument(
+        "--full", action="store_true", help="Ignore the manifest and rebuild every file"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes for extraction/tokenization (0 = one per CPU; default $INGEST_WORKERS or 1)",
+    )
+    parser.add_argument(
+        "--text-codec",
+        choices=TEXT_CODECS,
+        default=None,
+        help="Chunk text storage in texts.bin (default: keep the current store's codec)",
+    )
+    parser.add_argument(
+        "--value-codec",
+        choices=VALUE_CODECS,
+        default=None,
+        help="TF-IDF weight storage in index.bin: float32 or 8-bit with per-chunk scales "
+        "(default: keep the current store's codec)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        help="Split the index into N shards searched in parallel (default: keep the current count)",
+    )
+    parser.add_argument(
+        "--min-df",
+        type=_df_limit,
+        default=None,
+        help="Drop terms in fewer chunks than this (a count, or a fraction like 0.001); "
+        "default: keep the current setting (1)",
+    )
+    parser.add_argument(
+        "--max-df",
+        type=_df_limit,
+        default=None,
+        help="Drop terms in more chunks than this (a count, or a fraction like 0.5); "
+        "default: keep the current setting (1.0)",
+    )
+    parser.add_argument(
+        "--max-features",
+        type=int,
+        default=None,
+        help="Keep only the N terms in the most chunks (0 = no limit; default: keep the current setting)",
+    )
+    parser.add_argument(
+        "--stop-words",
+        default=None,
+        metavar="LIST|FILE",
+        help=f"Never index these words: {', '.join(sorted(STOP_WORD_LISTS))}, a file of words, "
+        "or 'none' (default: keep the current setting)",
+    )
+    parser.add_argument(
+        "--append",
+        action="store_true",
+        help="Write new and modified files as a new segment instead of rewriting the index",
+    )
+    parser.add_argument(
+        "--merge", action="store_true", help="Only merge the newest run of small segments"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Only fold deleted chunks (deletes.log) and segments into a new generation",
+    )
+    args = parser.parse_args()
+    try:
+        pruning = _pruning_args(args)
+        TfidfVectorizer(**(pruning or {}))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    try:
+        if args.compact:
+            dropped = compact()
+            if dropped is None:
+                print("Nothing to compact.")
+            else:
+                print(f"Compacted; dropped {dropped} deleted chunk(s).")
+            return
+        if args.merge:
+            print(f"Merged {merge_segments()} segment(s).")
+            return
+        ingest(
+            full=args.full, workers=args.workers, text_codec=args.text_codec, shards=args.shards,
+            append=args.append, value_codec=args.value_codec, pruning=pruning,
+        )
+    except IngestBusyError as e:
+        raise SystemExit(f"[error] {e}")
+
+
 if __name__ == "__main__":
-    ingest()
+    main()
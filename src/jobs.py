@@ -0,0 +1,151 @@
+"""Background ingest jobs for the servers.
+
+Each job runs :func:`src.ingest.ingest` in a spawned child process, so a long
+ingest neither blocks the request that started it nor competes with queries
+for the server's GIL. The child reports progress over a queue; a thread in
+the server process follows it and updates the job record.
+
+The child is not daemonic, because ingest fans extraction out to its own
+process pool and daemonic processes cannot have children. :meth:`IngestJobs.shutdown`
+terminates it instead when the server exits.
+"""
+
+import atexit
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Optional
+
+from .ingest import IngestBusyError, ingest
+from .store_manager import get_default_manager
+
+
+@dataclass
+class IngestJob:
+    id: str
+    full: bool = False
+    append: bool = False
+    status: str = "queued"  # queued | running | succeeded | failed
+    stage: str = ""
+    done: int = 0
+    total: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def _run_in_child(full: bool, append: bool, events) -> None:
+    try:
+        ingest(
+            full=full,
+            append=append,
+            progress=lambda stage, done, total: events.put(("progress", stage, done, total)),
+        )
+    except BaseException as e:
+        events.put(("error", f"{type(e).__name__}: {e}"))
+        raise
+    events.put(("done",))
+
+
+class IngestJobs:
+    """At most one running ingest; finished jobs are kept for status lookups."""
+
+    def __init__(self, on_success: Optional[Callable[[], None]] = None, keep: int = 20):
+        self.on_success = on_success
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._running: Optional[IngestJob] = None
+        self._proc = None
+
+    def start(self, full: bool = False, append: bool = False) -> IngestJob:
+        """Queue an ingest; raises IngestBusyError while another one is running."""
+        with self._lock:
+            if self._running is not None:
+                raise IngestBusyError(f"ingest job {self._running.id} is already running")
+            job = IngestJob(id=uuid.uuid4().hex, full=full, append=append)
+            self._running = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                self._jobs.popitem(last=False)
+        threading.Thread(target=self._follow, args=(job,), name=f"ingest-{job.id}", daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def running(self) -> Optional[IngestJob]:
+        return self._running
+
+    def list(self) -> List[IngestJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _follow(self, job: IngestJob) -> None:
+        ctx = get_context("spawn")
+        events = ctx.Queue()
+        proc = ctx.Process(target=_run_in_child, args=(job.full, job.append, events))
+        job.status, job.started_at = "running", time.time()
+        try:
+            proc.start()
+            self._proc = proc
+            finished = False
+            while not finished:
+                try:
+                    event = events.get(timeout=0.5)
+                except queue.Empty:
+                    if not proc.is_alive():
+                        break
+                    continue
+                if event[0] == "progress":
+                    job.stage, job.done, job.total = event[1:]
+                elif event[0] == "error":
+                    job.error = event[1]
+                else:
+                    finished = True
+            proc.join()
+            if job.error is None and proc.exitcode != 0:
+                job.error = f"ingest process exited with code {proc.exitcode}"
+            if job.error is None and self.on_success is not None:
+                self.on_success()
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            job.status = "failed" if job.error else "succeeded"
+            job.finished_at = time.time()
+            with self._lock:
+                self._running = None
+                self._proc = None
+
+    def shutdown(self) -> None:
+        """Terminate a running ingest child; its unpublished build is left for pruning."""
+        with self._lock:
+            proc = self._proc
+        if proc is not None and proc.is_alive():
+            proc.terminate()
+            proc.join(5)
+
+
+_default_jobs: Optional[IngestJobs] = None
+_default_lock = threading.Lock()
+
+
+def get_default_jobs() -> IngestJobs:
+    """Process-wide job runner that reloads the default store after each ingest."""
+    global _default_jobs
+    if _default_jobs is None:
+        with _default_lock:
+            if _default_jobs is None:
+                _default_jobs = IngestJobs(on_success=lambda: get_default_manager().reload())
+                # Runs before multiprocessing's exit hook, which would wait for the child.
+                atexit.register(_default_jobs.shutdown)
+    return _default_jobs
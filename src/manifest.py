@@ -0,0 +1,43 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(root: str) -> str:
+    return os.path.join(root, "manifest.json")
+
+
+def load_manifest(root: str) -> Dict[str, Dict[str, Any]]:
+    """Per input file: size, mtime_ns, sha256 and its row range (chunk_start, chunk_count)."""
+    try:
+        with open(manifest_path(root), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        return {}
+    return dict(data.get("files", {}))
+
+
+def save_manifest(root: str, files: Dict[str, Dict[str, Any]]) -> None:
+    path = manifest_path(root)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, f)
+    os.replace(tmp, path)
+
+
+def file_stat(path: str) -> Dict[str, int]:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
@@ -6,12 +6,32 @@ from mcp.server import Server
 from mcp import types
 from mcp.server.stdio import stdio_server
 
-from .ingest import ingest as run_ingest
-from .vector_store import load_default_store
+from .ingest import IngestBusyError, ingest as run_ingest
+from .store_manager import get_default_manager
+from .vector_store import SCORING_MODES
 
 
 server = Server("vector-store")
 
+MAX_BATCH = 256
+
+# Filter properties shared by the query tools.
+FILTER_PROPERTIES = {
+    "path_prefix": {
+        "type": "string",
+        "description": "Only search documents whose path starts with this, e.g. input/PDF/policies/.",
+    },
+    "source": {
+        "type": "array",
+        "items": {"type": "string", "enum": ["html", "md", "pdf", "other"]},
+        "description": "Only search documents of these source types.",
+    },
+    "metadata": {
+        "type": "object",
+        "description": "Only search documents whose doc table fields (size, mtime_ns) equal these values.",
+    },
+}
+
 
 @server.list_tools()
 def list_tools() -> List[types.Tool]:
@@ -19,7 +39,21 @@ def list_tools() -> List[types.Tool]:
         types.Tool(
             name="ingest",
             description="Scan input/html, input/md, and input/PDF, build TF-IDF vector store.",
-            inputSchema={"type": "object"},
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "full": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "Rebuild every file instead of only new/changed ones.",
+                    },
+                    "append": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "Add new/changed files as a new segment without rewriting the index.",
+                    },
+                },
+            },
         ),
         types.Tool(
             name="query",
@@ -29,10 +63,48 @@ def list_tools() -> List[types.Tool]:
                 "properties": {
                     "query": {"type": "string"},
                     "k": {"type": "integer", "default": 5, "minimum": 1, "maximum": 50},
+                    "min_score": {
+                        "type": "number",
+                        "description": "Drop chunks scoring below this; omits zero-overlap chunks.",
+                    },
+                    "mode": {
+                        "type": "string",
+                        "enum": ["tfidf", "bm25"],
+                        "default": "tfidf",
+                        "description": "Ranking: TF-IDF cosine or BM25.",
+                    },
+                    **FILTER_PROPERTIES,
                 },
                 "required": ["query"],
             },
         ),
+        types.Tool(
+            name="query_batch",
+            description="Run several queries in one pass; returns one top-k list per query.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "queries": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "maxItems": MAX_BATCH,
+                    },
+                    "k": {"type": "integer", "default": 5, "minimum": 1, "maximum": 50},
+                    "min_score": {
+                        "type": "number",
+                        "description": "Drop chunks scoring below this; omits zero-overlap chunks.",
+                    },
+                    "mode": {
+                        "type": "string",
+                        "enum": ["tfidf", "bm25"],
+                        "default": "tfidf",
+                        "description": "Ranking: TF-IDF cosine or BM25.",
+                    },
+                    **FILTER_PROPERTIES,
+                },
+                "required": ["queries"],
+            },
+        ),
     ]
 
 
@@ -47,13 +119,43 @@ async def call_tool(
     if name == "ingest":
         # Run synchronously; ingestion may take time
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, run_ingest)
+        full = bool(arguments.get("full", False))
+        append = bool(arguments.get("append", False))
+        try:
+            await loop.run_in_executor(None, lambda: run_ingest(full=full, append=append))
+        except IngestBusyError as e:
+            return [
+                types.CallToolResult(isError=True, content=[types.TextContent(type="text", text=str(e))])
+            ]
+        await loop.run_in_executor(None, get_default_manager().reload)
         return [types.CallToolResult(content=[types.TextContent(type="text", text="ingest: ok")])]
 
-    if name == "query":
-        q = str(arguments.get("query", "")).strip()
+    if name in ("query", "query_batch"):
+        if name == "query":
+            queries = [str(arguments.get("query", "")).strip()]
+        else:
+            queries = [str(q).strip() for q in arguments.get("queries") or []]
+            if len(queries) > MAX_BATCH:
+                return [
+                    types.CallToolResult(
+                        isError=True,
+                        content=[
+                            types.TextContent(
+                                type="text", text=f"at most {MAX_BATCH} queries per batch"
+                            )
+                        ],
+                    )
+                ]
         k = int(arguments.get("k", 5))
-        store = load_default_store()
+        min_score = arguments.get("min_score")
+        min_score = float(min_score) if min_score is not None else None
+        mode = str(arguments.get("mode", "tfidf"))
+        filters = {
+            "path_prefix": arguments.get("path_prefix"),
+            "source": arguments.get("source"),
+            "metadata": arguments.get("metadata"),
+        }
+        store = get_default_manager().get()
         if not store.is_ready():
             return [
                 types.CallToolResult(
@@ -65,16 +167,32 @@ async def call_tool(
                     ],
                 )
             ]
-        results = store.query(q, k=max(1, min(50, k)))
+        if mode not in SCORING_MODES:
+            return [
+                types.CallToolResult(
+                    isError=True,
+                    content=[types.TextContent(type="text", text=f"unknown mode: {mode}")],
+                )
+            ]
+        k = max(1, min(50, k))
+        if name == "query":
+            batches = [store.query(queries[0], k=k, min_score=min_score, mode=mode, **filters)]
+        else:
+            batches = store.query_batch(queries, k=k, min_score=min_score, mode=mode, **filters)
         payload = [
-            {
-                "score": float(score),
-                "path": rec.path,
-                "chunk_id": rec.chunk_id,
-                "text": rec.text,
-            }
-            for score, rec in results
+            [
+                {
+                    "score": float(score),
+                    "path": rec.path,
+                    "chunk_id": rec.chunk_id,
+                    "text": rec.text,
+                }
+                for score, rec in results
+            ]
+            for results in batches
         ]
+        if name == "query":
+            payload = payload[0]
         return [types.CallToolResult(content=[types.TextContent(type="text", text=json.dumps(payload))])]
 
     return [
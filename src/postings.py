@@ -0,0 +1,109 @@
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class PostingsIndex:
+    """Term-major view of the corpus.
+
+    For term id ``t`` the chunk ids containing it are
+    ``docs[term_ptr[t]:term_ptr[t + 1]]`` (ascending) and the matching
+    TF-IDF weights live at the same positions in ``weights``.
+    """
+
+    def __init__(self, term_ptr: Sequence[int], docs: Sequence[int], weights: Sequence[float]):
+        self.term_ptr = term_ptr
+        self.docs = docs
+        self.weights = weights
+
+    @property
+    def n_terms(self) -> int:
+        return max(0, len(self.term_ptr) - 1)
+
+    @classmethod
+    def from_rows(
+        cls, n_terms: int, rows: Sequence[Tuple[Sequence[int], Sequence[float]]]
+    ) -> "PostingsIndex":
+        # Counting sort: one pass for posting list lengths, one to scatter.
+        counts = array("q", [0]) * (n_terms + 1)
+        for indices, _ in rows:
+            for t in indices:
+                counts[t + 1] += 1
+        for t in range(n_terms):
+            counts[t + 1] += counts[t]
+        term_ptr = array("q", counts)
+        nnz = term_ptr[n_terms]
+        docs = array("i", [0]) * nnz
+        weights = array("d", [0.0]) * nnz
+        fill = counts  # reused as per-term write cursor
+        for doc, (indices, values) in enumerate(rows):
+            for t, w in zip(indices, values):
+                pos = fill[t]
+                docs[pos] = doc
+                weights[pos] = w
+                fill[t] = pos + 1
+        return cls(term_ptr, docs, weights)
+
+    def accumulate(
+        self,
+        q_idx: Iterable[int],
+        q_val: Iterable[float],
+        lo: Optional[Sequence[int]] = None,
+        hi: Optional[Sequence[int]] = None,
+    ) -> Dict[int, float]:
+        """Dot products between the query and every chunk sharing a term with it.
+
+        ``lo``/``hi`` give per-term posting ranges to restrict the scan to (a shard).
+        """
+        acc: Dict[int, float] = {}
+        get = acc.get
+        n_terms = self.n_terms
+        for t, qw in zip(q_idx, q_val):
+            if t < 0 or t >= n_terms:
+                continue
+            if lo is None:
+                start, end = self.term_ptr[t], self.term_ptr[t + 1]
+            else:
+                start, end = lo[t], hi[t]
+            for doc, w in zip(self.docs[start:end], self.weights[start:end]):
+                acc[doc] = get(doc, 0.0) + qw * w
+        return acc
+
+    def accumulate_subset(self, q_idx: Iterable[int], q_val: Iterable[float], subset) -> Dict[int, float]:
+        """:meth:`accumulate` over the rows of ``subset`` (a ``filters.RowSubset``) only."""
+        acc: Dict[int, float] = {}
+        get = acc.get
+        n_terms = self.n_terms
+        docs, weights = self.docs, self.weights
+        for t, qw in zip(q_idx, q_val):
+            if t < 0 or t >= n_terms:
+                continue
+            start, end = self.term_ptr[t], self.term_ptr[t + 1]
+            stretches = subset.posting_ranges(docs, start, end)
+            if stretches is None:
+                allow = subset.bitmap()
+                for doc, w in zip(docs[start:end], weights[start:end]):
+                    if allow[doc]:
+                        acc[doc] = get(doc, 0.0) + qw * w
+                continue
+            for s, e in stretches:
+                for doc, w in zip(docs[s:e], weights[s:e]):
+                    acc[doc] = get(doc, 0.0) + qw * w
+        return acc
+
+    def accumulate_batch(
+        self, queries: Sequence[Tuple[Sequence[int], Sequence[float]]]
+    ) -> List[Dict[int, float]]:
+        """:meth:`accumulate` for several queries, reading each posting list once."""
+        by_term: Dict[int, List[Tuple[Dict[int, float], float]]] = {}
+        accs: List[Dict[int, float]] = [{} for _ in queries]
+        n_terms = self.n_terms
+        for acc, (q_idx, q_val) in zip(accs, queries):
+            for t, qw in zip(q_idx, q_val):
+                if 0 <= t < n_terms:
+                    by_term.setdefault(t, []).append((acc, qw))
+        for t, users in by_term.items():
+            start, end = self.term_ptr[t], self.term_ptr[t + 1]
+            for doc, w in zip(self.docs[start:end], self.weights[start:end]):
+                for acc, qw in users:
+                    acc[doc] = acc.get(doc, 0.0) + qw * w
+        return accs
@@ -0,0 +1,95 @@
+"""8-bit storage of the TF-IDF weights in ``index.bin``.
+
+With the ``u8`` value codec every weight of row ``r`` is stored as one byte
+``q = round(v / scales[r])`` where ``scales[r] = max(row r) / 255`` (a float32
+``scales`` section), in both the row-major ``values`` and the term-major
+``post_vals``; the default ``f32`` codec keeps the float32 weights. Scoring
+reads the bytes directly: a chunk's dot product with the query is accumulated
+over its quantized postings and multiplied by the chunk's scale once.
+
+Each weight is off by at most half a step, ``max(row) / 510``. Norms are the
+exact norms of the float weights, so a cosine score is off by at most
+``sqrt(nnz) / 510`` for a chunk of ``nnz`` terms and far less in practice
+(``scripts/bench_values.py`` measures it). BM25 impacts are computed from the
+float weights before they are quantized and are not affected.
+
+Rows carried into a later build (incremental ingest, merge, compact) are not
+re-quantized from their 8-bit values: their token counts are recovered with
+the stored chunk length and their weights recomputed exactly, so the error
+never compounds and BM25 sees the same counts as a full rebuild.
+"""
+
+from array import array
+from typing import Sequence
+
+from .index_format import IndexFile, IndexWriter
+
+VALUE_CODECS = ("f32", "u8")
+
+
+def value_codec(index: IndexFile) -> str:
+    codec = index.meta.get("value_codec", "f32")
+    if codec not in VALUE_CODECS:
+        raise ValueError(f"unknown value codec: {codec}")
+    return codec
+
+
+def row_scales(indptr: Sequence[int], values: Sequence[float]) -> array:
+    """Per-row quantization step: the row's largest weight over 255, rounded to float32."""
+    n_rows = len(indptr) - 1
+    scales = array("f", [0.0]) * n_rows
+    for row in range(n_rows):
+        start, end = indptr[row], indptr[row + 1]
+        if end > start:
+            scales[row] = max(values[start:end]) / 255.0
+    return scales
+
+
+def _quantize(v: float, scale: float) -> int:
+    return min(255, max(0, int(v / scale + 0.5))) if scale > 0 else 0
+
+
+def quantize_index(path: str) -> None:
+    """Rewrite ``index.bin`` at ``path`` with the ``u8`` codec.
+
+    The build id is kept, so ``bm25.bin`` and ``shards.bin`` written for the
+    float index stay valid. A no-op if the file is already quantized.
+    """
+    index = IndexFile(path)
+    if value_codec(index) == "u8":
+        return
+    indptr, values = index.section("indptr"), index.section("values")
+    post_docs, post_vals = index.section("post_docs"), index.section("post_vals")
+    scales = row_scales(indptr, values)
+    q_values = bytearray(len(values))
+    for row in range(len(scales)):
+        start, end = indptr[row], indptr[row + 1]
+        scale = scales[row]
+        q_values[start:end] = bytes(_quantize(v, scale) for v in values[start:end])
+    q_post = bytearray(len(post_vals))
+    for p in range(len(post_vals)):
+        q_post[p] = _quantize(post_vals[p], scales[post_docs[p]])
+    quantized = {"values": q_values, "post_vals": q_post}
+    writer = IndexWriter(path)
+    try:
+        for name in index.names():
+            if name in quantized:
+                writer.add(name, "B", quantized[name])
+            else:
+                section = index.section(name)
+                writer.add(name, section.format, section)
+            if name == "values":
+                writer.add("scales", "f", scales)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close(dict(index.meta, value_codec="u8"))
+
+
+def dequantize(indptr: Sequence[int], values: Sequence[int], scales: Sequence[float]) -> array:
+    """Float weights of quantized row-major ``values``."""
+    out = array("f")
+    for row in range(len(scales)):
+        scale = scales[row]
+        out.extend(q * scale for q in values[indptr[row]:indptr[row + 1]])
+    return out
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class QueryCache:
+    """LRU + TTL cache of query results for one index generation.
+
+    Entries are stored under the generation tag of the store that computed
+    them; a lookup or insert under a different tag (a new ingest was loaded)
+    drops everything cached for the old one.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._tag: Optional[Hashable] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _retag(self, tag: Hashable) -> None:
+        if tag != self._tag:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._tag = tag
+
+    def get(self, tag: Hashable, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key) if tag == self._tag else None
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, tag: Hashable, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._retag(tag)
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def cache_from_env() -> QueryCache:
+    """Cache sized by $QUERY_CACHE_SIZE (entries, 0 disables) and $QUERY_CACHE_TTL (seconds)."""
+    try:
+        size = int(os.environ.get("QUERY_CACHE_SIZE", "1024"))
+    except ValueError:
+        size = 1024
+    try:
+        ttl = float(os.environ.get("QUERY_CACHE_TTL", "300"))
+    except ValueError:
+        ttl = 300.0
+    return QueryCache(max_entries=size, ttl=ttl)
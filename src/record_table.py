@@ -0,0 +1,156 @@
+"""Columnar storage of a store's chunks.
+
+A :class:`RecordTable` keeps one column per field instead of one object per
+chunk. Paths are interned: ``paths`` lists each path once and
+``path_ids[row]`` points into it. Row ``r``'s sparse vector is
+``indices``/``values`` over ``[indptr[r], indptr[r + 1])``; with 8-bit values
+(see ``quantize``) ``scales[r]`` turns them back into weights, and
+``lengths[r]`` is the chunk's token count (None for index.bin files written
+before it was kept). The columns are
+typed arrays when the table is built in memory and memoryviews of index.bin
+when it is mapped, so loading a store allocates nothing per chunk.
+
+:class:`VectorRecord` is the per-chunk API. Records read from a table are
+:class:`RecordView` objects holding just the table and the row number; their
+fields are read from the columns when accessed.
+"""
+
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .index_format import IndexFile
+
+
+class VectorRecord:
+    """A chunk and its sparse TF-IDF vector.
+
+    ``length`` counts the chunk's in-vocabulary tokens (the TF denominator);
+    None when the record comes from a store that did not keep it.
+    """
+
+    __slots__ = ("path", "chunk_id", "text", "indices", "values", "norm", "length")
+
+    def __init__(self, path: str, chunk_id: int, text: str, indices: Sequence[int],
+                 values: Sequence[float], norm: float, length: Optional[int] = None):
+        self.path = path
+        self.chunk_id = chunk_id
+        self.text = text
+        self.indices = indices
+        self.values = values
+        self.norm = norm
+        self.length = length
+
+    def _fields(self) -> Tuple:
+        return (self.path, self.chunk_id, self.text, list(self.indices), list(self.values), self.norm)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, VectorRecord):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __repr__(self) -> str:
+        return f"VectorRecord(path={self.path!r}, chunk_id={self.chunk_id}, nnz={len(self.indices)})"
+
+
+class RecordView(VectorRecord):
+    """Row ``row`` of a :class:`RecordTable`, read on access."""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: "RecordTable", row: int):
+        self._table = table
+        self._row = row
+
+    path = property(lambda self: self._table.path(self._row))
+    chunk_id = property(lambda self: self._table.chunk_ids[self._row])
+    text = property(lambda self: self._table.text(self._row))
+    indices = property(lambda self: self._table.row_indices(self._row))
+    values = property(lambda self: self._table.row_values(self._row))
+    norm = property(lambda self: self._table.norms[self._row])
+    length = property(lambda self: self._table.row_length(self._row))
+
+
+class RecordTable:
+    def __init__(self, paths: Optional[List[str]] = None, path_ids: Optional[Sequence[int]] = None,
+                 chunk_ids: Optional[Sequence[int]] = None, indptr: Optional[Sequence[int]] = None,
+                 indices: Optional[Sequence[int]] = None, values: Optional[Sequence[float]] = None,
+                 norms: Optional[Sequence[float]] = None, scales: Optional[Sequence[float]] = None,
+                 texts=None, lengths: Optional[Sequence[int]] = None):
+        self.paths: List[str] = paths if paths is not None else []
+        self.path_ids = path_ids if path_ids is not None else array("i")
+        self.chunk_ids = chunk_ids if chunk_ids is not None else array("i")
+        self.indptr = indptr if indptr is not None else array("q", [0])
+        self.indices = indices if indices is not None else array("i")
+        self.values = values if values is not None else array("f")
+        self.norms = norms if norms is not None else array("d")
+        self.scales = scales  # per-row steps of 8-bit values, else None
+        # Token count per row; -1 (or no column at all) where it is unknown.
+        self.lengths = lengths if lengths is not None or indptr is not None else array("i")
+        self._texts = texts if texts is not None else []
+        self._path_index: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_index(cls, index: IndexFile, texts) -> "RecordTable":
+        """Map the row columns of ``index``; ``texts`` indexes chunk text by row (a TextStore)."""
+        return cls(
+            list(index.meta.get("paths", [])), index.section("path_ids"), index.section("chunk_ids"),
+            index.section("indptr"), index.section("indices"), index.section("values"),
+            index.section("norms"), index.section("scales") if "scales" in index else None, texts,
+            index.section("lengths") if "lengths" in index else None,
+        )
+
+    @classmethod
+    def from_records(cls, records) -> "RecordTable":
+        table = cls()
+        for rec in records:
+            table.append(rec.path, rec.chunk_id, rec.text, rec.indices, rec.values, rec.norm, rec.length)
+        return table
+
+    def append(self, path: str, chunk_id: int, text: str, indices: Sequence[int],
+               values: Sequence[float], norm: float, length: Optional[int] = None) -> None:
+        """Add a row to a table built in memory."""
+        pid = self.path_id(path)
+        if pid is None:
+            pid = self._path_index[path] = len(self.paths)
+            self.paths.append(path)
+        self.path_ids.append(pid)
+        self.chunk_ids.append(chunk_id)
+        self.indices.extend(indices)
+        self.values.extend(values)
+        self.indptr.append(len(self.indices))
+        self.norms.append(norm)
+        self.lengths.append(-1 if length is None else length)
+        self._texts.append(text)
+
+    def __len__(self) -> int:
+        return len(self.norms)
+
+    def __getitem__(self, row: int) -> RecordView:
+        return RecordView(self, row)
+
+    def path_id(self, path: str) -> Optional[int]:
+        if self._path_index is None:
+            self._path_index = {p: i for i, p in enumerate(self.paths)}
+        return self._path_index.get(path)
+
+    def path(self, row: int) -> str:
+        return self.paths[self.path_ids[row]]
+
+    def text(self, row: int) -> str:
+        return self._texts[row]
+
+    def row_indices(self, row: int) -> array:
+        return array("i", self.indices[self.indptr[row]:self.indptr[row + 1]])
+
+    def row_values(self, row: int) -> array:
+        """Weights of ``row`` as float32, dequantized if need be."""
+        values = self.values[self.indptr[row]:self.indptr[row + 1]]
+        if self.scales is None:
+            return array("f", values)
+        scale = self.scales[row]
+        return array("f", (q * scale for q in values))
+
+    def row_length(self, row: int) -> Optional[int]:
+        if self.lengths is None or self.lengths[row] < 0:
+            return None
+        return self.lengths[row]
@@ -0,0 +1,136 @@
+"""Sharded search: the rows of index.bin split into N contiguous shards.
+
+``shards.bin`` (written at ingest next to ``index.bin`` and tied to it by the
+build id) records the first row of every shard, chosen so shards hold about
+the same number of postings, and for every shard ``s`` and term ``t`` where
+that shard's slice of the posting list starts: ``ptr[s * n_terms + t]``. As
+posting lists are sorted by row, shard ``s`` of term ``t`` is
+``[ptr[s * n_terms + t], ptr[(s + 1) * n_terms + t])``.
+
+Shards are scored in a pool of worker processes. Each worker maps the same
+index files, so the arrays are shared through the page cache rather than
+copied, and returns only its shard's top-k for the parent to merge.
+"""
+
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .index_format import IndexFile, IndexWriter
+
+
+class ShardTable:
+    def __init__(self, rows: Sequence[int], ptr: Sequence[int], meta: Dict):
+        self.rows = rows
+        self.ptr = ptr
+        self.meta = meta
+        self.n_terms = int(meta["n_terms"])
+
+    @property
+    def n_shards(self) -> int:
+        return len(self.rows) - 1
+
+    @classmethod
+    def build(cls, n_shards: int, indptr: Sequence[int], term_ptr: Sequence[int],
+              post_docs: Sequence[int], build_id: str = "") -> "ShardTable":
+        n_rows = len(indptr) - 1
+        n_terms = len(term_ptr) - 1
+        nnz = indptr[n_rows]
+        rows = array("q", [0])
+        for s in range(1, n_shards):
+            rows.append(max(rows[-1], bisect_left(indptr, nnz * s // n_shards, 0, n_rows)))
+        rows.append(n_rows)
+        ptr = array("q", term_ptr[:n_terms])
+        for s in range(1, n_shards):
+            first = rows[s]
+            for t in range(n_terms):
+                ptr.append(bisect_left(post_docs, first, ptr[(s - 1) * n_terms + t], term_ptr[t + 1]))
+        ptr.extend(term_ptr[1:])
+        meta = {"n_shards": n_shards, "n_terms": n_terms, "build_id": build_id}
+        return cls(rows, ptr, meta)
+
+    def bounds(self, shard: int) -> Tuple[Sequence[int], Sequence[int]]:
+        """Per-term (start, end) posting offsets of one shard."""
+        n = self.n_terms
+        return (self.ptr[shard * n:(shard + 1) * n], self.ptr[(shard + 1) * n:(shard + 2) * n])
+
+    def save(self, path: str) -> None:
+        writer = IndexWriter(path)
+        try:
+            writer.add("rows", "q", self.rows)
+            writer.add("ptr", "q", self.ptr)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close(self.meta)
+
+    @classmethod
+    def open(cls, path: str, build_id: Optional[str] = None) -> Optional["ShardTable"]:
+        """Map ``shards.bin``; None if it is missing or belongs to another index build."""
+        if not os.path.exists(path):
+            return None
+        f = IndexFile(path)
+        if build_id is not None and f.meta.get("build_id") != build_id:
+            return None
+        return cls(f.section("rows"), f.section("ptr"), f.meta)
+
+
+def resolve_search_workers(n_shards: int) -> int:
+    """$SEARCH_WORKERS if set, else one per shard up to the CPU count; 1 searches in-process."""
+    try:
+        workers = int(os.environ.get("SEARCH_WORKERS", "0"))
+    except ValueError:
+        workers = 0
+    if workers <= 0:
+        workers = min(n_shards, os.cpu_count() or 1)
+    return workers
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """Process-wide search pool, recreated if a different size is asked for."""
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn: the servers call this from threads, where forking is unsafe.
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+            _pool_size = workers
+        return _pool
+
+
+_worker_stores: Dict[str, object] = {}
+
+
+def search_shard(build_dir: str, build_id: str, shard: int, mode: str, query, k: int,
+                 min_score: Optional[float], n_deleted: int = 0) -> Optional[List[Tuple[float, int]]]:
+    """Worker side: top-k ``(score, row)`` of one shard, or None if the build is gone.
+
+    ``n_deleted`` is the caller's tombstone count; deletes.log only grows, so
+    a worker holding fewer tombstones re-reads it before searching.
+    """
+    from .vector_store import VectorStore  # imported here: vector_store imports this module
+
+    store = _worker_stores.get(build_dir)
+    if store is None or store._build_id != build_id:
+        store = VectorStore(build_dir)
+        try:
+            store.load(build_dir)
+        except OSError:  # generation pruned since the parent loaded it
+            return None
+        _worker_stores.clear()  # keep only the build being served
+        _worker_stores[build_dir] = store
+    if store._build_id != build_id or store._shards is None:
+        return None
+    if len(store._deleted) < n_deleted:
+        store._load_tombstones()
+    return store._shard_top_k(shard, mode, query, k, min_score)
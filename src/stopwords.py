@@ -0,0 +1,39 @@
+"""Stop word lists for ``TfidfVectorizer(stop_words=...)``."""
+
+from typing import FrozenSet, List, Optional, Sequence, Union
+
+ENGLISH_STOP_WORDS: FrozenSet[str] = frozenset("""
+about above after again against all also am an and any are as at be because been before
+being below between both but by can could did do does doing down during each either else
+ever few for from further had has have having he her here hers herself him himself his how
+however if in into is it its itself just me more most my myself no nor not now of off on
+once only or other our ours ourselves out over own same shall she should so some such than
+that the their theirs them themselves then there these they this those through thus to too
+under until up upon us very was we were what when where whether which while who whom whose
+why will with within without would yet you your yours yourself yourselves
+""".split())
+
+STOP_WORD_LISTS = {"english": ENGLISH_STOP_WORDS}
+
+
+def resolve_stop_words(stop_words: Optional[Union[str, Sequence[str]]]) -> FrozenSet[str]:
+    """The words of a named list (``"english"``) or of an explicit list, lowercased."""
+    if stop_words is None:
+        return frozenset()
+    if isinstance(stop_words, str):
+        try:
+            return STOP_WORD_LISTS[stop_words]
+        except KeyError:
+            raise ValueError(
+                f"unknown stop word list: {stop_words} (expected one of {sorted(STOP_WORD_LISTS)})"
+            ) from None
+    return frozenset(w.lower() for w in stop_words)
+
+
+def read_stop_words(path: str) -> List[str]:
+    """Whitespace-separated words of a stop word file; ``#`` starts a comment."""
+    words = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            words.extend(line.split("#", 1)[0].split())
+    return sorted({w.lower() for w in words})
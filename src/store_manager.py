@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+from .generations import current_dir, current_name
+from .query_cache import cache_from_env
+from .vector_store import VectorStore, read_meta
+
+
+_WATCHED = (
+    "meta.json", "vocab.bin", "vectorizer.json", "index.bin", "texts.bin", "bm25.bin",
+    "shards.bin", "index.jsonl", "deletes.log", "segments.json",
+)
+
+
+class StoreManager:
+    """Process-wide holder of the current VectorStore snapshot.
+
+    ``get()`` returns the loaded store and, at most every ``check_interval``
+    seconds, checks the ``CURRENT`` generation pointer, the ``meta.json``
+    generation and artifact mtimes. When they change a fresh store is loaded
+    and swapped in with a single reference assignment; callers that already
+    hold the previous store keep querying it undisturbed. While a reload is in
+    progress other callers are served the previous snapshot instead of waiting.
+
+    All snapshots share one query result cache whose entries are tagged with
+    the generation that produced them, so a reload invalidates it.
+    """
+
+    def __init__(self, root: str, check_interval: float = 1.0):
+        self.root = root
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._store: Optional[VectorStore] = None
+        self._signature: Optional[Tuple] = None
+        self._checked_at = 0.0
+        self.cache = cache_from_env()
+
+    def _read_signature(self) -> Tuple:
+        build_dir = current_dir(self.root)
+        stamps = []
+        for name in _WATCHED:
+            try:
+                st = os.stat(os.path.join(build_dir, name))
+                stamps.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamps.append(None)
+        return (current_name(self.root), read_meta(build_dir).get("generation"), tuple(stamps))
+
+    def _load(self) -> VectorStore:
+        store = VectorStore(self.root)
+        try:
+            store.load()
+        except FileNotFoundError:
+            # Nothing ingested yet: serve an empty, not-ready store.
+            store = VectorStore(self.root)
+        store.cache = self.cache
+        return store
+
+    def get(self) -> VectorStore:
+        store = self._store
+        if store is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return store
+        # Only the first load blocks; later checks are skipped if one is running.
+        if not self._lock.acquire(blocking=store is None):
+            return store
+        try:
+            if self._store is None or self._read_signature() != self._signature:
+                self._reload_locked()
+            self._checked_at = time.monotonic()
+            return self._store
+        finally:
+            self._lock.release()
+
+    def reload(self) -> VectorStore:
+        """Load the artifacts on disk now, e.g. right after an ingest."""
+        with self._lock:
+            self._reload_locked()
+            self._checked_at = time.monotonic()
+            return self._store
+
+    def mark_current(self) -> None:
+        """Take the artifacts on disk as those of the loaded store.
+
+        For changes made through the loaded store itself, such as deletes it
+        already applied, which would otherwise trigger a reload.
+        """
+        with self._lock:
+            self._signature = self._read_signature()
+
+    def _reload_locked(self) -> None:
+        before = self._read_signature()
+        store = self._load()
+        # If artifacts changed while loading, leave the signature unset so the
+        # next check loads again once the writer has finished.
+        self._signature = before if self._read_signature() == before else None
+        self._store = store
+
+
+_default_manager: Optional[StoreManager] = None
+_default_lock = threading.Lock()
+
+
+def get_default_manager() -> StoreManager:
+    global _default_manager
+    if _default_manager is None:
+        with _default_lock:
+            if _default_manager is None:
+                _default_manager = StoreManager(os.path.join("data", "vector_store"))
+    return _default_manager
+
+
+def get_store() -> VectorStore:
+    return get_default_manager().get()
@@ -0,0 +1,109 @@
+"""Chunk text kept apart from the embeddings, in ``texts.bin``.
+
+Text ``i`` belongs to row ``i`` of the index. It occupies
+``[text_ptr[i], text_ptr[i + 1])`` of the concatenated UTF-8 text. With the
+``zlib`` codec whole texts are packed into ~64 KiB blocks that are compressed
+independently (``block_ptr`` gives each block's compressed byte range,
+``block_start`` its uncompressed start and ``text_block`` the block of every
+text), so fetching one hit only inflates one block.
+"""
+
+import zlib
+from array import array
+from functools import lru_cache
+
+from .index_format import IndexFile, IndexWriter
+
+TEXT_CODECS = ("none", "zlib")
+
+
+class TextStoreWriter:
+    def __init__(self, path: str, codec: str = "none", block_size: int = 64 * 1024):
+        if codec not in TEXT_CODECS:
+            raise ValueError(f"unknown text codec: {codec}")
+        self.codec = codec
+        self.block_size = block_size
+        self._writer = IndexWriter(path)
+        self._writer.begin("data", "B")
+        self.text_ptr = array("q", [0])
+        self.text_block = array("i")
+        self.block_ptr = array("q", [0])
+        self.block_start = array("q")
+        self._pending = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.text_ptr) - 1
+
+    def add(self, text: str) -> int:
+        """Append one text and return its id."""
+        raw = text.encode("utf-8")
+        text_id = len(self)
+        if self.codec == "none":
+            self._writer.extend(raw)
+        else:
+            if not self._pending:
+                self.block_start.append(self.text_ptr[-1])
+            self.text_block.append(len(self.block_start) - 1)
+            self._pending += raw
+            if len(self._pending) >= self.block_size:
+                self._flush_block()
+        self.text_ptr.append(self.text_ptr[-1] + len(raw))
+        return text_id
+
+    def _flush_block(self) -> None:
+        if not self._pending:
+            return
+        packed = zlib.compress(bytes(self._pending), 6)
+        self._writer.extend(packed)
+        self.block_ptr.append(self.block_ptr[-1] + len(packed))
+        self._pending = bytearray()
+
+    def close(self) -> None:
+        try:
+            self._flush_block()
+            self._writer.end()
+            self._writer.add("text_ptr", "q", self.text_ptr)
+            if self.codec != "none":
+                self._writer.add("text_block", "i", self.text_block)
+                self._writer.add("block_ptr", "q", self.block_ptr)
+                self._writer.add("block_start", "q", self.block_start)
+        except BaseException:
+            self._writer.abort()
+            raise
+        self._writer.close({"codec": self.codec, "count": len(self)})
+
+    def abort(self) -> None:
+        self._writer.abort()
+
+
+class TextStore:
+    """Random access to the texts written by :class:`TextStoreWriter`."""
+
+    def __init__(self, path: str, cache_blocks: int = 64):
+        self._file = IndexFile(path)
+        self.codec = self._file.meta.get("codec", "none")
+        if self.codec not in TEXT_CODECS:
+            raise ValueError(f"unknown text codec: {self.codec}")
+        self._data = self._file.section("data")
+        self._text_ptr = self._file.section("text_ptr")
+        if self.codec != "none":
+            self._text_block = self._file.section("text_block")
+            self._block_ptr = self._file.section("block_ptr")
+            self._block_start = self._file.section("block_start")
+            self._block = lru_cache(maxsize=cache_blocks)(self._inflate)
+
+    def __len__(self) -> int:
+        return len(self._text_ptr) - 1
+
+    def _inflate(self, b: int) -> bytes:
+        return zlib.decompress(self._data[self._block_ptr[b]:self._block_ptr[b + 1]])
+
+    def get(self, i: int) -> str:
+        start, end = self._text_ptr[i], self._text_ptr[i + 1]
+        if self.codec == "none":
+            return bytes(self._data[start:end]).decode("utf-8")
+        b = self._text_block[i]
+        base = self._block_start[b]
+        return self._block(b)[start - base:end - base].decode("utf-8")
+
+    __getitem__ = get
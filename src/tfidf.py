@@ -1,81 +1,269 @@
 import json
 import math
-from typing import Dict, List, Tuple
+import re
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+from .index_format import IndexFile
+from .stopwords import resolve_stop_words
+from .vocab import TermIndex, TermList, write_vocab
+
+# Runs of characters for which str.isalnum() is true (\w minus underscore).
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def _lower_token(tok: str) -> str:
+    # str.lower() on a whole word applies the Greek final-sigma rule; lowering
+    # character by character (the tokenizer's historical behaviour) does not.
+    if "\u03a3" in tok:
+        return "".join(ch.lower() for ch in tok)
+    return tok.lower()
+
+
+def split_words(text: str) -> List[str]:
+    """Lowercased runs of alphanumeric characters, in order."""
+    lower = _lower_token if "\u03a3" in text else str.lower
+    return list(map(lower, _TOKEN_RE.findall(text)))
 
 
 class TfidfVectorizer:
-    def __init__(self):
-        self.vocabulary_: List[str] = []
-        self.vocab_index: Dict[str, int] = {}
-        self.idf_: List[float] = []
+    """TF-IDF over the corpus vocabulary, optionally pruned.
+
+    ``min_df``/``max_df`` drop terms in fewer/more chunks than the limit (an
+    int is a chunk count, a float a fraction of the chunks), ``max_features``
+    keeps only the terms in the most chunks, and ``stop_words`` (``"english"``
+    or a list of words) are never indexed. Queries ignore pruned terms like any
+    other unknown word.
+
+    IDF values are float32. A vectorizer loaded from vocab.bin reads its
+    terms, IDF and frequencies from the mapped file (see ``vocab``) instead of
+    building lists and a dict.
+    """
+
+    def __init__(self, min_df: Union[int, float] = 1, max_df: Union[int, float] = 1.0,
+                 max_features: Optional[int] = None,
+                 stop_words: Optional[Union[str, Sequence[str]]] = None):
+        for name, limit in (("min_df", min_df), ("max_df", max_df)):
+            if limit < 0 or (isinstance(limit, float) and limit > 1.0):
+                raise ValueError(f"{name} must be a chunk count or a fraction in [0, 1], got {limit}")
+        if max_features is not None and max_features < 1:
+            raise ValueError(f"max_features must be positive, got {max_features}")
+        self.min_df = min_df
+        self.max_df = max_df
+        self.max_features = max_features
+        if stop_words is not None and not isinstance(stop_words, str):
+            stop_words = sorted(stop_words)
+        self.stop_words = stop_words
+        self._stop = resolve_stop_words(stop_words)
+        self.vocabulary_: Sequence[str] = []
+        self.vocab_index: Union[Dict[str, int], TermIndex] = {}
+        self.idf_: Sequence[float] = array("f")
+        # Document frequencies and corpus size, kept so IDF can be updated incrementally
+        self.df_: Sequence[int] = []
+        self.n_docs_: int = 0
+        # Terms dropped as too common (max_df); incremental updates keep them out.
+        self.excluded_: List[str] = []
+        # What the last vocabulary build dropped and why (recorded in meta.json).
+        self.pruning_: Dict[str, Any] = {}
 
     @staticmethod
     def _tokenize(text: str) -> List[str]:
-        tokens: List[str] = []
-        token = []
-        for ch in text:
-            if ch.isalnum():
-                token.append(ch.lower())
-            else:
-                if token:
-                    t = "".join(token)
-                    if len(t) > 1:
-                        tokens.append(t)
-                    token = []
-        if token:
-            t = "".join(token)
-            if len(t) > 1:
-                tokens.append(t)
-        return tokens
+        """Lowercased alphanumeric runs longer than one character."""
+        return [t for t in split_words(text) if len(t) > 1]
+
+    @classmethod
+    def count_terms(cls, text: str) -> Dict[str, int]:
+        return Counter(cls._tokenize(text))
 
     def fit(self, texts: List[str]) -> None:
         df: Dict[str, int] = {}
         for text in texts:
-            seen = set()
-            for tok in self._tokenize(text):
-                if tok not in seen:
-                    df[tok] = df.get(tok, 0) + 1
-                    seen.add(tok)
+            for tok in set(self._tokenize(text)):
+                df[tok] = df.get(tok, 0) + 1
+        self.set_document_frequencies(df, len(texts))
+
+    def fit_transform(self, texts: List[str]) -> List[Tuple[List[int], List[float]]]:
+        """Fit and vectorize ``texts`` tokenizing each text only once."""
+        all_counts = [self.count_terms(text) for text in texts]
+        df: Dict[str, int] = {}
+        for counts in all_counts:
+            for tok in counts:
+                df[tok] = df.get(tok, 0) + 1
+        self.set_document_frequencies(df, len(texts))
+        return [self.vectorize_counts(counts) for counts in all_counts]
+
+    @classmethod
+    def from_document_frequencies(cls, df: Dict[str, int], n_docs: int, **pruning) -> "TfidfVectorizer":
+        obj = cls(**pruning)
+        obj.set_document_frequencies(df, n_docs)
+        return obj
+
+    def pruning_params(self) -> Dict[str, Any]:
+        """The constructor arguments that decide which terms are kept."""
+        return {
+            "min_df": self.min_df, "max_df": self.max_df,
+            "max_features": self.max_features, "stop_words": self.stop_words,
+        }
+
+    def prunes_by_frequency(self) -> bool:
+        """Whether the kept terms depend on chunk frequencies (``min_df``, ``max_df``, ``max_features``)."""
+        low = self.min_df > 0 if isinstance(self.min_df, float) else self.min_df > 1
+        high = self.max_df < 1.0 if isinstance(self.max_df, float) else True
+        return low or high or self.max_features is not None
+
+    def _select_terms(
+        self, df: Dict[str, int], n_docs: int, excluded: Set[str], room: Optional[int]
+    ) -> Tuple[List[str], List[str], Dict[str, int]]:
+        """(kept terms sorted, terms too common, drop counts by reason) of ``df``'s terms.
+
+        At most ``room`` terms are kept, those in the most chunks.
+        """
+        lo = self.min_df * n_docs if isinstance(self.min_df, float) else self.min_df
+        hi = self.max_df * n_docs if isinstance(self.max_df, float) else self.max_df
+        dropped = {"stop_words": 0, "max_df": 0, "min_df": 0, "max_features": 0}
+        kept: List[str] = []
+        too_common: List[str] = []
+        for t, c in df.items():
+            if c <= 0:
+                continue
+            if t in self._stop:
+                dropped["stop_words"] += 1
+            elif t in excluded or c > hi:
+                dropped["max_df"] += 1
+                too_common.append(t)
+            elif c < lo:
+                dropped["min_df"] += 1
+            else:
+                kept.append(t)
+        if room is not None and len(kept) > room:
+            kept.sort(key=lambda t: (-df[t], t))
+            dropped["max_features"] = len(kept) - room
+            del kept[room:]
+        return sorted(kept), too_common, dropped
+
+    def _record_pruning(self, terms_before: int, dropped: Dict[str, int]) -> None:
+        stop_words = self.stop_words if not isinstance(self.stop_words, list) else len(self.stop_words)
+        self.pruning_ = dict(
+            self.pruning_params(), stop_words=stop_words,
+            terms_before=terms_before, terms_after=len(self.vocabulary_), dropped=dropped,
+        )
+
+    def set_document_frequencies(self, df: Dict[str, int], n_docs: int) -> None:
+        """Freeze the vocabulary and IDF from per-term chunk counts.
+
+        Terms with df <= 0 are dropped, and so are the terms the pruning
+        settings reject (see the class docstring).
+        """
         # Freeze vocabulary in deterministic order
-        self.vocabulary_ = sorted(df.keys())
+        self.vocabulary_, too_common, dropped = self._select_terms(
+            df, n_docs, set(self.excluded_), self.max_features
+        )
+        self.excluded_ = sorted(set(self.excluded_).union(too_common))
         self.vocab_index = {t: i for i, t in enumerate(self.vocabulary_)}
-        n_docs = max(1, len(texts))
-        self.idf_ = [math.log((1 + n_docs) / (1 + df[t])) + 1.0 for t in self.vocabulary_]
+        self.df_ = [df[t] for t in self.vocabulary_]
+        self._set_idf(n_docs)
+        self._record_pruning(sum(1 for c in df.values() if c > 0), dropped)
 
-    def transform_sparse(self, texts: List[str]) -> List[Tuple[List[int], List[float]]]:
-        results: List[Tuple[List[int], List[float]]] = []
-        for text in texts:
-            counts: Dict[int, int] = {}
-            total = 0
-            for tok in self._tokenize(text):
-                idx = self.vocab_index.get(tok)
-                if idx is None:
-                    continue
-                counts[idx] = counts.get(idx, 0) + 1
-                total += 1
-            if total == 0:
-                results.append(([], []))
+    def refit(self, df: Dict[str, int], n_docs: int) -> "TfidfVectorizer":
+        """A vectorizer for updated frequencies with the same pruning settings.
+
+        Terms this one dropped as too common stay out. The others are judged
+        on ``df``, which for an incremental update only counts the chunks
+        that still hold them, i.e. the new ones for previously pruned terms.
+        """
+        obj = TfidfVectorizer(**self.pruning_params())
+        obj.excluded_ = list(self.excluded_)
+        obj.set_document_frequencies(df, n_docs)
+        return obj
+
+    def _set_idf(self, n_docs: int) -> None:
+        self.n_docs_ = n_docs
+        n_docs = max(1, n_docs)
+        self.idf_ = array("f", (math.log((1 + n_docs) / (1 + c)) + 1.0 for c in self.df_))
+
+    def extended(self, df: Dict[str, int], n_docs: int) -> "TfidfVectorizer":
+        """Vectorizer for updated frequencies that keeps every existing term id.
+
+        Terms new to ``df`` are numbered after the current vocabulary (in
+        sorted order), so rows written with this vectorizer stay comparable
+        with older ones; terms no longer seen keep their id with df 0. New
+        terms are pruned with the current settings; existing ones are kept.
+        """
+        obj = TfidfVectorizer(**self.pruning_params())
+        known = set(self.vocabulary_)
+        new = {t: c for t, c in df.items() if t not in known}
+        room = None if self.max_features is None else max(0, self.max_features - len(self.vocabulary_))
+        new_terms, too_common, dropped = obj._select_terms(new, n_docs, set(self.excluded_), room)
+        obj.excluded_ = sorted(set(self.excluded_).union(too_common))
+        obj.vocabulary_ = list(self.vocabulary_) + new_terms
+        obj.vocab_index = {t: i for i, t in enumerate(obj.vocabulary_)}
+        obj.df_ = [max(0, df.get(t, 0)) for t in obj.vocabulary_]
+        obj._set_idf(n_docs)
+        obj._record_pruning(len(self.vocabulary_) + sum(1 for c in new.values() if c > 0), dropped)
+        return obj
+
+    def document_frequencies(self) -> Dict[str, int]:
+        return dict(zip(self.vocabulary_, self.df_))
+
+    def vectorize_counts(self, counts: Dict[str, int]) -> Tuple[List[int], List[float]]:
+        """Sparse TF-IDF vector from raw token counts of one text."""
+        return self.vectorize_term_ids(self.term_id_counts(counts))
+
+    def term_id_counts(self, counts: Dict[str, int]) -> Dict[int, int]:
+        """Raw token counts keyed by term id; out-of-vocabulary tokens are dropped."""
+        by_idx: Dict[int, int] = {}
+        for tok, c in counts.items():
+            idx = self.vocab_index.get(tok)
+            if idx is None:
                 continue
-            indices = sorted(counts.keys())
-            values: List[float] = []
-            for i in indices:
-                tf = counts[i] / total
-                values.append(tf * self.idf_[i])
-            results.append((indices, values))
-        return results
+            by_idx[idx] = by_idx.get(idx, 0) + c
+        return by_idx
+
+    def vectorize_term_ids(self, by_idx: Dict[int, int]) -> Tuple[List[int], List[float]]:
+        """Sparse TF-IDF vector from in-vocabulary term id counts."""
+        total = sum(by_idx.values())
+        if total == 0:
+            return ([], [])
+        indices = sorted(by_idx.keys())
+        values = [by_idx[i] / total * self.idf_[i] for i in indices]
+        return (indices, values)
+
+    def transform_sparse(self, texts: List[str]) -> List[Tuple[List[int], List[float]]]:
+        return [self.vectorize_counts(self.count_terms(text)) for text in texts]
 
     def save(self, path: str) -> None:
-        data = {"vocabulary": self.vocabulary_, "idf": self.idf_}
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f)
+        """Write vocab.bin (see ``vocab``)."""
+        write_vocab(path, self.vocabulary_, self.idf_, self.df_, {
+            "n_docs": self.n_docs_, "pruning": self.pruning_params(), "excluded": self.excluded_,
+        })
 
     @classmethod
     def load(cls, path: str) -> "TfidfVectorizer":
+        """Map a vocab.bin, or read a ``.json`` vectorizer of an older store."""
+        if path.endswith(".json"):
+            return cls._load_json(path)
+        index = IndexFile(path)
+        obj = cls(**index.meta.get("pruning", {}))
+        obj.excluded_ = list(index.meta.get("excluded", []))
+        obj.vocabulary_ = TermList(index.section("term_ptr"), index.section("terms"))
+        obj.vocab_index = TermIndex(obj.vocabulary_, index.section("order"))
+        obj.idf_ = index.section("idf")
+        obj.df_ = index.section("df")
+        obj.n_docs_ = int(index.meta.get("n_docs", 0))
+        return obj
+
+    @classmethod
+    def _load_json(cls, path: str) -> "TfidfVectorizer":
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
-        obj = cls()
+        obj = cls(**data.get("pruning", {}))
+        obj.excluded_ = list(data.get("excluded", []))
         obj.vocabulary_ = list(data.get("vocabulary", []))
         obj.vocab_index = {t: i for i, t in enumerate(obj.vocabulary_)}
         obj.idf_ = list(data.get("idf", [1.0] * len(obj.vocabulary_)))
+        # Stores written before df was persisted cannot be updated incrementally.
+        obj.df_ = list(data.get("df", []))
+        obj.n_docs_ = int(data.get("n_docs", 0))
         return obj
 
@@ -1,20 +1,37 @@
+import heapq
 import json
 import math
+import mmap
 import os
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+import shutil
+import struct
+import tempfile
+import uuid
+from array import array
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Set, Tuple, Union
 
+from . import csr_backend
+from .bm25 import Bm25Index, _row_length, max_score_top_k, row_lengths, term_idf
+from .doc_table import DOCS_FILE, DocCatalog, DocTable, publish_build, read_deletes
+from .filters import DocFilter, RowSubset
+from .generations import (
+    current_dir,
+    discard,
+    new_generation_dir,
+    next_generation,
+    read_segments,
+)
+from .index_format import IndexFile, IndexWriter
+from .manifest import load_manifest, save_manifest
+from .postings import PostingsIndex
+from .quantize import dequantize, quantize_index, value_codec
+from .record_table import RecordTable, VectorRecord
+from .query_cache import QueryCache
+from .shards import ShardTable, get_pool, resolve_search_workers, search_shard
+from .text_store import TextStore, TextStoreWriter
 from .tfidf import TfidfVectorizer
-
-
-@dataclass
-class VectorRecord:
-    path: str
-    chunk_id: int
-    text: str
-    indices: List[int]
-    values: List[float]
-    norm: float
+from .vocab import VOCAB_FILE, vectorizer_file
 
 
 def _sparse_norm(values: List[float]) -> float:
@@ -38,79 +55,1043 @@ def _cosine_sim(a_idx: List[int], a_val: List[float], a_norm: float,
     return dot / denom
 
 
+def read_jsonl_records(path: str) -> List[VectorRecord]:
+    records: List[VectorRecord] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            records.append(
+                VectorRecord(
+                    path=obj["path"],
+                    chunk_id=int(obj["chunk_id"]),
+                    text=obj["text"],
+                    indices=array("i", obj["embedding"]["indices"]),
+                    values=array("f", obj["embedding"]["values"]),
+                    norm=float(obj["embedding"]["norm"]),
+                    length=obj["embedding"].get("length"),
+                )
+            )
+    return records
+
+
+def write_jsonl_records(path: str, records: Sequence[VectorRecord]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for rec in records:
+            obj = {
+                "path": rec.path,
+                "chunk_id": rec.chunk_id,
+                "text": rec.text,
+                "embedding": {
+                    "indices": list(rec.indices),
+                    # 9 significant digits round-trip a float32 weight
+                    "values": [float(f"{v:.9g}") for v in rec.values],
+                    "norm": rec.norm,
+                    "length": rec.length,
+                },
+            }
+            f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+
+
+class BinaryIndexBuilder:
+    """Stream rows into ``index.bin`` without holding the corpus in memory.
+
+    Only per-row scalars (offsets, norms, lengths, ids) are kept, in compact arrays.
+    Row indices and values are spilled to scratch files, chunk text streams
+    into ``text_path`` (see ``text_store``), and postings are scattered straight
+    into memory-mapped scratch arrays whose layout is fixed up front by
+    ``term_counts`` (the posting list length of every term, i.e. its document
+    frequency). ``close()`` stitches the parts into one file.
+    """
+
+    def __init__(self, path: str, text_path: str, term_counts: Sequence[int],
+                 text_codec: str = "none"):
+        self.path = path
+        self.n_terms = len(term_counts)
+        self._scratch = tempfile.mkdtemp(prefix=".build-", dir=os.path.dirname(path) or ".")
+        self._files = {
+            name: open(os.path.join(self._scratch, name), "wb") for name in ("indices", "values")
+        }
+        self._texts = TextStoreWriter(text_path, codec=text_codec)
+        self.indptr = array("q", [0])
+        self.norms = array("d")
+        self.lengths = array("i")
+        self.path_ids = array("i")
+        self.chunk_ids = array("i")
+        self.paths: List[str] = []
+        self._path_index: Dict[str, int] = {}
+        self.term_ptr = array("q", [0])
+        for c in term_counts:
+            self.term_ptr.append(self.term_ptr[-1] + c)
+        self._cursor = array("q", self.term_ptr)
+        self._maps: List[mmap.mmap] = []
+        self._post_docs = self._scratch_array("post_docs", "i", self.term_ptr[-1])
+        self._post_vals = self._scratch_array("post_vals", "f", self.term_ptr[-1])
+
+    def _scratch_array(self, name: str, typecode: str, count: int):
+        size = count * struct.calcsize(typecode)
+        with open(os.path.join(self._scratch, name), "w+b") as f:
+            f.truncate(size)
+            if size == 0:
+                return array(typecode)
+            mm = mmap.mmap(f.fileno(), size)
+        self._maps.append(mm)
+        return memoryview(mm).cast(typecode)
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.norms)
+
+    def add(self, path: str, chunk_id: int, text: str, indices: Sequence[int],
+            values: Sequence[float], norm: float, length: int) -> None:
+        doc = len(self.norms)
+        self._files["indices"].write(array("i", indices))
+        self._files["values"].write(array("f", values))
+        self.indptr.append(self.indptr[-1] + len(indices))
+        self.norms.append(norm)
+        self.lengths.append(length)
+        pid = self._path_index.get(path)
+        if pid is None:
+            pid = self._path_index[path] = len(self.paths)
+            self.paths.append(path)
+        self.path_ids.append(pid)
+        self.chunk_ids.append(chunk_id)
+        self._texts.add(text)  # text id == row
+        cursor, term_ptr = self._cursor, self.term_ptr
+        docs, vals = self._post_docs, self._post_vals
+        for t, w in zip(indices, values):
+            pos = cursor[t]
+            if pos >= term_ptr[t + 1]:
+                raise ValueError(f"term {t} has more postings than its declared count")
+            docs[pos] = doc
+            vals[pos] = w
+            cursor[t] = pos + 1
+
+    def _release(self) -> None:
+        for f in self._files.values():
+            f.close()
+        for view in (self._post_docs, self._post_vals):
+            if isinstance(view, memoryview):
+                view.release()
+        for mm in self._maps:
+            mm.close()
+        self._maps = []
+
+    def close(self, meta: Optional[Dict] = None) -> None:
+        self._release()
+        if self._cursor[:-1] != self.term_ptr[1:]:
+            self.abort()
+            raise ValueError("posting counts do not match the declared term counts")
+        part = lambda name: os.path.join(self._scratch, name)  # noqa: E731
+        writer = IndexWriter(self.path)
+        try:
+            self._texts.close()
+            writer.add("indptr", "q", self.indptr)
+            writer.add_file("indices", "i", part("indices"))
+            writer.add_file("values", "f", part("values"))
+            writer.add("norms", "d", self.norms)
+            writer.add("lengths", "i", self.lengths)
+            writer.add("path_ids", "i", self.path_ids)
+            writer.add("chunk_ids", "i", self.chunk_ids)
+            writer.add("term_ptr", "q", self.term_ptr)
+            writer.add_file("post_docs", "i", part("post_docs"))
+            writer.add_file("post_vals", "f", part("post_vals"))
+            writer.close(
+                dict(meta or {}, paths=self.paths, n_terms=self.n_terms, build_id=uuid.uuid4().hex)
+            )
+        except BaseException:
+            writer.abort()
+            raise
+        finally:
+            shutil.rmtree(self._scratch, ignore_errors=True)
+
+    def abort(self) -> None:
+        self._release()
+        self._texts.abort()
+        shutil.rmtree(self._scratch, ignore_errors=True)
+
+
+def write_binary_index(path: str, text_path: str, n_terms: int, records: Sequence[VectorRecord],
+                       text_codec: str = "none") -> None:
+    """Serialize records and their term postings as flat arrays (see ``index_format``).
+
+    Every record needs its ``length``; :meth:`VectorStore.term_counts` gives it
+    for rows of an existing store.
+    """
+    term_counts = array("q", [0]) * n_terms
+    for rec in records:
+        for t in rec.indices:
+            term_counts[t] += 1
+    builder = BinaryIndexBuilder(path, text_path, term_counts, text_codec=text_codec)
+    try:
+        for rec in records:
+            builder.add(rec.path, rec.chunk_id, rec.text, rec.indices, rec.values, rec.norm, rec.length)
+    except BaseException:
+        builder.abort()
+        raise
+    builder.close()
+
+
+SCORING_MODES = ("tfidf", "bm25")
+
+
 class VectorStore:
     def __init__(self, root: str):
         self.root = root
+        # Build directory the artifacts are read from (see ``generations``).
+        self.dir = current_dir(root)
         self.vectorizer: Optional[TfidfVectorizer] = None
-        self.records: List[VectorRecord] = []
+        # The chunks, column by column; mapped from index.bin once it is loaded.
+        self._table = RecordTable()
+        self._postings: Optional[PostingsIndex] = None
+        self._csr: Optional["csr_backend.CsrScorer"] = None
+        self._index: Optional[IndexFile] = None
+        self._docs: Optional[DocTable] = None
+        self.text_codec = "none"
+        self.value_codec = "f32"
+        self._bm25: Optional[Bm25Index] = None
+        self._build_id = ""
+        self._shards: Optional[ShardTable] = None
+        self.n_shards = 1
+        self._deleted: Set[int] = set()  # rows tombstoned in deletes.log
+        # Append-only segments, numbered after the base rows. Each part keeps
+        # the vectorizer it was written with; ``vectorizer`` is the newest,
+        # global one and the base's own is kept in ``_base_vectorizer``.
+        self._segments: List["VectorStore"] = []
+        self._seg_starts: List[int] = []
+        self._base_vectorizer: Optional[TfidfVectorizer] = None
+        # A part's chunk norms under the global IDF and the corpus-wide BM25
+        # avgdl, read from its norms.bin (see ``write_part_scores``); a
+        # segmented store whose files do not match its vectorizer has them
+        # recomputed in memory (``_stale_scores``).
+        self._global_norms: Optional[Sequence[float]] = None
+        self._global_meta: Dict[str, Any] = {}
+        self._avgdl: Optional[float] = None
+        self._stale_scores = False
+        self._rescored = False
+        self.generation = 0
+        # Optional shared result cache; set by long-lived servers (see StoreManager).
+        self.cache: Optional[QueryCache] = None
 
     @property
     def vectorizer_path(self) -> str:
-        return os.path.join(self.root, "vectorizer.json")
+        """vocab.bin of the build directory, or the vectorizer.json of an older one."""
+        return vectorizer_file(self.dir)
 
     @property
     def index_path(self) -> str:
-        return os.path.join(self.root, "index.jsonl")
+        """Legacy JSONL index; still read when no binary index exists."""
+        return os.path.join(self.dir, "index.jsonl")
+
+    @property
+    def binary_index_path(self) -> str:
+        return os.path.join(self.dir, "index.bin")
+
+    @property
+    def text_path(self) -> str:
+        return os.path.join(self.dir, "texts.bin")
+
+    @property
+    def bm25_path(self) -> str:
+        return os.path.join(self.dir, "bm25.bin")
+
+    @property
+    def norms_path(self) -> str:
+        return os.path.join(self.dir, "norms.bin")
+
+    @property
+    def shards_path(self) -> str:
+        return os.path.join(self.dir, "shards.bin")
+
+    @property
+    def deletes_path(self) -> str:
+        return os.path.join(self.dir, "deletes.log")
+
+    @property
+    def docs_path(self) -> str:
+        return os.path.join(self.dir, DOCS_FILE)
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.dir, "meta.json")
+
+    @property
+    def records(self) -> List[VectorRecord]:
+        """Every row as a record; prefer :meth:`record` or :meth:`iter_records`."""
+        return [self.record(i) for i in range(len(self))]
 
-    def load(self) -> None:
+    @records.setter
+    def records(self, value: Iterable[VectorRecord]) -> None:
+        self._table = RecordTable.from_records(value)
+        self._index = None
+        self._docs = None
+        self._postings = None
+        self._csr = None
+        self._bm25 = None
+        self._build_id = ""
+        self._shards = None
+        self._deleted = set()
+        self._segments, self._seg_starts, self._base_vectorizer = [], [], None
+        self._global_norms, self._global_meta = None, {}
+
+    def _n_rows(self) -> int:
+        """Rows of the base index; ``len()`` also counts the segments."""
+        return len(self._table)
+
+    def __len__(self) -> int:
+        if self._segments:
+            return self._seg_starts[-1] + len(self._segments[-1])
+        return self._n_rows()
+
+    @property
+    def n_segments(self) -> int:
+        return len(self._segments)
+
+    @property
+    def n_deleted(self) -> int:
+        return sum(len(part._deleted) for part in self._parts())
+
+    def load(self, path: Optional[str] = None) -> None:
+        """Load the published build, or the build directory ``path``."""
+        self.dir = path or current_dir(self.root)
+        self.generation = int(read_meta(self.dir).get("generation", 0))
         self.vectorizer = TfidfVectorizer.load(self.vectorizer_path)
-        self.records = []
-        if not os.path.exists(self.index_path):
+        self._index = None
+        self._table = RecordTable()
+        self._docs = None
+        self._csr = None
+        self._bm25 = None
+        self._build_id = ""
+        self._shards = None
+        self._segments, self._seg_starts, self._base_vectorizer = [], [], None
+        self._global_norms, self._global_meta = None, {}
+        self._avgdl, self._stale_scores, self._rescored = None, False, False
+        if os.path.exists(self.binary_index_path):
+            self._load_binary()
+            self._load_segments()
             return
-        with open(self.index_path, "r", encoding="utf-8") as f:
-            for line in f:
-                if not line.strip():
-                    continue
-                obj = json.loads(line)
-                self.records.append(
-                    VectorRecord(
-                        path=obj["path"],
-                        chunk_id=int(obj["chunk_id"]),
-                        text=obj["text"],
-                        indices=list(obj["embedding"]["indices"]),
-                        values=list(obj["embedding"]["values"]),
-                        norm=float(obj["embedding"]["norm"]),
+        self.records = read_jsonl_records(self.index_path) if os.path.exists(self.index_path) else []
+        self.build_postings()
+        self._load_tombstones()
+
+    def _load_binary(self) -> None:
+        index = IndexFile(self.binary_index_path)
+        self._index = index
+        self.value_codec = value_codec(index)
+        self._build_id = index.meta.get("build_id", "")
+        self._bm25 = Bm25Index.open(self.bm25_path, build_id=self._build_id)
+        self._shards = ShardTable.open(self.shards_path, build_id=self._build_id)
+        self.n_shards = self._shards.n_shards if self._shards is not None else 1
+        self._csr = None
+        texts = TextStore(self.text_path)
+        self.text_codec = texts.codec
+        self._table = RecordTable.from_index(index, texts)
+        self._docs = DocTable.load(self.docs_path, build_id=self._build_id)
+        self._global_norms, self._global_meta = None, {}
+        if os.path.exists(self.norms_path):
+            norms = IndexFile(self.norms_path)
+            if norms.meta.get("build_id") == self._build_id:
+                self._global_norms, self._global_meta = norms.section("norms"), norms.meta
+        self._postings = PostingsIndex(
+            index.section("term_ptr"), index.section("post_docs"), index.section("post_vals")
+        )
+        self._load_tombstones()
+
+    def _load_segments(self) -> None:
+        start = self._n_rows()
+        for name in read_segments(self.dir):
+            seg = VectorStore(self.root)
+            seg.load(os.path.join(self.dir, name))
+            self._segments.append(seg)
+            self._seg_starts.append(start)
+            start += len(seg)
+        if self._segments:
+            # Each segment is written with the vocabulary and IDF of everything before it.
+            self._base_vectorizer = self.vectorizer
+            self.vectorizer = self._segments[-1].vectorizer
+            self._load_tombstones()
+            self._stale_scores = not self._part_scores_current()
+
+    def _part_scores_current(self) -> bool:
+        """Whether every part's norms.bin and bm25.bin were written for the global statistics."""
+        vec = self.vectorizer
+        avgdl = self._global_meta.get("avgdl")
+        return avgdl is not None and all(
+            part._global_meta.get("n_docs") == vec.n_docs_
+            and part._global_meta.get("n_terms") == len(vec.vocabulary_)
+            and part._global_meta.get("avgdl") == avgdl
+            and part._bm25 is not None and part._bm25.meta.get("avgdl") == avgdl
+            for part in self._parts()
+        )
+
+    def _corpus_avgdl(self) -> float:
+        """Mean length of the live chunks of every part, as a rebuild computes it."""
+        total, n = 0.0, 0
+        for part in self._parts():
+            indptr, indices, values, _ = part._csr_parts()
+            idf = (part._base_vectorizer or part.vectorizer).idf_
+            for row, length in enumerate(row_lengths(indptr, indices, values, idf, part._table.lengths)):
+                if row not in part._deleted:
+                    total += length
+                    n += 1
+        return total / n if n else 0.0
+
+    def _part_norms(self, start: int, part: "VectorStore") -> array:
+        """Norms of ``part``'s chunks (starting at global row ``start``) under the global IDF."""
+        vec = self.vectorizer
+        return array("d", (
+            _sparse_norm(vec.vectorize_term_ids(self.term_counts(start + row))[1])
+            for row in range(part._n_rows())
+        ))
+
+    def _rescore_parts(self) -> None:
+        """Recompute the parts' global norms and BM25 impacts in memory for stale files."""
+        avgdl = self._corpus_avgdl()
+        for start, part in zip([0] + self._seg_starts, self._parts()):
+            part._global_norms = self._part_norms(start, part)
+            part._avgdl, part._bm25 = avgdl, None
+        self._rescored = True
+
+    def write_part_scores(self) -> None:
+        """Write each part's norms.bin and bm25.bin for the statistics of the whole store.
+
+        Every part of a segmented store is scored with the global IDF; this
+        stores its chunk norms under that IDF and its BM25 impacts with the
+        corpus-wide average length, so scores equal those of a rebuild.
+        Files are replaced, never written through links to older generations.
+        """
+        vec = self.vectorizer
+        avgdl = self._corpus_avgdl()
+        meta = {"n_docs": vec.n_docs_, "n_terms": len(vec.vocabulary_), "avgdl": avgdl}
+        for start, part in zip([0] + self._seg_starts, self._parts()):
+            norms = self._part_norms(start, part)
+            writer = IndexWriter(part.norms_path)
+            try:
+                writer.add("norms", "d", norms)
+            except BaseException:
+                writer.abort()
+                raise
+            part._global_meta = dict(meta, build_id=part._build_id)
+            writer.close(part._global_meta)
+            part._global_norms = norms
+            part._avgdl, part._bm25 = avgdl, None
+            part.write_bm25()
+        self._stale_scores = False
+
+    def _load_tombstones(self) -> None:
+        deleted = read_deletes(self.deletes_path)
+        for part in self._parts():
+            part._deleted = deleted.get(part._build_id, set())
+
+    def _parts(self) -> List["VectorStore"]:
+        """The base followed by the segments."""
+        return [self] + self._segments
+
+    def _locate(self, i: int) -> Tuple["VectorStore", int]:
+        """(part, row within it) of global row ``i``."""
+        if not self._segments or i < self._seg_starts[0]:
+            return self, i
+        j = bisect_right(self._seg_starts, i) - 1
+        return self._segments[j], i - self._seg_starts[j]
+
+    def text(self, i: int) -> str:
+        """Chunk text of row ``i``, read from texts.bin on demand."""
+        part, row = self._locate(i)
+        return part._table.text(row)
+
+    def path_of(self, i: int) -> str:
+        part, row = self._locate(i)
+        return part._table.path(row)
+
+    def chunk_id_of(self, i: int) -> int:
+        part, row = self._locate(i)
+        return part._table.chunk_ids[row]
+
+    def record(self, i: int) -> VectorRecord:
+        """Row ``i`` as a view of the table; fields are read when accessed."""
+        part, row = self._locate(i)
+        if part is not self:
+            return self._reweigh(part.record(row), part.vectorizer)
+        rec = self._table[row]
+        return self._reweigh(rec, self._base_vectorizer) if self._segments else rec
+
+    def _reweigh(self, rec: VectorRecord, written: TfidfVectorizer) -> VectorRecord:
+        """``rec`` with its weights moved from the IDF it was written with to the global one."""
+        if written is self.vectorizer:
+            return rec
+        old, new = written.idf_, self.vectorizer.idf_
+        values = [v * new[t] / old[t] for t, v in zip(rec.indices, rec.values)]
+        return VectorRecord(
+            rec.path, rec.chunk_id, rec.text, rec.indices, values, _sparse_norm(values), rec.length
+        )
+
+    def term_counts(self, i: int) -> Dict[int, int]:
+        """Token count of each term of row ``i``, recovered from its weights.
+
+        A weight is ``count / length * idf``, so with the row's stored length
+        the counts come back exactly, also from 8-bit weights (half a step is
+        far less than one count). Rows of older stores without lengths get the
+        length BM25 infers from the weights.
+        """
+        rec = self.record(i)
+        idf = self.vectorizer.idf_
+        ratios = [v / idf[t] for t, v in zip(rec.indices, rec.values)]
+        length = rec.length if rec.length is not None else _row_length(ratios)
+        return {t: max(1, round(r * length)) for t, r in zip(rec.indices, ratios)}
+
+    def rewritten_record(self, i: int, vectorizer: Optional[TfidfVectorizer] = None,
+                         remap: Optional[Sequence[int]] = None) -> VectorRecord:
+        """Row ``i`` recomputed from its term counts with ``vectorizer`` (default: the store's).
+
+        ``remap`` maps the store's term ids to those of ``vectorizer``; terms
+        mapped to -1 are dropped. The weights are those a fresh build writes,
+        so carrying a row into a new build never compounds quantization error.
+        """
+        vectorizer = vectorizer or self.vectorizer
+        counts = self.term_counts(i)
+        if remap is not None:
+            counts = {remap[t]: c for t, c in counts.items() if remap[t] >= 0}
+        indices, values = vectorizer.vectorize_term_ids(counts)
+        return VectorRecord(
+            self.path_of(i), self.chunk_id_of(i), self.text(i), indices, values,
+            _sparse_norm(values), sum(counts.values()),
+        )
+
+    def _n_terms(self) -> int:
+        if self.vectorizer is not None:
+            return len(self.vectorizer.vocabulary_)
+        return 1 + max(self._table.indices, default=-1)
+
+    def build_postings(self) -> PostingsIndex:
+        """(Re)build the term -> chunk postings from the table."""
+        table = self._table
+        self._postings = PostingsIndex.from_rows(
+            self._n_terms(), [(table.row_indices(r), table.row_values(r)) for r in range(len(table))]
+        )
+        return self._postings
+
+    def is_ready(self) -> bool:
+        return self.vectorizer is not None and len(self) > self.n_deleted
+
+    def _is_deleted(self, i: int) -> bool:
+        part, row = self._locate(i)
+        return row in part._deleted
+
+    def iter_records(self) -> Iterator[VectorRecord]:
+        """Records in row order, skipping deleted chunks."""
+        for i in range(len(self)):
+            if not self._is_deleted(i):
+                yield self.record(i)
+
+    def _doc_table(self) -> DocTable:
+        if self._docs is None:  # docs.json missing or stale: derive it from the columns
+            t = self._table
+            self._docs = DocTable.build(t.path_ids, t.chunk_ids, t.paths, self._build_id)
+        return self._docs
+
+    def docs(self) -> DocCatalog:
+        """Documents and chunk rows of the store (see ``doc_table``), sharing its deletes."""
+        return DocCatalog(
+            [(part.dir, part._doc_table(), part._deleted) for part in self._parts()], text=self.text
+        )
+
+    def write_docs(self, stats: Optional[Dict[str, Dict]] = None) -> None:
+        """Write docs.json for the loaded index; ``stats`` maps paths to their size and mtime_ns."""
+        t = self._table
+        self._docs = DocTable.build(t.path_ids, t.chunk_ids, t.paths, self._build_id, stats)
+        self._docs.save(self.docs_path)
+
+    def delete(self, path: str, chunk_id: Optional[int] = None) -> int:
+        """Delete the chunks of ``path`` (all of them, or only ``chunk_id``).
+
+        The rows are appended to ``deletes.log`` rather than rewriting the
+        index; queries skip them straight away and :meth:`compact` drops them
+        for good. Returns the number of chunks deleted.
+        """
+        return self.docs().delete(path, chunk_id)
+
+    def delete_rows(self, rows: Iterable[int]) -> int:
+        """Delete chunks by (global) row number; returns how many were not deleted yet."""
+        return self.docs().delete_rows(rows)
+
+    def tombstones(self) -> Dict[str, Set[int]]:
+        """Deleted rows by build id, as loaded (a copy); see ``doc_table.carry_deletes``."""
+        return {part._build_id: set(part._deleted) for part in self._parts()}
+
+    def compact(self) -> Optional[int]:
+        """Publish a new generation folding in the deleted chunks and every segment.
+
+        Returns how many deleted chunks were dropped, or None if there was
+        nothing to compact.
+        """
+        if not self.n_deleted and not self._segments:
+            return None
+        dropped = self.n_deleted
+        self.save()
+        return dropped
+
+    def _top_k(
+        self,
+        mode: str,
+        query,
+        k: int,
+        min_score: Optional[float] = None,
+        lo: Optional[Sequence[int]] = None,
+        hi: Optional[Sequence[int]] = None,
+        subset: Optional[RowSubset] = None,
+    ) -> List[Tuple[float, int]]:
+        """Best k chunks sharing a term with ``query``, unpadded.
+
+        ``query`` is ``(q_idx, q_val)`` for TF-IDF, optionally followed by the
+        query norm when ``q_val`` was rescaled for a segment, and term ->
+        count (or weight) for BM25; ``lo``/``hi`` restrict the posting lists
+        to one shard, and ``subset`` scores only the rows a filter selected.
+        """
+        postings = self._postings or self.build_postings()
+        if mode == "bm25":
+            bm25 = self.bm25_index()
+            if subset is None or subset.dense:
+                allow = subset.bitmap() if subset is not None else None
+                top = max_score_top_k(
+                    postings.term_ptr, postings.docs, bm25, query, k, lo, hi, self._deleted, allow
+                )
+            else:  # one MaxScore pass per row range of the filter
+                merged = [
+                    (-score, doc)
+                    for lo, hi in subset.term_bounds(postings.term_ptr, postings.docs, query)
+                    for score, doc in max_score_top_k(
+                        postings.term_ptr, postings.docs, bm25, query, k, lo, hi, self._deleted
                     )
+                ]
+                top = [(-neg, doc) for neg, doc in heapq.nsmallest(k, merged)]
+            return top if min_score is None else [(s, doc) for s, doc in top if s >= min_score]
+        q_idx, q_val = query[0], query[1]
+        q_norm = query[2] if len(query) > 2 else _sparse_norm(q_val)
+        if subset is not None:
+            dots = postings.accumulate_subset(q_idx, q_val, subset)
+        else:
+            dots = postings.accumulate(q_idx, q_val, lo, hi)
+        return self._rank_tfidf(q_norm, dots, k, min_score)
+
+    def _rank_tfidf(
+        self, q_norm: float, dots: Dict[int, float], k: int, min_score: Optional[float]
+    ) -> List[Tuple[float, int]]:
+        q_norm = q_norm or 1e-12
+        norms = self._global_norms if self._global_norms is not None else self._table.norms
+        deleted = self._deleted
+        scales = self._table.scales
+        # Only chunks sharing at least one term with the query are candidates;
+        # a bounded heap keeps the best k as (-score, doc) so ties favour lower ids.
+        if scales is None:
+            candidates = (
+                (-(dot / (q_norm * (norms[doc] or 1e-12))), doc)
+                for doc, dot in dots.items()
+                if doc not in deleted
+            )
+        else:  # dots over quantized postings are in units of each chunk's scale
+            candidates = (
+                (-(dot * scales[doc] / (q_norm * (norms[doc] or 1e-12))), doc)
+                for doc, dot in dots.items()
+                if doc not in deleted
+            )
+        if min_score is not None:
+            candidates = (c for c in candidates if -c[0] >= min_score)
+        return [(-neg, doc) for neg, doc in heapq.nsmallest(k, candidates)]
+
+    def _search(
+        self, q_idx: List[int], q_val: List[float], k: int, min_score: Optional[float] = None
+    ) -> List[Tuple[float, int]]:
+        top = self._top_k("tfidf", (q_idx, q_val), k, min_score)
+        return self._pad_top_k(top, k) if min_score is None else top
+
+    def _shard_top_k(
+        self, shard: int, mode: str, query, k: int, min_score: Optional[float] = None
+    ) -> List[Tuple[float, int]]:
+        lo, hi = self._shards.bounds(shard)
+        return self._top_k(mode, query, k, min_score, lo, hi)
+
+    def _sharded_top_k(
+        self, mode: str, query, k: int, min_score: Optional[float] = None
+    ) -> List[Tuple[float, int]]:
+        """Score every shard, in worker processes when there is more than one, and merge."""
+        n = self._shards.n_shards
+        parts: List[Optional[List[Tuple[float, int]]]] = [None] * n
+        workers = resolve_search_workers(n)
+        deleted = self._deleted
+        if workers > 1:
+            pool = get_pool(workers)
+            # A worker that loaded the deletes log before the latest deletes re-reads it.
+            futures = [
+                pool.submit(
+                    search_shard, self.dir, self._build_id, s, mode, query, k, min_score, len(deleted)
                 )
+                for s in range(n)
+            ]
+            parts = [f.result() for f in futures]
+        # Shards a worker could not serve (the files were replaced since) run here.
+        parts = [
+            part if part is not None else self._shard_top_k(s, mode, query, k, min_score)
+            for s, part in enumerate(parts)
+        ]
+        merged = ((-score, doc) for part in parts for score, doc in part if doc not in deleted)
+        return [(-neg, doc) for neg, doc in heapq.nsmallest(k, merged)]
 
-    def is_ready(self) -> bool:
-        return self.vectorizer is not None and len(self.records) > 0
+    def _segmented_top_k(
+        self, mode: str, terms: Dict[int, int], k: int, min_score: Optional[float] = None,
+        subsets: Optional[List[RowSubset]] = None,
+    ) -> List[Tuple[float, int]]:
+        """Score the base and every segment with global IDF and merge their top k.
+
+        Each part's postings carry the IDF it was written with, so the query
+        weight of every term is rescaled by global / written IDF per part,
+        and its chunk norms and BM25 impacts are those under the global IDF
+        and corpus-wide avgdl (see :meth:`write_part_scores`), so the scores
+        are a rebuild's. ``subsets`` (one per part) restrict the scoring to
+        the rows of a filter.
+        """
+        if self._stale_scores and not self._rescored:
+            self._rescore_parts()
+        vec = self.vectorizer
+        if mode == "bm25":
+            weights = {t: c * term_idf(vec.n_docs_, vec.df_[t]) for t, c in terms.items()}
+        else:
+            q_idx, q_val = vec.vectorize_term_ids(terms)
+            weights = dict(zip(q_idx, q_val))
+            q_norm = _sparse_norm(q_val)
+        merged: List[Tuple[float, int]] = []
+        for p, (start, part) in enumerate(zip([0] + self._seg_starts, self._parts())):
+            subset = subsets[p] if subsets is not None else None
+            if subset is not None and not subset.ranges:
+                continue
+            written = (part._base_vectorizer or part.vectorizer).idf_
+            term_ptr = part._postings.term_ptr
+            n_terms = len(term_ptr) - 1
+            if mode == "bm25":
+                n_rows = part._n_rows()
+                query = {}
+                for t, w in weights.items():
+                    df = term_ptr[t + 1] - term_ptr[t] if t < n_terms else 0
+                    if df:
+                        query[t] = w / term_idf(n_rows, df)
+            else:
+                scaled = [(t, w * vec.idf_[t] / written[t]) for t, w in weights.items() if t < n_terms]
+                query = ([t for t, _ in scaled], [w for _, w in scaled], q_norm)
+            if subset is not None:
+                hits = part._top_k(mode, query, k, min_score, subset=subset)
+            elif part._shards is not None and not self._stale_scores:
+                # Workers read the part's files, so parts rescored in memory run here.
+                hits = part._sharded_top_k(mode, query, k, min_score)
+            else:
+                hits = part._top_k(mode, query, k, min_score)
+            merged.extend((-score, start + doc) for score, doc in hits)
+        return [(-neg, doc) for neg, doc in heapq.nsmallest(k, merged)]
+
+    def _pad_top_k(
+        self, top: List[Tuple[float, int]], k: int, subsets: Optional[List[RowSubset]] = None
+    ) -> List[Tuple[float, int]]:
+        if len(top) < k:
+            # Pad with zero-score chunks in corpus order, as a full scan would.
+            hit = {doc for _, doc in top}
+            if subsets is None:
+                rows: Iterable[int] = range(len(self))
+            else:
+                rows = (
+                    start + row
+                    for start, subset in zip([0] + self._seg_starts, subsets) for row in subset.rows()
+                )
+            for doc in rows:
+                if len(top) >= k:
+                    break
+                if doc not in hit and not self._is_deleted(doc):
+                    top.append((0.0, doc))
+        return top
+
+    def _query_terms(self, text: str) -> Dict[int, int]:
+        """In-vocabulary term id -> count: everything about a query that affects its scores."""
+        query: Dict[int, int] = {}
+        for tok in self.vectorizer._tokenize(text):
+            t = self.vectorizer.vocab_index.get(tok)
+            if t is not None:
+                query[t] = query.get(t, 0) + 1
+        return query
+
+    def select(self, flt: DocFilter) -> List[RowSubset]:
+        """Rows matching ``flt`` in the base and in each segment, from their doc tables."""
+        return [part._doc_table().select(flt) for part in self._parts()]
 
-    def query(self, text: str, k: int = 5) -> List[Tuple[float, VectorRecord]]:
+    def query(
+        self, text: str, k: int = 5, min_score: Optional[float] = None, mode: str = "tfidf",
+        path_prefix: Optional[str] = None, source: Optional[Union[str, Sequence[str]]] = None,
+        metadata: Optional[Mapping[str, Any]] = None,
+    ) -> List[Tuple[float, VectorRecord]]:
+        """Top-k chunks by TF-IDF cosine similarity (``mode="tfidf"``) or BM25.
+
+        Without ``min_score`` the result is padded with zero-score chunks up to
+        ``k``; with it, only chunks sharing a term with the query and scoring
+        at least ``min_score`` are returned.
+
+        ``path_prefix``, ``source`` (a source type or several: html, md, pdf,
+        other) and ``metadata`` (exact values of doc table fields such as
+        ``size``) restrict the search to matching documents; only their rows
+        are scored, and padding comes from them too.
+        """
+        if self.vectorizer is None:
+            raise RuntimeError("Vectorizer not loaded.")
+        if mode not in SCORING_MODES:
+            raise ValueError(f"unknown scoring mode: {mode} (expected one of {SCORING_MODES})")
+        terms = self._query_terms(text)
+        flt = DocFilter.of(path_prefix, source, metadata)
+        cache = self.cache
+        if cache is not None:
+            tag = self._cache_tag()
+            key = (mode, k, min_score, tuple(sorted(terms.items())))
+            if flt is not None:
+                key += (flt.key(),)
+            hits = cache.get(tag, key)
+            if hits is not None:
+                return [(s, self.record(doc)) for s, doc in hits]
+        subsets = self.select(flt) if flt is not None else None
+        if self._segments:
+            hits = self._segmented_top_k(mode, terms, k, min_score, subsets)
+        else:
+            query = terms if mode == "bm25" else self.vectorizer.vectorize_term_ids(terms)
+            if subsets is not None:
+                hits = self._top_k(mode, query, k, min_score, subset=subsets[0])
+            elif self._shards is not None:
+                hits = self._sharded_top_k(mode, query, k, min_score)
+            else:
+                hits = self._top_k(mode, query, k, min_score)
+        if min_score is None:
+            hits = self._pad_top_k(hits, k, subsets)
+        if cache is not None:
+            cache.put(tag, key, tuple(hits))
+        return [(s, self.record(doc)) for s, doc in hits]
+
+    def _cache_tag(self) -> Tuple:
+        return (self.generation, self._build_id, len(self), self.n_deleted)
+
+    def _csr_parts(self) -> Tuple[Sequence[int], Sequence[int], Sequence[float], Sequence[float]]:
+        """(indptr, indices, values, norms) of the corpus rows, with float values."""
+        t = self._table
+        values = t.values if t.scales is None else dequantize(t.indptr, t.values, t.scales)
+        return (t.indptr, t.indices, values, t.norms)
+
+    def bm25_index(self) -> Bm25Index:
+        """BM25 impacts aligned with the postings; computed here if bm25.bin is missing or stale."""
+        if self._bm25 is None:
+            indptr, indices, values, _ = self._csr_parts()
+            postings = self._postings or self.build_postings()
+            self._bm25 = Bm25Index.build(
+                indptr, indices, values, postings.term_ptr, postings.docs, postings.weights,
+                (self._base_vectorizer or self.vectorizer).idf_, build_id=self._build_id,
+                lengths=self._table.lengths, avgdl=self._avgdl,
+            )
+        return self._bm25
+
+    def quantize(self, codec: str) -> None:
+        """Store index.bin with the ``codec`` value codec (see ``quantize``) and reload it.
+
+        Only ``u8`` is applied in place; BM25 impacts must be written first,
+        from the float weights. Going back to ``f32`` takes a rebuild.
+        """
+        if codec == "u8" and self.value_codec != "u8" and self._index is not None:
+            quantize_index(self.binary_index_path)
+            self._load_binary()
+
+    def write_bm25(self) -> None:
+        self.bm25_index().save(self.bm25_path)
+
+    def write_shards(self, n_shards: Optional[int] = None) -> None:
+        """Split the rows into ``n_shards`` (default: keep the current count) in shards.bin."""
+        self.n_shards = max(1, self.n_shards if n_shards is None else n_shards)
+        if self.n_shards == 1 or self._index is None:
+            self._shards = None
+            if os.path.exists(self.shards_path):
+                os.remove(self.shards_path)
+            return
+        postings = self._postings
+        self._shards = ShardTable.build(
+            self.n_shards, self._table.indptr, postings.term_ptr, postings.docs, self._build_id
+        )
+        self._shards.save(self.shards_path)
+
+    def csr_scorer(self) -> Optional["csr_backend.CsrScorer"]:
+        """CSR matrix of the corpus for the numpy/scipy backend, or None if unavailable."""
+        if self._csr is None and csr_backend.available():
+            t = self._table
+            if t.scales is None:
+                self._csr = csr_backend.CsrScorer(self._n_terms(), *self._csr_parts())
+            else:
+                # Score the quantized values: each row's scale folds into its norm.
+                norms = array("d", (n / s if s else n for n, s in zip(t.norms, t.scales)))
+                self._csr = csr_backend.CsrScorer(self._n_terms(), t.indptr, t.indices, t.values, norms)
+        return self._csr
+
+    def query_batch(
+        self, texts: Sequence[str], k: int = 5, min_score: Optional[float] = None,
+        mode: str = "tfidf", path_prefix: Optional[str] = None,
+        source: Optional[Union[str, Sequence[str]]] = None, metadata: Optional[Mapping[str, Any]] = None,
+    ) -> List[List[Tuple[float, VectorRecord]]]:
+        """Score several queries together; same results as calling :meth:`query` on each.
+
+        TF-IDF batches are one sparse matrix product when numpy/scipy are
+        installed, else one pass over the posting lists of all query terms.
+        BM25 queries, filtered queries and stores with segments run one by one.
+        """
         if self.vectorizer is None:
             raise RuntimeError("Vectorizer not loaded.")
-        (q_idx, q_val) = self.vectorizer.transform_sparse([text])[0]
-        q_norm = _sparse_norm(q_val)
-        scored: List[Tuple[float, VectorRecord]] = []
-        for rec in self.records:
-            s = _cosine_sim(q_idx, q_val, q_norm, rec.indices, rec.values, rec.norm)
-            scored.append((s, rec))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return scored[:k]
+        if mode not in SCORING_MODES:
+            raise ValueError(f"unknown scoring mode: {mode} (expected one of {SCORING_MODES})")
+        if mode != "tfidf" or self._segments or DocFilter.of(path_prefix, source, metadata) is not None:
+            return [
+                self.query(text, k=k, min_score=min_score, mode=mode, path_prefix=path_prefix,
+                           source=source, metadata=metadata)
+                for text in texts
+            ]
+        terms = [self._query_terms(text) for text in texts]
+        keys = [(mode, k, min_score, tuple(sorted(t.items()))) for t in terms]
+        cache = self.cache
+        tag = self._cache_tag()
+        hits = [cache.get(tag, key) if cache is not None else None for key in keys]
+        todo = [i for i, top in enumerate(hits) if top is None]
+        if todo:
+            queries = [self.vectorizer.vectorize_term_ids(terms[i]) for i in todo]
+            for i, top in zip(todo, self._batch_top_k(queries, k, min_score)):
+                hits[i] = tuple(self._pad_top_k(top, k) if min_score is None else top)
+                if cache is not None:
+                    cache.put(tag, keys[i], hits[i])
+        return [[(s, self.record(doc)) for s, doc in top] for top in hits]
+
+    def _batch_top_k(
+        self, queries: List[Tuple[List[int], List[float]]], k: int, min_score: Optional[float]
+    ) -> List[List[Tuple[float, int]]]:
+        scorer = self.csr_scorer()
+        if scorer is not None:
+            deleted = self._deleted
+            tops = scorer.top_k(queries, k + len(deleted))
+            if min_score is not None:
+                tops = [[(s, d) for s, d in top if s >= min_score] for top in tops]
+            if deleted:
+                tops = [[(s, d) for s, d in top if d not in deleted][:k] for top in tops]
+            return tops
+        postings = self._postings or self.build_postings()
+        return [
+            self._rank_tfidf(_sparse_norm(q_val), dots, k, min_score)
+            for (_, q_val), dots in zip(queries, postings.accumulate_batch(queries))
+        ]
 
     def save(self) -> None:
+        """Write the store as a new generation directory and publish it atomically.
+
+        Deleted rows are left out and the vectorizer is refit to the remaining
+        ones, so frequencies, IDF and weights are those of a rebuild. The
+        manifest is carried over with the new row ranges, and a file whose
+        chunks were all deleted keeps an empty entry, so the next incremental
+        ingest neither re-extracts the store nor brings the file back.
+        """
+        if self.vectorizer is None:
+            raise RuntimeError("Vectorizer not loaded.")
         os.makedirs(self.root, exist_ok=True)
-        # Persist index.jsonl
-        with open(self.index_path, "w", encoding="utf-8") as f:
-            for rec in self.records:
-                obj = {
-                    "path": rec.path,
-                    "chunk_id": rec.chunk_id,
-                    "text": rec.text,
-                    "embedding": {
-                        "indices": rec.indices,
-                        "values": rec.values,
-                        "norm": rec.norm,
-                    },
-                }
-                f.write(json.dumps(obj, ensure_ascii=False) + "\n")
-        # Persist meta.json
-        meta = {
-            "total_files": len({r.path for r in self.records}),
-            "total_chunks": len(self.records),
-        }
-        with open(os.path.join(self.root, "meta.json"), "w", encoding="utf-8") as f:
-            json.dump(meta, f)
+        rows = [i for i in range(len(self)) if not self._is_deleted(i)]
+        vectorizer, remap = self._refit(rows)
+        manifest = load_manifest(self.dir)
+        n_shards = self.n_shards
+        codec = self.value_codec
+        stats = self.docs().docs()
+        source_dir, known = self.dir, self.tombstones()
+        published = int(read_meta(current_dir(self.root)).get("generation", 0))
+        generation = next_generation(self.root, published)
+        gen_dir = new_generation_dir(self.root, generation)
+        previous_dir, self.dir = self.dir, gen_dir
+        try:
+            vectorizer.save(os.path.join(gen_dir, VOCAB_FILE))
+            self._write_rows(rows, vectorizer, remap)
+            # Serve from the new files and precompute BM25 impacts and shards for them
+            self.vectorizer = vectorizer
+            self._segments, self._seg_starts, self._base_vectorizer = [], [], None
+            self._avgdl, self._stale_scores, self._rescored = None, False, False
+            self._load_binary()
+            self.write_bm25()
+            self.write_shards(n_shards)
+            self.quantize(codec)
+            self.write_docs(stats)
+            write_meta(
+                gen_dir, generation, total_files=len(stats), total_chunks=len(rows),
+                vocabulary=vectorizer.pruning_,
+            )
+            if manifest:
+                save_manifest(gen_dir, _remapped_manifest(manifest, self._doc_table()))
+        except BaseException:
+            self.dir = previous_dir
+            discard(gen_dir)
+            raise
+        self.generation = generation
+        publish_build(self.root, gen_dir, source_dir, known)
+        self._load_tombstones()
+
+    def _refit(self, rows: Sequence[int]) -> Tuple[TfidfVectorizer, List[int]]:
+        """Vectorizer refit to the chunk frequencies of ``rows``, and old -> new term ids."""
+        vec = self.vectorizer
+        counts = array("q", [0]) * len(vec.vocabulary_)
+        for i in rows:
+            for t in self.record(i).indices:
+                counts[t] += 1
+        refit = vec.refit(dict(zip(vec.vocabulary_, counts)), len(rows))
+        get = refit.vocab_index.get
+        return refit, [get(term, -1) for term in vec.vocabulary_]
+
+    def _write_rows(self, rows: Sequence[int], vectorizer: TfidfVectorizer, remap: Sequence[int]) -> None:
+        """Write ``rows`` to index.bin and texts.bin of ``self.dir``, recomputed with ``vectorizer``."""
+        builder = BinaryIndexBuilder(
+            self.binary_index_path, self.text_path, vectorizer.df_, text_codec=self.text_codec
+        )
+        try:
+            for i in rows:
+                rec = self.rewritten_record(i, vectorizer, remap)
+                builder.add(rec.path, rec.chunk_id, rec.text, rec.indices, rec.values, rec.norm, rec.length)
+        except BaseException:
+            builder.abort()
+            raise
+        builder.close()
+
+    def export_jsonl(self, path: str) -> None:
+        write_jsonl_records(path, self.iter_records())
+
+    def import_jsonl(self, path: str) -> None:
+        self.records = read_jsonl_records(path)
+
+
+def _remapped_manifest(manifest: Dict[str, Dict], table: DocTable) -> Dict[str, Dict]:
+    """``manifest`` with the row ranges of a rewritten index; files with no rows left get none.
+
+    Files whose rows are no longer contiguous are left out, so an ingest picks them up again.
+    """
+    out: Dict[str, Dict] = {}
+    for path, entry in manifest.items():
+        runs = table.docs.get(path, {}).get("runs") or [[0, 0, 0]]
+        start, count = runs[0][0], sum(run[1] for run in runs)
+        if runs[-1][0] + runs[-1][1] - start == count:
+            out[path] = dict(entry, chunk_start=start, chunk_count=count)
+    return out
+
+
+def read_meta(root: str) -> Dict:
+    try:
+        with open(os.path.join(root, "meta.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_meta(root: str, generation: int, **fields) -> Dict:
+    """Write meta.json of a build directory; ``generation`` orders builds for long-lived readers."""
+    meta = dict(fields, generation=generation)
+    path = os.path.join(root, "meta.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(path + ".tmp", path)  # a forked build shares the old file through a hard link
+    return meta
 
 
 def load_default_store() -> VectorStore:
@@ -0,0 +1,151 @@
+"""Binary vocabulary file (``vocab.bin``) of a ``TfidfVectorizer``.
+
+Sections (see ``index_format``), for a vocabulary of ``n`` terms:
+
+    term_ptr  q  byte offset of each term (by id) in ``terms``; n + 1 entries
+    terms     B  the UTF-8 terms, concatenated in id order
+    order     i  term ids sorted by term
+    idf       f  IDF by term id
+    df        i  chunk frequency by term id
+
+The footer meta holds the corpus size and the pruning settings. Opening the
+file maps it and parses only the footer: :class:`TermList` and
+:class:`TermIndex` read terms from the mapping when asked, and a term's id is
+a binary search over ``order`` (UTF-8 byte order is code point order, so
+``order`` is simply the ids sorted by term). Startup cost and resident memory
+no longer grow with the vocabulary.
+
+Decoding a term per probe makes that search far slower than a dict, so
+:class:`TermIndex` first bisects a decoded sample of every ``FENCE``-th
+sorted term (built on the first lookup) and only probes the mapping within
+one block, and it remembers recent answers: query terms repeat, and a hit
+costs a dict lookup.
+
+Stores written before this file keep a ``vectorizer.json`` and are still read.
+"""
+
+import os
+from array import array
+from bisect import bisect_right
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from .index_format import IndexWriter
+
+VOCAB_FILE = "vocab.bin"
+LEGACY_VECTORIZER_FILE = "vectorizer.json"
+
+# Sorted terms per block of the decoded sample TermIndex bisects first.
+FENCE = 32
+# Looked-up terms TermIndex remembers (found or not) before starting over.
+HOT_TERMS = 1 << 16
+
+_MISSING = object()
+
+
+def vectorizer_file(build_dir: str) -> str:
+    """Path of the vectorizer of ``build_dir``: vocab.bin, or a legacy vectorizer.json."""
+    path = os.path.join(build_dir, VOCAB_FILE)
+    legacy = os.path.join(build_dir, LEGACY_VECTORIZER_FILE)
+    return legacy if not os.path.exists(path) and os.path.exists(legacy) else path
+
+
+def write_vocab(path: str, vocabulary: Sequence[str], idf: Sequence[float], df: Sequence[int],
+                meta: Dict[str, Any]) -> None:
+    term_ptr = array("q", [0])
+    terms = bytearray()
+    for term in vocabulary:
+        terms += term.encode("utf-8")
+        term_ptr.append(len(terms))
+    order = array("i", sorted(range(len(vocabulary)), key=vocabulary.__getitem__))
+    writer = IndexWriter(path)
+    try:
+        writer.add("term_ptr", "q", term_ptr)
+        writer.add("terms", "B", terms)
+        writer.add("order", "i", order)
+        writer.add("idf", "f", array("f", idf))
+        writer.add("df", "i", array("i", df))
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close(meta)
+
+
+class TermList(Sequence[str]):
+    """Terms by id, decoded from the mapped file on access."""
+
+    def __init__(self, term_ptr: Sequence[int], terms: memoryview):
+        self._ptr = term_ptr
+        self._terms = terms
+
+    def __len__(self) -> int:
+        return len(self._ptr) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self.term_bytes(i).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        ptr, terms = self._ptr, self._terms
+        for i in range(len(self)):
+            yield bytes(terms[ptr[i]:ptr[i + 1]]).decode("utf-8")
+
+    def term_bytes(self, i: int) -> bytes:
+        return bytes(self._terms[self._ptr[i]:self._ptr[i + 1]])
+
+
+class TermIndex:
+    """Term -> id lookup by binary search over the sorted ids; a read-only dict stand-in."""
+
+    def __init__(self, terms: TermList, order: Sequence[int]):
+        self._terms = terms
+        self._order = order
+        self._fence: Optional[List[bytes]] = None
+        self._hot: Dict[str, Optional[int]] = {}
+
+    def get(self, term: str, default: Optional[int] = None) -> Optional[int]:
+        t = self._hot.get(term, _MISSING)
+        if t is _MISSING:
+            t = self._search(term.encode("utf-8"))
+            if len(self._hot) >= HOT_TERMS:
+                self._hot = {}
+            self._hot[term] = t
+        return default if t is None else t
+
+    def _search(self, key: bytes) -> Optional[int]:
+        if self._fence is None:
+            term_bytes = self._terms.term_bytes
+            self._fence = [term_bytes(t) for t in self._order[::FENCE]]
+        block = bisect_right(self._fence, key) - 1
+        if block < 0:
+            return None
+        order, ptr, data = self._order, self._terms._ptr, self._terms._terms
+        lo, hi = block * FENCE, min(len(order), (block + 1) * FENCE)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            t = order[mid]
+            probe = data[ptr[t]:ptr[t + 1]].tobytes()
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                return t
+        return None
+
+    def __getitem__(self, term: str) -> int:
+        t = self.get(term)
+        if t is None:
+            raise KeyError(term)
+        return t
+
+    def __contains__(self, term: str) -> bool:
+        return self.get(term) is not None
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._terms)
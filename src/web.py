@@ -1,17 +1,62 @@
-from fastapi import FastAPI
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional, Union
+
+from .ingest import IngestBusyError
+from .jobs import get_default_jobs
+from .store_manager import get_default_manager
+
+
+# /docs lists the indexed documents, so the interactive API docs live at /api-docs.
+app = FastAPI(title="Local Vector Store Server", version="0.1.0", docs_url="/api-docs")
+
+
+def _query_threads() -> int:
+    """$QUERY_THREADS (default 4): queries scored at once."""
+    try:
+        return max(1, int(os.environ.get("QUERY_THREADS", "4")))
+    except ValueError:
+        return 4
+
+
+# Scoring is CPU-bound; a fixed pool keeps it off the event loop and bounds
+# how many queries run at once.
+_query_executor = ThreadPoolExecutor(max_workers=_query_threads(), thread_name_prefix="query")
 
-from .ingest import ingest as run_ingest
-from .vector_store import load_default_store
 
+@app.on_event("shutdown")
+def _stop_ingest() -> None:
+    # A running ingest child is not daemonic; don't leave it behind the server.
+    get_default_jobs().shutdown()
 
-app = FastAPI(title="Local Vector Store Server", version="0.1.0")
 
+class QueryFilter(BaseModel):
+    # Restrict the search to documents under a path prefix, of some source
+    # types (html, md, pdf, other) and/or with these doc table values.
+    path_prefix: Optional[str] = None
+    source: Optional[Union[str, List[str]]] = None
+    metadata: Optional[Dict[str, Any]] = None
 
-class QueryRequest(BaseModel):
+
+class QueryRequest(QueryFilter):
     query: str
     k: int = 5
+    min_score: Optional[float] = None
+    mode: Literal["tfidf", "bm25"] = "tfidf"
+
+
+class BatchQueryRequest(QueryFilter):
+    queries: List[str]
+    k: int = 5
+    min_score: Optional[float] = None
+    mode: Literal["tfidf", "bm25"] = "tfidf"
+
+
+MAX_BATCH = 256
 
 
 class QueryResult(BaseModel):
@@ -22,24 +67,99 @@ class QueryResult(BaseModel):
 
 
 @app.get("/health")
-def health():
-    return {"status": "ok"}
+async def health():
+    return {"status": "ok", "cache": get_default_manager().cache.stats()}
+
+
+@app.get("/stats")
+def stats():
+    manager = get_default_manager()
+    store = manager.get()
+    return {
+        "generation": store.generation,
+        "chunks": len(store) if store.is_ready() else 0,
+        "shards": store.n_shards,
+        "values": store.value_codec,
+        "segments": store.n_segments,
+        "deleted": store.n_deleted,
+        "cache": manager.cache.stats(),
+    }
 
 
-@app.post("/ingest")
-def ingest():
-    run_ingest()
-    return {"status": "ok"}
+@app.get("/docs")
+def docs(prefix: str = "", source: Optional[str] = None, limit: Optional[int] = None) -> Dict:
+    """Indexed documents (path, chunks, source type, size, mtime) from the store's doc table."""
+    store = get_default_manager().get()
+    listing = store.docs().docs() if store.is_ready() else {}
+    items = [
+        dict(doc, path=path) for path, doc in sorted(listing.items())
+        if path.startswith(prefix) and (source is None or doc["source"] == source)
+    ]
+    return {"total": len(items), "docs": items[:limit] if limit is not None else items}
+
+
+@app.post("/ingest", status_code=202)
+async def ingest(full: bool = False, append: bool = False) -> Dict:
+    """Start a background ingest; poll ``/ingest/{id}`` for its progress."""
+    try:
+        job = get_default_jobs().start(full=full, append=append)
+    except IngestBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return job.to_dict()
+
+
+@app.get("/ingest")
+async def ingest_jobs() -> List[Dict]:
+    return [job.to_dict() for job in get_default_jobs().list()]
+
+
+@app.get("/ingest/{job_id}")
+async def ingest_status(job_id: str) -> Dict:
+    job = get_default_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown ingest job")
+    return job.to_dict()
 
 
 @app.post("/query", response_model=List[QueryResult])
-def query(req: QueryRequest):
-    store = load_default_store()
+async def query(req: QueryRequest):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_query_executor, _run_query, req)
+
+
+@app.post("/query/batch", response_model=List[List[QueryResult]])
+async def query_batch(req: BatchQueryRequest):
+    """One result list per query, scored together in a single pass."""
+    if len(req.queries) > MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"at most {MAX_BATCH} queries per batch")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_query_executor, _run_query_batch, req)
+
+
+def _to_results(results) -> List[QueryResult]:
+    return [
+        QueryResult(score=score, path=rec.path, chunk_id=rec.chunk_id, text=rec.text)
+        for score, rec in results
+    ]
+
+
+def _run_query(req: QueryRequest) -> List[QueryResult]:
+    store = get_default_manager().get()
     if not store.is_ready():
         return []
-    results = store.query(req.query, k=req.k)
-    out: List[QueryResult] = []
-    for score, rec in results:
-        out.append(QueryResult(score=score, path=rec.path, chunk_id=rec.chunk_id, text=rec.text))
-    return out
+    return _to_results(store.query(
+        req.query, k=req.k, min_score=req.min_score, mode=req.mode,
+        path_prefix=req.path_prefix, source=req.source, metadata=req.metadata,
+    ))
+
+
+def _run_query_batch(req: BatchQueryRequest) -> List[List[QueryResult]]:
+    store = get_default_manager().get()
+    if not store.is_ready():
+        return [[] for _ in req.queries]
+    batches = store.query_batch(
+        req.queries, k=req.k, min_score=req.min_score, mode=req.mode,
+        path_prefix=req.path_prefix, source=req.source, metadata=req.metadata,
+    )
+    return [_to_results(results) for results in batches]
 
@@ -0,0 +1,120 @@
+"""Shared fixtures: a small synthetic corpus in a temporary working directory.
+
+The store reads ``input/`` and writes ``data/vector_store`` relative to the
+working directory, so every test runs in its own directory. ``rebuild``
+copies the current input into a second one and ingests it in full: the
+reference an incremental build, a segment or a compaction must match.
+"""
+
+import os
+import random
+import shutil
+import sys
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.ingest import ingest  # noqa: E402
+from src.vector_store import VectorStore  # noqa: E402
+
+ROOT = os.path.join("data", "vector_store")
+
+# A Zipf-like vocabulary: a few words in most chunks, a long tail in one or two.
+WORDS = [f"w{i}" for i in range(600)]
+WEIGHTS = [1.0 / (i + 1) for i in range(len(WORDS))]
+
+
+def words(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choices(WORDS, WEIGHTS, k=n))
+
+
+def write_doc(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def write_corpus(seed: int = 0, n_md: int = 24, n_html: int = 12) -> None:
+    rng = random.Random(seed)
+    for i in range(n_md):
+        write_doc(os.path.join("input", "md", f"doc{i}.md"), words(rng, rng.randint(40, 700)))
+    for i in range(n_html):
+        body = words(rng, rng.randint(40, 700))
+        write_doc(os.path.join("input", "html", f"page{i}.html"), f"<html><body><p>{body}</p></body></html>")
+
+
+def build(**kwargs) -> None:
+    ingest(workers=1, **kwargs)
+
+
+def load() -> VectorStore:
+    store = VectorStore(ROOT)
+    store.load()
+    return store
+
+
+def queries(seed: int = 1, n: int = 60) -> List[str]:
+    rng = random.Random(seed)
+    return [words(rng, rng.randint(1, 4)) for _ in range(n)]
+
+
+def top_hits(store: VectorStore, mode: str, k: int = 5) -> List[List[Tuple[float, str, int]]]:
+    return [
+        [(round(score, 5), rec.path, rec.chunk_id) for score, rec in store.query(q, k=k, mode=mode)]
+        for q in queries()
+    ]
+
+
+def vocabulary(store: VectorStore) -> Dict[str, float]:
+    """Term -> IDF of the terms in use (df > 0)."""
+    vec = store.vectorizer
+    return {t: round(vec.idf_[i], 5) for i, t in enumerate(vec.vocabulary_) if vec.df_[i]}
+
+
+def snapshot(store: VectorStore) -> Dict:
+    """What a build must agree on: vocabulary, IDF and the top hits in both modes."""
+    return {
+        "vocabulary": vocabulary(store), "n_docs": store.vectorizer.n_docs_,
+        "tfidf": top_hits(store, "tfidf"), "bm25": top_hits(store, "bm25"),
+    }
+
+
+def scores(store: VectorStore) -> Dict[str, List[float]]:
+    """Top scores only, one flat list per mode, for builds that number their rows
+    differently (ties may reorder); compare with ``pytest.approx``."""
+    return {
+        mode: [score for q in queries() for score, _ in store.query(q, k=5, mode=mode)]
+        for mode in ("tfidf", "bm25")
+    }
+
+
+@pytest.fixture(autouse=True)
+def workspace(tmp_path, monkeypatch):
+    work = tmp_path / "work"
+    work.mkdir()
+    monkeypatch.chdir(work)
+    monkeypatch.setenv("MAX_SEGMENTS", "100")  # no background merges
+    monkeypatch.setenv("SEARCH_WORKERS", "1")
+    write_corpus()
+    return work
+
+
+@pytest.fixture
+def rebuild(tmp_path, monkeypatch):
+    """Full build of the current input (less ``skip``) in a fresh directory; returns ``summary`` of it."""
+    def run(skip: Tuple[str, ...] = (), pruning: Optional[Dict] = None,
+            summary: Callable[[VectorStore], Dict] = snapshot) -> Dict:
+        work = os.getcwd()
+        ref = tmp_path / f"rebuild{len(os.listdir(tmp_path))}"
+        shutil.copytree(os.path.join(work, "input"), ref / "input")
+        for path in skip:
+            os.remove(ref / path)
+        monkeypatch.chdir(ref)
+        try:
+            build(full=True, pruning=pruning)
+            return summary(load())
+        finally:
+            monkeypatch.chdir(work)
+    return run
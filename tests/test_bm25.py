@@ -0,0 +1,59 @@
+import heapq
+import math
+
+import pytest
+
+from conftest import build, load, queries
+from src.bm25 import B, K1
+
+
+def brute_force(store, text, k, rows=None):
+    """Top-k BM25 scores by scoring every live chunk from its term counts."""
+    n = len(store)
+    counts = [store.term_counts(i) for i in range(n)]
+    lengths = [store._table.row_length(i) for i in range(n)]
+    avgdl = sum(lengths) / n
+    df = {}
+    for c in counts:
+        for t in c:
+            df[t] = df.get(t, 0) + 1
+    query = store._query_terms(text)
+    scores = []
+    for i in rows if rows is not None else range(n):
+        if store._is_deleted(i):
+            continue
+        score = 0.0
+        for t, qtf in query.items():
+            f = counts[i].get(t)
+            if f:
+                idf = math.log(1.0 + (n - df[t] + 0.5) / (df[t] + 0.5))
+                score += qtf * idf * f * (K1 + 1.0) / (f + K1 * (1.0 - B + B * lengths[i] / avgdl))
+        if score > 0:
+            scores.append(score)
+    return heapq.nlargest(k, scores)
+
+
+def max_score(store, text, k, **kwargs):
+    return [score for score, _ in store.query(text, k=k, mode="bm25", min_score=1e-9, **kwargs)]
+
+
+@pytest.mark.parametrize("shards", [1, 3])
+def test_max_score_matches_brute_force(shards):
+    build(full=True, shards=shards)
+    store = load()
+    for k in (1, 5, 20):
+        for text in queries(n=40):
+            assert max_score(store, text, k) == pytest.approx(brute_force(store, text, k), rel=1e-5)
+
+
+def test_max_score_skips_deleted_and_filtered_rows():
+    build(full=True, shards=2)
+    store = load()
+    assert store.delete("input/md/doc3.md") > 0
+    md_rows = [row for path in store.docs().docs() if path.startswith("input/md/")
+               for _, row in store.docs().chunks(path)]
+    for text in queries(n=40):
+        assert max_score(store, text, 10) == pytest.approx(brute_force(store, text, 10), rel=1e-5)
+        assert max_score(store, text, 10, path_prefix="input/md/") == pytest.approx(
+            brute_force(store, text, 10, rows=md_rows), rel=1e-5
+        )
@@ -0,0 +1,90 @@
+"""Deletes interleaved with compaction, appends and merges are never lost."""
+
+import os
+
+import pytest
+
+from conftest import ROOT, build, load, scores, vocabulary, write_doc
+import src.ingest
+from src.doc_table import DocCatalog
+from src.generations import current_dir
+from src.ingest import compact, merge_segments
+from src.vector_store import VectorStore
+
+
+def delete_elsewhere(path: str) -> int:
+    """Delete through a catalog of the published generation, as another process would."""
+    return DocCatalog.open(current_dir(ROOT)).delete(path)
+
+
+def live_chunks(path: str) -> int:
+    return len(load().docs().chunks(path))
+
+
+def deleting_during(monkeypatch, target, name, path):
+    """Patch ``target.name`` to delete ``path`` from the published generation first."""
+    original = getattr(target, name)
+
+    def wrapper(*args, **kwargs):
+        assert delete_elsewhere(path) > 0
+        return original(*args, **kwargs)
+    monkeypatch.setattr(target, name, wrapper)
+
+
+def test_compact_keeps_delete_made_after_load():
+    build(full=True)
+    compactor = VectorStore(ROOT)
+    compactor.load()
+    assert delete_elsewhere("input/md/doc1.md") > 0
+    compactor.delete("input/md/doc2.md")
+    compactor.compact()
+    assert live_chunks("input/md/doc1.md") == 0
+    assert live_chunks("input/md/doc2.md") == 0
+
+
+def test_stale_handle_deletes_in_current_generation():
+    build(full=True)
+    stale = load()
+    write_doc(os.path.join("input", "md", "extra.md"), "fresh words here")
+    build(append=True)
+    assert stale.dir != current_dir(ROOT)
+    assert stale.delete("input/md/doc3.md") > 0
+    assert live_chunks("input/md/doc3.md") == 0
+
+
+def test_interleaved_compact_merge_and_delete(monkeypatch, rebuild):
+    build(full=True, shards=2)
+    gone = []
+    for step in range(3):
+        write_doc(os.path.join("input", "md", f"extra{step}.md"), f"extra{step} words " * (step + 20))
+        # Deleted after the append forked the published generation.
+        with monkeypatch.context() as m:
+            deleting_during(m, src.ingest, "_write_segment", f"input/md/doc{step}.md")
+            build(append=True)
+        gone.append(f"input/md/doc{step}.md")
+    assert load().n_segments == 3
+
+    with monkeypatch.context() as m:
+        deleting_during(m, src.ingest, "_write_segment", "input/html/page1.html")
+        assert merge_segments() >= 2
+    gone.append("input/html/page1.html")
+    for path in gone:
+        assert live_chunks(path) == 0, path
+
+    assert delete_elsewhere("input/md/extra1.md") > 0
+    gone.append("input/md/extra1.md")
+    with monkeypatch.context() as m:
+        deleting_during(m, VectorStore, "_write_rows", "input/html/page2.html")
+        compact()
+    gone.append("input/html/page2.html")
+    store = load()
+    for path in gone:
+        assert live_chunks(path) == 0, path
+    assert store.n_deleted > 0  # page2.html, deleted during the compaction
+
+    compact()
+    store = load()
+    expected = rebuild(skip=tuple(gone), summary=lambda s: dict(scores(s), vocabulary=vocabulary(s)))
+    assert vocabulary(store) == expected["vocabulary"]
+    for mode in ("tfidf", "bm25"):
+        assert scores(store)[mode] == pytest.approx(expected[mode], rel=1e-5), mode
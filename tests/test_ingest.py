@@ -0,0 +1,53 @@
+import os
+import random
+
+import pytest
+
+from conftest import build, load, snapshot, words, write_doc
+from src.ingest import compact
+
+PRUNING = [None, {"min_df": 2}, {"min_df": 2, "max_df": 0.5, "max_features": 300}]
+
+
+def change_corpus(step: int) -> None:
+    """One round of edits: a modified file, a new one sharing a rare term, a removed one."""
+    rng = random.Random(100 + step)
+    with open(os.path.join("input", "md", f"doc{step}.md"), "a", encoding="utf-8") as f:
+        f.write(" " + words(rng, 80))
+    write_doc(os.path.join("input", "md", f"new{step}.md"), "uniqueterm " + words(rng, 120))
+    os.remove(os.path.join("input", "html", f"page{step}.html"))
+
+
+@pytest.mark.parametrize("pruning", PRUNING)
+def test_incremental_ingest_matches_full_rebuild(rebuild, pruning):
+    build(full=True, pruning=pruning)
+    for step in (1, 2):
+        change_corpus(step)
+        build()
+        assert snapshot(load()) == rebuild(pruning=pruning)
+
+
+def test_rare_term_enters_pruned_vocabulary():
+    build(full=True, pruning={"min_df": 2})
+    change_corpus(1)
+    build()
+    assert "uniqueterm" not in load().vectorizer.vocab_index
+    change_corpus(2)
+    build(append=True)
+    assert "uniqueterm" in load().vectorizer.vocab_index
+
+
+def test_unchanged_ingest_publishes_nothing():
+    build(full=True, pruning={"min_df": 2})
+    before = load().dir
+    build()
+    assert load().dir == before
+
+
+def test_delete_and_compact_match_rebuild(rebuild):
+    build(full=True, shards=2)
+    store = load()
+    for path in ("input/md/doc4.md", "input/html/page5.html"):
+        assert store.delete(path) > 0
+    compact()
+    assert snapshot(load()) == rebuild(skip=("input/md/doc4.md", "input/html/page5.html"))
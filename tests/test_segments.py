@@ -0,0 +1,48 @@
+import os
+import random
+
+import pytest
+
+from conftest import build, load, scores, words, write_doc
+from src.ingest import merge_segments
+
+
+def append_round(step: int) -> None:
+    rng = random.Random(200 + step)
+    with open(os.path.join("input", "md", f"doc{step}.md"), "a", encoding="utf-8") as f:
+        f.write(" " + words(rng, 60))
+    for i in range(3):
+        write_doc(os.path.join("input", "md", f"seg{step}-{i}.md"), words(rng, rng.randint(50, 500)))
+    build(append=True)
+
+
+@pytest.mark.parametrize("shards", [1, 2])
+def test_segmented_scores_match_rebuild(rebuild, shards):
+    build(full=True, shards=shards)
+    for step in range(3):
+        append_round(step)
+    store = load()
+    assert store.n_segments == 3
+    expected = rebuild(summary=scores)
+    for mode in ("tfidf", "bm25"):
+        assert scores(store)[mode] == pytest.approx(expected[mode], rel=1e-5), mode
+
+    assert merge_segments() == 3
+    merged = load()
+    assert merged.n_segments == 1
+    for mode in ("tfidf", "bm25"):
+        assert scores(merged)[mode] == pytest.approx(expected[mode], rel=1e-5), mode
+
+
+def test_stale_part_scores_are_recomputed(rebuild):
+    build(full=True)
+    append_round(0)
+    append_round(1)
+    store = load()
+    for part in store._parts():
+        os.remove(part.norms_path)
+    stale = load()
+    assert stale._stale_scores
+    expected = rebuild(summary=scores)
+    for mode in ("tfidf", "bm25"):
+        assert scores(stale)[mode] == pytest.approx(expected[mode], rel=1e-5), mode
@@ -0,0 +1,78 @@
+import random
+
+from src.chunking import chunk_text
+from src.tfidf import TfidfVectorizer, split_words
+
+
+def baseline_tokenize(text):
+    """The original character loop the regex tokenizer replaced."""
+    tokens = []
+    token = []
+    for ch in text:
+        if ch.isalnum():
+            token.append(ch.lower())
+        else:
+            if token:
+                t = "".join(token)
+                if len(t) > 1:
+                    tokens.append(t)
+                token = []
+    if token:
+        t = "".join(token)
+        if len(t) > 1:
+            tokens.append(t)
+    return tokens
+
+
+SAMPLES = [
+    "",
+    "a",
+    "Hello, World! x y zz",
+    "snake_case and kebab-case, 3.14 and 1e-9",
+    "ΟΔΥΣΣΕΥΣ Σ σς ΣΑΣ",  # final sigma: lowered character by character
+    "Straße İstanbul ǅemal ﬁne",
+    "naïve café résumé — “quoted” ‘text’",
+    "二十 世纪 ٣٤ ½ ² Ⅻ ⑦",
+    "tab\tnew\nline\r\nend",
+]
+
+
+def test_samples_match_baseline():
+    for text in SAMPLES:
+        assert TfidfVectorizer._tokenize(text) == baseline_tokenize(text), text
+
+
+def test_random_text_matches_baseline():
+    rng = random.Random(7)
+    # Mostly letters and digits from several scripts, with punctuation, marks and underscores.
+    alphabet = (
+        [chr(c) for c in range(0x20, 0x250)] + [chr(c) for c in range(0x370, 0x400)]
+        + [chr(c) for c in range(0x2000, 0x2200)] + [chr(c) for c in range(0x4E00, 0x4E40)]
+        + ["_", "\u0301", "\u200d"]
+    )
+    for _ in range(2000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        assert TfidfVectorizer._tokenize(text) == baseline_tokenize(text), repr(text)
+
+
+def baseline_words(text):
+    """Word iterator of the original chunker (single characters included)."""
+    words, word = [], []
+    for ch in text:
+        if ch.isalnum():
+            word.append(ch.lower())
+        elif word:
+            words.append("".join(word))
+            word = []
+    if word:
+        words.append("".join(word))
+    return words
+
+
+def test_chunker_words_match_baseline():
+    text = " ".join(SAMPLES) * 40
+    assert split_words(text) == baseline_words(text)
+    chunks = chunk_text(text, max_words=30, overlap=5)
+    words = baseline_words(text)
+    assert chunks[0] == " ".join(words[:30])
+    assert chunks[1] == " ".join(words[25:55])